@@ -0,0 +1,329 @@
+"""
+NSE Stock Price API - async (ASGI) serving mode
+Serves the same /api/stocks, /api/stocks/<symbol>, /api/health and
+/api/refresh contract as nse_stock_api.py (plus /api/stocks/changes,
+/api/stocks/bulk, /api/stream, /metrics and the /api/mtm mark-to-market views) from
+an ASGI server. The refresher runs as an asyncio task and handlers only
+read the published cache snapshot, so no request blocks.
+
+Single process:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+Several workers sharing one refresher through the quote table, as under
+Gunicorn (see DEPLOYMENT_INSTRUCTIONS.md):
+    NSE_QUOTE_TABLE=/dev/shm/nse_quotes.tbl uvicorn asgi_app:app --workers 4 --port 5000
+"""
+
+from urllib.parse import parse_qs
+import asyncio
+import json
+import logging
+import os
+import time
+
+import metrics
+import nse_stock_api as api
+from quote_stream import format_sse
+from refresh_scheduler import AsyncRefreshScheduler
+
+logger = logging.getLogger(__name__)
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+]
+
+# Route labels for request metrics, named as the Flask rules are
+ROUTES = {"/api/stocks", "/api/stocks/changes", "/api/stocks/bulk", "/api/stream", "/api/mtm",
+          "/api/mtm/stream", "/api/health", "/api/refresh", "/metrics"}
+
+scheduler = AsyncRefreshScheduler(
+    api.update_stock_cache,
+    open_interval=api.REFRESH_INTERVAL_OPEN,
+    closed_interval=api.REFRESH_INTERVAL_CLOSED,
+)
+
+
+class LoopScheduler:
+    """The async scheduler as the quote table worker drives it, from any thread"""
+
+    def __init__(self, loop):
+        self.loop = loop
+
+    def start(self):
+        self.loop.call_soon_threadsafe(scheduler.start)
+
+    def trigger(self):
+        self.loop.call_soon_threadsafe(scheduler.trigger)
+
+
+def start_worker():
+    """Refresh in this process, or share the quote table with the other workers (NSE_QUOTE_TABLE)"""
+    if os.environ.get('NSE_SNAPSHOT_PATH'):
+        logger.warning("NSE_SNAPSHOT_PATH is no longer used; set NSE_QUOTE_TABLE to share quotes between workers")
+    api.shared_worker = api.shared_quote_worker(LoopScheduler(asyncio.get_running_loop()))
+    if api.shared_worker is not None:
+        api.shared_worker.start()
+    else:
+        api.enable_persistence()
+        scheduler.start()
+
+
+async def stop_worker():
+    await scheduler.stop()
+    if api.shared_worker is not None:
+        api.shared_worker.release()
+
+
+def role():
+    return api.shared_worker.role if api.shared_worker is not None else "standalone"
+
+
+# ---------------------------------------------------------------------------
+# Response helpers
+
+async def send_response(send, status, body=b"", headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": CORS_HEADERS + [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, payload, status=200, headers=()):
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    await send_response(send, status, body, [("Content-Type", "application/json"), *headers])
+
+
+async def read_body(receive, limit=1 << 20):
+    """Request body bytes (None if larger than ``limit``)"""
+    chunks, size, more = [], 0, True
+    while more:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+        more = message.get("more_body", False)
+    return b"".join(chunks)
+
+
+async def send_prebuilt(send, request_headers, body):
+    """Async twin of nse_stock_api.send_prebuilt"""
+    coding, payload, etag = body.select(request_headers.get("accept-encoding"))
+    headers = body.headers(coding, etag)
+    if body.not_modified(request_headers.get("if-none-match"), request_headers.get("if-modified-since")):
+        headers.pop("Content-Type")
+        headers.pop("Content-Encoding", None)
+        await send_response(send, 304, headers=headers.items())
+    else:
+        await send_response(send, 200, payload, headers.items())
+
+
+async def stocks_bulk(receive, send, method, query, headers):
+    """Async twin of nse_stock_api.get_stocks_bulk; fetching and encoding run in the executor"""
+    if method == "POST":
+        try:
+            body = json.loads(await read_body(receive) or b"null")
+        except ValueError:
+            body = None
+        if not isinstance(body, dict) or not isinstance(body.get("symbols"), list):
+            await send_json(send, {"status": "error", "message": "Expected a JSON body with a 'symbols' list"}, 400)
+            return
+        symbols, fields = [str(s) for s in body["symbols"]], body.get("fields")
+        if isinstance(fields, str):
+            fields = [f for f in fields.split(",") if f]
+    else:
+        symbols = query.get("symbols", [""])[0].split(",")
+        fields = [f for f in query.get("fields", [""])[0].split(",") if f]
+    status, response_headers, payload = await asyncio.get_running_loop().run_in_executor(
+        None, api.bulk_quotes, symbols, fields if isinstance(fields, list) else None,
+        headers.get("accept"), query.get("format", [None])[0], headers.get("if-none-match"))
+    await send_response(send, status, payload, response_headers.items())
+
+
+async def stream_quotes(receive, send, query):
+    """Async twin of nse_stock_api.stream_quotes: one coroutine per client, no thread"""
+    symbols = [api.normalize_symbol(s) for s in query.get("symbols", [""])[0].split(",") if s.strip()]
+
+    async def initial():
+        snapshot = api.quote_cache.snapshot()
+        data = snapshot.data
+        return ({s: data.get(s) for s in symbols} if symbols else dict(data)), snapshot.generation
+
+    await event_stream(receive, send, api.quote_broker, symbols, initial, "snapshot", "quotes")
+
+
+async def stream_mtm(receive, send):
+    """Async twin of nse_stock_api.stream_mtm"""
+    async def initial():
+        # The first call loads every open trade from SQLite: keep it off the event loop
+        payload = await asyncio.get_running_loop().run_in_executor(None, api.mtm_payload)
+        return payload, payload["generation"]
+
+    await event_stream(receive, send, api.mtm_broker, None, initial, "mtm", "mtm_update")
+
+
+async def event_stream(receive, send, broker, keys, initial, initial_event, update_event):
+    """SSE: ``await initial()`` -> (data, id) first, then the broker's deltas for ``keys``"""
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    subscriber = broker.subscribe(keys or None, notify=lambda: loop.call_soon_threadsafe(wake.set))
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        disconnected.set()
+        wake.set()
+
+    watcher = loop.create_task(watch_disconnect())
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": CORS_HEADERS + [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+        data, event_id = await initial()
+        message = format_sse(data, event=initial_event, event_id=event_id)
+
+        while not disconnected.is_set():
+            await send({"type": "http.response.body", "body": message.encode("utf-8"), "more_body": True})
+            try:
+                await asyncio.wait_for(wake.wait(), api.STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+            updates, generation = subscriber.drain()
+            message = format_sse(updates, event=update_event, event_id=generation) if updates \
+                else ": keepalive\n\n"
+    finally:
+        watcher.cancel()
+        broker.unsubscribe(subscriber)
+
+
+# ---------------------------------------------------------------------------
+# ASGI entry point
+
+def route_label(path):
+    if path in ROUTES:
+        return path
+    return "/api/stocks/<symbol>" if path.startswith("/api/stocks/") else "unmatched"
+
+
+def instrumented(send, route, method, conditional):
+    """``send`` that records latency to the response head and the body size once it is complete"""
+    started = time.perf_counter()
+    size = 0
+
+    async def send_and_record(message):
+        nonlocal size
+        if message["type"] == "http.response.start":
+            api.observe_request(route, method, message["status"], time.perf_counter() - started, conditional)
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+            if not message.get("more_body", False):
+                api.observe_response_size(route, size)
+        await send(message)
+    return send_and_record
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            start_worker()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await stop_worker()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    method = scope["method"]
+    path = scope["path"].rstrip("/")
+    query = parse_qs(scope["query_string"].decode("latin-1"))
+    headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+    if method != "OPTIONS":
+        send = instrumented(send, route_label(path), method,
+                            "if-none-match" in headers or "if-modified-since" in headers)
+
+    if method == "OPTIONS":
+        await send_response(send, 204, headers=[
+            ("Access-Control-Allow-Methods", "GET, POST, OPTIONS"),
+            ("Access-Control-Allow-Headers", headers.get("access-control-request-headers", "*")),
+        ])
+    elif path == "/api/stocks" and method == "GET":
+        snapshot = api.quote_cache.snapshot()
+        await send_prebuilt(send, headers, snapshot.encoded or api.encode_stocks_snapshot(snapshot))
+    elif path == "/api/stocks/changes" and method == "GET":
+        try:
+            since = int(query.get("since", ["-1"])[0])
+        except ValueError:
+            since = -1
+        await send_prebuilt(send, headers, api.encode_changes(api.quote_cache.snapshot(), since))
+    elif path == "/api/stocks/bulk" and method in ("GET", "POST"):
+        await stocks_bulk(receive, send, method, query, headers)
+    elif path.startswith("/api/stocks/") and method == "GET":
+        symbol = path[len("/api/stocks/"):]
+        if api.stock_cached(symbol):
+            payload, status = api.stock_payload(symbol)
+        else:
+            # cold or unknown symbols are fetched upstream; keep that off the event loop
+            payload, status = await asyncio.get_running_loop().run_in_executor(None, api.stock_payload, symbol)
+        await send_json(send, payload, status)
+    elif path == "/api/stream" and method == "GET":
+        await stream_quotes(receive, send, query)
+    elif path == "/api/mtm" and method == "GET":
+        account = query.get("account", [""])[0] or None
+        payload = await asyncio.get_running_loop().run_in_executor(None, api.mtm_payload, account)
+        await send_json(send, {"status": "success", **payload})
+    elif path == "/api/mtm/stream" and method == "GET":
+        await stream_mtm(receive, send)
+    elif path == "/metrics" and method == "GET":
+        await send_response(send, 200, metrics.REGISTRY.render().encode("utf-8"),
+                            [("Content-Type", metrics.CONTENT_TYPE)])
+    elif path == "/api/health" and method == "GET":
+        payload = api.health_payload(scheduler.status())
+        payload["mode"] = "asgi"
+        payload["role"] = role()
+        await send_json(send, payload)
+    elif path == "/api/refresh" and method == "POST":
+        if role() == "reader":
+            api.shared_worker.request_refresh()
+            await send_json(send, {
+                "status": "success",
+                "message": "Refresh requested from the quote table writer",
+                "completed": False
+            })
+            return
+        backoff = api.refresh_backoff(scheduler)
+        if backoff is not None:
+            body, retry_after = backoff
+            await send_json(send, body, 503, [("Retry-After", str(retry_after))])
+            return
+        done, joined = scheduler.trigger()
+        if query.get("wait", [""])[0].lower() in ("1", "true", "yes"):
+            try:
+                await asyncio.wait_for(done.wait(), api.FETCH_TIMEOUT * 3)
+            except asyncio.TimeoutError:
+                pass
+        await send_json(send, {
+            "status": "success",
+            "message": "Joined refresh in progress" if joined else "Stock cache refresh initiated",
+            "completed": done.is_set()
+        })
+    else:
+        await send_json(send, {"status": "error", "message": "Not found"}, 404)
@@ -0,0 +1,534 @@
+"""
+Strategy backtester for Trading Journal Pro
+Replays daily bars from the history store through rule-based strategies and
+emits the resulting trades in the journal's trade schema, so the journal
+analytics score a backtest exactly as they score real trades.
+
+A strategy is declarative, using the indicator scanner's rule syntax:
+
+    {"name": "Breakout 20", "side": "Buy",
+     "entry": ["close > high_20", "volume_surge_20 > 1.5"],
+     "exit": ["close < sma_20"],
+     "stop": {"atr": 2, "period": 14},       (or {"pct": 5})
+     "target": {"r": 2},                      (multiple of the stop distance, or {"pct": 10})
+     "max_hold": 20,                          (bars; exit at that bar's close)
+     "capital_per_trade": 100000}             (or "quantity": 50, or "risk_per_trade": 2000)
+
+Signals are read at a bar's close and filled at the next bar's open. Stops
+and targets fill intrabar at their level, or at the open when the bar gaps
+through; when one bar touches both, the stop is assumed to fill first.
+
+Two engines give the same trades where both apply:
+- ``run_events`` steps through the bars in date order, every symbol at once,
+  and handles stops, targets and time exits;
+- ``run_vectorized`` derives entry/exit pairs straight from the signal
+  matrices for strategies with no stop, target or max_hold.
+``BacktestPool`` / ``run_parallel`` spread many strategies (e.g. a parameter
+sweep) over a process pool whose workers memory-map one shared copy of the
+aligned bars.
+
+Backtest from the command line:
+    python backtester.py strategy.json [SYMBOLS...]
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from history_store import DATE, day_strings
+from indicator_scanner import BAR_COLUMNS, C, H, L, O, OPERATORS, indicator_series, parse_rule, shifted
+from journal_analytics import TradeFrame, compute_metrics, monthly_pl
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ACCOUNT = "Backtest"
+DEFAULT_CAPITAL_PER_TRADE = 100000  # a tenth of journal_analytics.INITIAL_CAPITAL
+DEFAULT_ATR_PERIOD = 14
+
+# Indicator series / signal matrices kept per BarMatrix (each symbols x dates)
+MAX_CACHED_SERIES = 64
+
+SIDES = {"Buy": 1.0, "Sell": -1.0}
+
+
+def normalize_strategy(spec):
+    """Validate a strategy dict and fill in defaults; raises ValueError"""
+    if not isinstance(spec, dict):
+        raise ValueError("Strategy must be an object")
+    strategy = dict(spec)
+    strategy["name"] = str(strategy.get("name") or "Backtest Strategy")
+    strategy["account"] = str(strategy.get("account") or DEFAULT_ACCOUNT)
+    side = str(strategy.get("side") or "Buy").capitalize()
+    side = {"Long": "Buy", "Short": "Sell"}.get(side, side)
+    if side not in SIDES:
+        raise ValueError(f"Unknown side: {strategy.get('side')}")
+    strategy["side"] = side
+    for key in ("entry", "exit"):
+        rules = strategy.get(key) or []
+        if isinstance(rules, str):
+            rules = [rule for rule in rules.split(";") if rule.strip()]
+        if not isinstance(rules, list):
+            raise ValueError(f"{key} must be a list of rules or a ';'-separated string")
+        strategy[key] = [parse_rule(rule) for rule in rules]
+    if not strategy["entry"]:
+        raise ValueError("Strategy needs at least one entry rule")
+    for key, kinds in (("stop", ("atr", "pct")), ("target", ("r", "pct"))):
+        level = strategy.get(key)
+        if level is not None and (not isinstance(level, dict) or not any(k in level for k in kinds)):
+            raise ValueError(f"{key} must be one of: " + ", ".join(f'{{"{k}": ...}}' for k in kinds))
+    if strategy.get("target") and "r" in strategy["target"] and not strategy.get("stop"):
+        raise ValueError("An R-multiple target needs a stop")
+    if strategy.get("max_hold") is not None:
+        strategy["max_hold"] = int(strategy["max_hold"])
+    return strategy
+
+
+class BarMatrix:
+    """Daily bars of many symbols on one date axis: (5, symbols, dates), NaN where a symbol has no bar
+
+    Indicator series and rule signals are cached (least recently used
+    first out), so a sweep reuses them across parameter sets.
+    """
+
+    def __init__(self, symbols, dates, bars, max_cached=MAX_CACHED_SERIES):
+        self.symbols = list(symbols)
+        self.dates = dates
+        self.bars = bars
+        self.max_cached = max_cached
+        self._cache = OrderedDict()  # indicator name / rules tuple -> matrix
+
+    @classmethod
+    def from_store(cls, store, symbols=None, start=None, end=None):
+        symbols = [s for s in dict.fromkeys(symbols if symbols is not None else store.symbols())]
+        stored = []
+        for symbol in symbols:
+            bars = store.range(symbol, start, end)
+            if bars is not None and bars.shape[1]:
+                stored.append((symbol, bars))
+        dates = np.unique(np.concatenate([bars[DATE] for _, bars in stored])) if stored else np.empty(0)
+        matrix = np.full((len(BAR_COLUMNS), len(stored), len(dates)), np.nan)
+        for row, (_, bars) in enumerate(stored):
+            matrix[:, row, np.searchsorted(dates, bars[DATE])] = bars[list(BAR_COLUMNS)]
+        return cls([symbol for symbol, _ in stored], dates, matrix)
+
+    def _cached(self, key, build):
+        cached = self._cache.get(key)
+        if cached is None:
+            cached = self._cache[key] = build()
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        return cached
+
+    def series(self, name):
+        """Indicator history (symbols x dates)"""
+        return self._cached(name, lambda: indicator_series(name, self.bars))
+
+    def signal(self, rules):
+        """Bars (symbols x dates) where every rule holds at the close"""
+        return self._cached(tuple(rules), lambda: self._signal(rules))
+
+    def _signal(self, rules):
+        result = np.ones(self.bars.shape[1:], dtype=bool)
+        with np.errstate(invalid="ignore"):
+            for left, op, right in rules:
+                now_left, now_right = self._operand(left), self._operand(right)
+                if op in OPERATORS:
+                    result &= OPERATORS[op](now_left, now_right)
+                    continue
+                before_left, before_right = self._shifted(left), self._shifted(right)
+                if op == "crosses_above":
+                    result &= (now_left > now_right) & (before_left <= before_right)
+                else:
+                    result &= (now_left < now_right) & (before_left >= before_right)
+        return result
+
+    def _operand(self, operand):
+        return operand if isinstance(operand, float) else self.series(operand)
+
+    def _shifted(self, operand):
+        return operand if isinstance(operand, float) else shifted(self.series(operand))
+
+
+def _stop_distance(matrix, strategy):
+    """Stop distance per signal bar for ATR stops (None for percent or no stop)"""
+    stop = strategy.get("stop")
+    if not stop or "atr" not in stop:
+        return None
+    period = int(stop.get("period", DEFAULT_ATR_PERIOD))
+    return matrix.series(f"atr_{period}") * float(stop["atr"])
+
+
+def _levels(strategy, direction, price, distance):
+    """Stop and target prices for fills at ``price``"""
+    stop_spec, target_spec = strategy.get("stop"), strategy.get("target")
+    stop = np.full(len(price), np.nan)
+    if stop_spec:
+        if "pct" in stop_spec:
+            distance = price * float(stop_spec["pct"]) / 100
+        stop = price - direction * distance
+    target = np.full(len(price), np.nan)
+    if target_spec:
+        if "pct" in target_spec:
+            target = price * (1 + direction * float(target_spec["pct"]) / 100)
+        else:
+            target = price + direction * float(target_spec["r"]) * np.abs(price - stop)
+    return stop, target
+
+
+def _quantity(strategy, price, stop):
+    if strategy.get("quantity"):
+        quantity = np.full(len(price), float(strategy["quantity"]))
+    elif strategy.get("risk_per_trade") and strategy.get("stop"):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            quantity = float(strategy["risk_per_trade"]) / np.abs(price - stop)
+    else:
+        quantity = float(strategy.get("capital_per_trade", DEFAULT_CAPITAL_PER_TRADE)) / price
+    # like parseQuantity: whole units, at least one
+    return np.maximum(np.floor(np.nan_to_num(quantity, nan=1.0, posinf=1.0)), 1.0)
+
+
+class TradeLog:
+    """Trades as they close, collected in column chunks"""
+
+    FIELDS = ("row", "entry", "entry_price", "exit", "exit_price", "stop", "target", "quantity", "reason")
+
+    def __init__(self):
+        self._chunks = {field: [] for field in self.FIELDS}
+
+    def add(self, **columns):
+        size = len(columns["row"])
+        if not size:
+            return
+        for field in self.FIELDS:
+            value = columns[field]
+            self._chunks[field].append(np.broadcast_to(value, size) if np.ndim(value) == 0 else value)
+
+    def columns(self):
+        return {field: (np.concatenate(chunks) if chunks else np.empty(0))
+                for field, chunks in self._chunks.items()}
+
+
+def run_events(matrix, strategy, window=None):
+    """Event-driven replay: one step per date, every symbol's orders and fills handled as vectors
+
+    Only bars in ``window`` = (first, stop) are traded; positions still open
+    at its end are reported open.
+    """
+    direction = SIDES[strategy["side"]]
+    entry_signal, exit_signal = matrix.signal(strategy["entry"]), \
+        (matrix.signal(strategy["exit"]) if strategy["exit"] else None)
+    distance = _stop_distance(matrix, strategy)
+    max_hold = strategy.get("max_hold")
+    symbols, dates = matrix.bars.shape[1:]
+    log = TradeLog()
+
+    in_position = np.zeros(symbols, dtype=bool)
+    pending_entry = np.zeros(symbols, dtype=bool)
+    pending_exit = np.zeros(symbols, dtype=bool)
+    signal_distance = np.full(symbols, np.nan)
+    entry_bar = np.zeros(symbols, dtype="int64")
+    entry_price, stop, target, quantity = (np.full(symbols, np.nan) for _ in range(4))
+    held = np.zeros(symbols, dtype="int64")
+
+    def close_out(mask, price, reason):
+        if not mask.any():
+            return
+        rows = np.flatnonzero(mask)
+        log.add(row=rows, entry=entry_bar[rows], entry_price=entry_price[rows], exit=np.full(len(rows), t),
+                exit_price=price[rows], stop=stop[rows], target=target[rows], quantity=quantity[rows], reason=reason)
+        in_position[rows] = False
+        pending_exit[rows] = False
+
+    first, stop_bar = window or (0, dates)
+    with np.errstate(invalid="ignore"):
+        for t in range(first, stop_bar):
+            bar_open, high, low, close = (matrix.bars[i, :, t] for i in (O, H, L, C))
+            valid = ~np.isnan(close)
+
+            # Orders from the last close fill at this open
+            close_out(pending_exit & in_position & valid, bar_open, "signal")
+            fill = pending_entry & ~in_position & valid
+            if fill.any():
+                rows = np.flatnonzero(fill)
+                price = bar_open[rows]
+                stop[rows], target[rows] = _levels(strategy, direction, price, signal_distance[rows])
+                quantity[rows] = _quantity(strategy, price, stop[rows])
+                entry_price[rows], entry_bar[rows], held[rows] = price, t, 0
+                in_position[rows] = True
+                pending_entry[rows] = False
+
+            # Intrabar stops, then targets; a gap through the level fills at the open
+            active = in_position & valid
+            adverse, favorable = (low, high) if direction > 0 else (high, low)
+            stopped = active & (direction * (adverse - stop) <= 0)
+            close_out(stopped, np.where(direction * (bar_open - stop) <= 0, bar_open, stop), "stop")
+            hit = active & ~stopped & (direction * (favorable - target) >= 0)
+            close_out(hit, np.where(direction * (bar_open - target) >= 0, bar_open, target), "target")
+
+            held += in_position & valid
+            if max_hold:
+                close_out(in_position & valid & (held >= max_hold), close, "time")
+
+            # Signals at this close become orders for the next open
+            exiting = exit_signal[:, t] if exit_signal is not None else np.zeros(symbols, dtype=bool)
+            pending_exit |= in_position & exiting
+            entering = ~in_position & entry_signal[:, t] & ~exiting
+            if distance is not None:
+                entering &= ~np.isnan(distance[:, t])  # no entry before the stop can be placed
+                signal_distance = np.where(entering, distance[:, t], signal_distance)
+            pending_entry = (pending_entry & ~valid) | entering
+
+    open_rows = np.flatnonzero(in_position)
+    log.add(row=open_rows, entry=entry_bar[open_rows], entry_price=entry_price[open_rows],
+            exit=np.full(len(open_rows), -1), exit_price=np.full(len(open_rows), np.nan), stop=stop[open_rows],
+            target=target[open_rows], quantity=quantity[open_rows], reason="open")
+    return log.columns()
+
+
+def run_vectorized(matrix, strategy, window=None):
+    """Fast path for signal-only strategies: trades straight from the signal matrices, no bar loop
+
+    After each close the position is whatever the latest signal says
+    (entry -> long/short, exit -> flat), so positions are a forward fill of
+    the signal events and trades are its runs, filled at the next valid open.
+    ``window`` as for run_events.
+    """
+    if strategy.get("stop") or strategy.get("target") or strategy.get("max_hold"):
+        raise ValueError("The vectorized engine only runs strategies without stop, target or max_hold")
+    direction = SIDES[strategy["side"]]
+    first, stop_bar = window or (0, matrix.bars.shape[2])
+    entries = matrix.signal(strategy["entry"])[:, first:stop_bar]
+    exits = matrix.signal(strategy["exit"])[:, first:stop_bar] if strategy["exit"] else np.zeros_like(entries)
+    bars = matrix.bars[:, :, first:stop_bar]
+    symbols, dates = entries.shape
+
+    # Latest event per bar: 1 = entry, 0 = exit, carried forward; flat before the first
+    event = np.where(exits, 0, np.where(entries, 1, -1))
+    last = np.where(event >= 0, np.arange(dates), -1)
+    np.maximum.accumulate(last, axis=1, out=last)
+    state = np.where(last >= 0, np.take_along_axis(event, np.maximum(last, 0), axis=1), 0)
+    change = np.diff(state, axis=1, prepend=0)
+
+    # Orders at close t fill at the first valid open after t
+    valid = ~np.isnan(bars[C])
+    next_valid = np.where(valid, np.arange(dates), dates)
+    next_valid = np.minimum.accumulate(next_valid[:, ::-1], axis=1)[:, ::-1]
+    next_valid = np.concatenate([next_valid[:, 1:], np.full((symbols, 1), dates)], axis=1)
+
+    rows, signalled = np.nonzero(change)
+    kinds = change[rows, signalled]
+    fills = next_valid[rows, signalled]
+    starts = np.flatnonzero(kinds == 1)
+    starts = starts[fills[starts] < dates]   # an entry signalled on the last bar never fills
+    paired = (starts + 1 < len(rows))
+    paired[paired] = rows[starts[paired] + 1] == rows[starts[paired]]
+    exit_fill = np.full(len(starts), -1)
+    exit_fill[paired] = fills[starts[paired] + 1]
+    exit_fill[exit_fill >= dates] = -1       # exit signalled on the last bar: still open
+
+    trade_rows, entry_bar = rows[starts], fills[starts]
+    entry_price = bars[O, trade_rows, entry_bar]
+    closed = exit_fill >= 0
+    exit_price = np.where(closed, bars[O, trade_rows, np.maximum(exit_fill, 0)], np.nan)
+    nothing = np.full(len(starts), np.nan)
+    return {
+        "row": trade_rows,
+        "entry": entry_bar + first,
+        "entry_price": entry_price,
+        "exit": np.where(closed, exit_fill + first, -1),
+        "exit_price": exit_price,
+        "stop": nothing,
+        "target": nothing,
+        "quantity": _quantity(strategy, entry_price, nothing),
+        "reason": np.where(closed, "signal", "open"),
+    }
+
+
+def trade_columns(matrix, strategy, columns):
+    """Engine output -> journal fields as columns, ordered by entry date (app.js names)"""
+    order = np.lexsort((columns["row"], columns["entry"]))
+    columns = {field: values[order] for field, values in columns.items()}
+    size = len(order)
+    closed = columns["exit"] >= 0
+    if size:
+        entry_dates = day_strings(matrix.dates[columns["entry"]])
+        exit_dates = np.where(closed, day_strings(matrix.dates[np.where(closed, columns["exit"], 0)]), None)
+    else:
+        entry_dates, exit_dates = [], np.empty(0, dtype=object)
+    names = np.array([symbol.replace(".NS", "") for symbol in matrix.symbols], dtype=object)
+    exit_price = np.round(columns["exit_price"], 2)
+    return {
+        "id": np.arange(1, size + 1),
+        "symbol": names[columns["row"].astype("int64")],
+        "orderType": [strategy["side"]] * size,
+        "entryDate": entry_dates,
+        "entryPrice": np.round(columns["entry_price"], 2),
+        "quantity": columns["quantity"],
+        "stopLoss": np.round(columns["stop"], 2),
+        "target": np.round(columns["target"], 2),
+        "strategy": [strategy["name"]] * size,
+        "account": [strategy["account"]] * size,
+        "exitDate": exit_dates.tolist(),
+        "exitPrice": np.where(closed, exit_price, np.nan),
+        "status": np.where(closed, "Closed", "Open"),
+        "exitReason": columns["reason"],
+    }
+
+
+def journal_trades(columns):
+    """trade_columns() -> journal trade dicts, plus calculatePL and calcDerived's planned reward:risk"""
+    closed = np.array([d is not None for d in columns["exitDate"]], dtype=bool)
+    direction = SIDES[columns["orderType"][0]] if len(closed) else 1.0
+    entry_price, stop, target = columns["entryPrice"], columns["stopLoss"], columns["target"]
+    pl = np.where(closed, (columns["exitPrice"] - entry_price) * columns["quantity"] * direction, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        risk_reward = np.nan_to_num(np.round(np.abs(target - entry_price) / np.abs(entry_price - stop), 2))
+    optional = lambda value: None if np.isnan(value) else float(value)
+    trades = []
+    for i in range(len(closed)):
+        trades.append({
+            "id": int(columns["id"][i]),
+            "symbol": columns["symbol"][i],
+            "orderType": columns["orderType"][i],
+            "entryDate": columns["entryDate"][i],
+            "entryPrice": float(entry_price[i]),
+            "quantity": int(columns["quantity"][i]),
+            "stopLoss": optional(stop[i]),
+            "target": optional(target[i]),
+            "strategy": columns["strategy"][i],
+            "account": columns["account"][i],
+            "exitDate": columns["exitDate"][i],
+            "exitPrice": optional(columns["exitPrice"][i]),
+            "status": str(columns["status"][i]),
+            "pl": round(float(pl[i]), 2),
+            "riskReward": float(risk_reward[i]),
+            "exitReason": str(columns["exitReason"][i]),
+        })
+    return trades
+
+
+def backtest(matrix, strategy, engine="auto", include_trades=True, window=None):
+    """Run one strategy over a BarMatrix: ``{engine, metrics, monthly, trades, seconds}``
+
+    ``engine`` is "event", "vectorized" or "auto" (vectorized when the
+    strategy has no stop, target or max_hold). ``window`` = (first, stop)
+    bar indices limits trading to those dates while indicators still use
+    the history before them. Metrics are the journal's
+    (journal_analytics.compute_metrics), with open trades valued at zero.
+    """
+    started = time.perf_counter()
+    strategy = normalize_strategy(strategy)
+    if engine == "auto":
+        simple = not (strategy.get("stop") or strategy.get("target") or strategy.get("max_hold"))
+        engine = "vectorized" if simple else "event"
+    if engine not in ("event", "vectorized"):
+        raise ValueError(f"Unknown engine: {engine}")
+    window = window or (0, matrix.bars.shape[2])
+    columns = trade_columns(matrix, strategy,
+                            (run_vectorized if engine == "vectorized" else run_events)(matrix, strategy, window))
+    frame = TradeFrame.from_columns(columns)
+    mask = frame.mask()
+    result = {
+        "strategy": strategy["name"],
+        "engine": engine,
+        "symbols": len(matrix.symbols),
+        "bars": int(window[1] - window[0]),
+        "metrics": compute_metrics(frame, mask),
+        "monthly": monthly_pl(frame, mask),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    if include_trades:
+        result["trades"] = journal_trades(columns)
+    return result
+
+
+# -- process pool ------------------------------------------------------------
+
+_worker_matrix = None
+
+
+def _init_worker(path, symbols, dates):
+    global _worker_matrix
+    # Every worker maps the same file: one copy of the bars in the page cache, nothing pickled per task
+    _worker_matrix = BarMatrix(symbols, dates, np.load(path, mmap_mode="r"))
+
+
+def _run_worker(strategy, engine, include_trades, window):
+    return backtest(_worker_matrix, strategy, engine, include_trades, window)
+
+
+class BacktestPool:
+    """Process pool of backtest workers sharing one BarMatrix
+
+    The aligned bars are written once to a memory-mapped .npy (on /dev/shm
+    when available); workers map it read-only and keep their own indicator
+    and signal caches across tasks. Use as a context manager.
+    """
+
+    def __init__(self, matrix, max_workers=None):
+        directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        fd, self.path = tempfile.mkstemp(suffix=".npy", prefix="backtest-", dir=directory)
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, np.ascontiguousarray(matrix.bars))
+        methods = multiprocessing.get_all_start_methods()
+        # forkserver: workers never inherit the caller's threads or open sockets
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else None)
+        self._pool = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count() or 1, mp_context=context,
+                                         initializer=_init_worker, initargs=(self.path, matrix.symbols, matrix.dates))
+
+    def submit(self, strategy, engine="auto", include_trades=False, window=None):
+        return self._pool.submit(_run_worker, strategy, engine, include_trades, window)
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def result_or_error(future, label):
+    """A finished backtest's result, or ``{"error": message}`` if it raised"""
+    try:
+        return future.result()
+    except Exception as e:
+        logger.error(f"Backtest {label} failed: {str(e)}")
+        return {"error": str(e)}
+
+
+def run_parallel(strategies, matrix, engine="auto", include_trades=False, max_workers=None):
+    """Backtest many strategies over a BacktestPool; yields (index, result) as each finishes
+
+    A strategy that fails yields ``{"error": message}`` instead.
+    """
+    with BacktestPool(matrix, max_workers) as pool:
+        futures = {pool.submit(strategy, engine, include_trades): i for i, strategy in enumerate(strategies)}
+        for future in as_completed(futures):
+            yield futures[future], result_or_error(future, futures[future])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    import json
+    import nse_stock_api
+    with open(sys.argv[1]) as f:
+        spec = json.load(f)
+    matrix = BarMatrix.from_store(nse_stock_api.history_store, sys.argv[2:] or None,
+                                  spec.pop("from", None), spec.pop("to", None))
+    result = backtest(matrix, spec, include_trades=False)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,44 @@
+"""
+Compare two benchmark result files (from micro.py or loadgen.py)
+
+    python bench/compare.py before.json after.json
+
+Prints p50 / p99 latency and throughput for every benchmark present in
+both files, with the relative change.
+"""
+
+import json
+import sys
+
+METRICS = ("p50_ms", "p99_ms", "throughput_rps")
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(before, after):
+    """[(benchmark, metric, before, after, percent change)] for shared benchmarks"""
+    rows = []
+    for name in sorted(before["results"].keys() & after["results"].keys()):
+        old, new = before["results"][name], after["results"][name]
+        for metric in METRICS:
+            if metric in old and metric in new:
+                change = (new[metric] - old[metric]) / old[metric] * 100 if old[metric] else None
+                rows.append((name, metric, old[metric], new[metric], change))
+    return rows
+
+
+def main():
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    before, after = load(sys.argv[1]), load(sys.argv[2])
+    print(f"{before['suite']}: {before.get('commit')} -> {after.get('commit')}")
+    for name, metric, old, new, change in compare(before, after):
+        change = f"{change:+.1f}%" if change is not None else "n/a"
+        print(f"{name:<24} {metric:<15} {old:>12.3f} {new:>12.3f} {change:>9}")
+
+
+if __name__ == "__main__":
+    main()
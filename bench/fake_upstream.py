@@ -0,0 +1,255 @@
+"""
+Local fake market-data server for benchmarks
+Stands in for Yahoo Finance so benchmarks never touch the network. Each
+symbol has a series of daily bars: recorded ones from a history store
+directory (``--history``) or a seeded random walk starting at the prices
+in real_nse_stock_data.json. Every quote request replays the next bar, so
+prices keep moving from one refresh to the next.
+
+Latency, error rate and throttling are configurable:
+
+    python bench/fake_upstream.py --port 8765 --latency 0.05 --jitter 0.02 \\
+        --error-rate 0.01 --rate 200 --burst 400
+
+Endpoints:
+    GET /history/<SYMBOL>?bars=2      last N replayed bars (0 = all, ``start=YYYY-MM-DD``)
+    GET /stats                        requests served, errors and throttled responses
+    POST /reset                       rewind every symbol and zero the counters
+
+FakeUpstreamClient turns the responses into yfinance-shaped DataFrames for
+nse_stock_api (see serve.py).
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import zlib
+
+import numpy as np
+
+import harness
+from history_store import CLOSE, DATE, HIGH, LOW, OPEN, VOLUME, HistoryStore, day_strings, to_day
+from upstream_client import TokenBucket
+
+RECORDED_QUOTES = os.path.join(harness.ROOT, "real_nse_stock_data.json")
+SYNTHETIC_DAYS = 500
+SYNTHETIC_END = "2026-01-01"
+
+
+def synthetic_bars(symbol, days=SYNTHETIC_DAYS, seed=0, base=None):
+    """(6, days) seeded random-walk bars ending at SYNTHETIC_END, weekdays only"""
+    rng = np.random.default_rng(zlib.crc32(symbol.encode()) ^ seed)
+    base = base or float(rng.uniform(100, 5000))
+    end = np.datetime64(SYNTHETIC_END, "D")
+    dates = np.arange(end - days * 7 // 5 - 7, end + 1, dtype="datetime64[D]")
+    dates = dates[np.is_busday(dates)][-days:]
+    close = base * np.exp(np.cumsum(rng.normal(0.0003, 0.015, len(dates))))
+    open_ = close * (1 + rng.normal(0, 0.004, len(dates)))
+    spread = np.abs(rng.normal(0, 0.008, len(dates)))
+    bars = np.empty((6, len(dates)))
+    bars[DATE] = dates.astype("int64")
+    bars[OPEN] = open_.round(2)
+    bars[HIGH] = (np.maximum(open_, close) * (1 + spread)).round(2)
+    bars[LOW] = (np.minimum(open_, close) * (1 - spread)).round(2)
+    bars[CLOSE] = close.round(2)
+    bars[VOLUME] = rng.integers(100000, 20000000, len(dates))
+    return bars
+
+
+class FakeMarket:
+    """Per-symbol bar series with a replay cursor, plus the fault settings"""
+
+    def __init__(self, history_dir=None, seed=0, latency=0.0, jitter=0.0, error_rate=0.0, rate=None, burst=None):
+        self.store = HistoryStore(history_dir) if history_dir else None
+        self.seed = seed
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.bucket = TokenBucket(rate, burst or rate) if rate else None
+        self.random = random.Random(seed)
+        self.base_prices = {}
+        if os.path.exists(RECORDED_QUOTES):
+            with open(RECORDED_QUOTES) as f:
+                self.base_prices = {s: q.get("previous_close") for s, q in json.load(f).items()}
+        self._bars = {}
+        self._cursor = {}
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "errors": 0, "throttled": 0}
+
+    def bars(self, symbol):
+        series = self._bars.get(symbol)
+        if series is None:
+            recorded = self.store.load(symbol) if self.store is not None else None
+            if recorded is not None and recorded.shape[1] > 2:
+                series = np.array(recorded)
+            else:
+                series = synthetic_bars(symbol, seed=self.seed, base=self.base_prices.get(symbol))
+            self._bars[symbol] = series
+        return series
+
+    def replay(self, symbol, count):
+        """The ``count`` bars up to this symbol's cursor (advancing it), or every bar if ``count`` is 0"""
+        with self._lock:
+            series = self.bars(symbol)
+            if not count:
+                return series
+            # start a few bars in, then move one bar per request and wrap around
+            cursor = self._cursor.get(symbol, min(series.shape[1], 2 * count) - 1)
+            self._cursor[symbol] = cursor + 1 if cursor + 1 < series.shape[1] else count - 1
+            return series[:, max(0, cursor - count + 1):cursor + 1]
+
+    def fault(self):
+        """'throttled', 'error' or None for one request, after the simulated latency"""
+        with self._lock:
+            self.counts["requests"] += 1
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            error = self.random.random() < self.error_rate
+        if self.bucket is not None and not self.bucket.acquire(timeout=0):
+            with self._lock:
+                self.counts["throttled"] += 1
+            return "throttled"
+        if delay:
+            time.sleep(delay)
+        if error:
+            with self._lock:
+                self.counts["errors"] += 1
+            return "error"
+        return None
+
+    def reset(self):
+        with self._lock:
+            self._cursor.clear()
+            self.counts = dict.fromkeys(self.counts, 0)
+
+
+def bars_json(symbol, bars):
+    return {
+        "symbol": symbol,
+        "date": day_strings(bars[DATE]),
+        "open": bars[OPEN].tolist(),
+        "high": bars[HIGH].tolist(),
+        "low": bars[LOW].tolist(),
+        "close": bars[CLOSE].tolist(),
+        "volume": bars[VOLUME].tolist(),
+    }
+
+
+def make_handler(market):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, payload, status=200):
+            body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = parse_qs(url.query)
+            if url.path == "/stats":
+                self.send_json(dict(market.counts))
+            elif url.path.startswith("/history/"):
+                fault = market.fault()
+                if fault == "throttled":
+                    self.send_json({"error": "Too Many Requests"}, 429)
+                elif fault == "error":
+                    self.send_json({"error": "Internal Server Error"}, 500)
+                else:
+                    symbol = unquote(url.path[len("/history/"):])
+                    bars = market.replay(symbol, int(query.get("bars", ["2"])[0]))
+                    if "start" in query:
+                        bars = bars[:, bars[DATE] >= to_day(query["start"][0])]
+                    self.send_json(bars_json(symbol, bars))
+            else:
+                self.send_json({"error": "Not found"}, 404)
+
+        def do_POST(self):
+            if urlsplit(self.path).path == "/reset":
+                market.reset()
+                self.send_json({"status": "success"})
+            else:
+                self.send_json({"error": "Not found"}, 404)
+
+    return Handler
+
+
+def serve(market, host="127.0.0.1", port=8765):
+    """A started ThreadingHTTPServer (serving on a daemon thread); ``port=0`` picks a free port"""
+    server = ThreadingHTTPServer((host, port), make_handler(market))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-upstream", daemon=True).start()
+    return server
+
+
+class FakeUpstreamClient:
+    """yfinance-shaped access to a fake upstream: ``history`` for quotes, ``bars`` for the history store"""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self._local = threading.local()
+
+    def _get(self, symbol, timeout=None, **params):
+        import requests
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        response = session.get(f"{self.url}/history/{quote(symbol, safe='')}", params=params, timeout=timeout)
+        response.raise_for_status()
+        return self._frame(response.json())
+
+    @staticmethod
+    def _frame(payload):
+        import pandas as pd
+        return pd.DataFrame({
+            "Open": payload["open"],
+            "High": payload["high"],
+            "Low": payload["low"],
+            "Close": payload["close"],
+            "Volume": payload["volume"],
+        }, index=pd.DatetimeIndex(pd.to_datetime(payload["date"]), name="Date"))
+
+    def history(self, symbol, timeout):
+        """Stand-in for nse_stock_api._yf_history: the last two bars"""
+        return self._get(symbol, timeout, bars=2)
+
+    def bars(self, symbol, start=None, period=None):
+        """Stand-in for the history store's fetch: every bar, or those from ``start``"""
+        return self._get(symbol, 30, bars=0, **({"start": start} if start else {}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--history", help="history store directory to replay recorded bars from")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every bar request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform +/- seconds around --latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 500")
+    parser.add_argument("--rate", type=float, help="requests per second before answering 429")
+    parser.add_argument("--burst", type=float, help="bucket size for --rate (default: --rate)")
+    args = parser.parse_args()
+
+    market = FakeMarket(args.history, args.seed, args.latency, args.jitter, args.error_rate, args.rate, args.burst)
+    server = serve(market, args.host, args.port)
+    print(f"Fake upstream on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
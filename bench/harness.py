@@ -0,0 +1,69 @@
+"""
+Shared helpers for the benchmark suite
+Puts the repository on sys.path, imports nse_stock_api against throwaway
+state (no cache file, a temporary trade database and history store), and
+writes results as JSON files that diff cleanly across commits.
+"""
+
+from datetime import datetime, timezone
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+PERCENTILES = (50, 90, 99)
+
+
+def isolated_api(workdir=None):
+    """nse_stock_api imported with its state files under ``workdir`` (a new temporary directory by default)"""
+    workdir = workdir or tempfile.mkdtemp(prefix="nse-bench-")
+    os.environ["NSE_CACHE_FILE"] = ""
+    os.environ.setdefault("NSE_TRADE_DB", os.path.join(workdir, "trades.db"))
+    os.environ.setdefault("NSE_HISTORY_DIR", os.path.join(workdir, "history"))
+    import nse_stock_api
+    return nse_stock_api
+
+
+def summarize(seconds):
+    """count / mean / p50 / p90 / p99 / max in milliseconds of a list of durations"""
+    values = np.asarray(seconds, dtype=float) * 1000
+    if not len(values):
+        return {"count": 0}
+    summary = {"count": int(len(values)), "mean_ms": round(float(values.mean()), 4)}
+    for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f"p{p}_ms"] = round(float(v), 4)
+    summary["max_ms"] = round(float(values.max()), 4)
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_results(path, suite, params, results):
+    """Write one run as JSON: suite, commit, time, machine, parameters and per-benchmark results"""
+    document = {
+        "suite": suite,
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+        "params": params,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return document
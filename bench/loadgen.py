@@ -0,0 +1,216 @@
+"""
+HTTP load generator for the NSE Stock Price API
+Runs ``--clients`` closed-loop clients for ``--duration`` seconds against
+a running server. Each request is one of these scenarios, picked by weight:
+
+- stocks: GET /api/stocks, revalidating with the last ETag for a
+  ``--conditional`` share of requests (304s are counted separately)
+- symbol: GET /api/stocks/<SYMBOL> for a random cached symbol
+- refresh: POST /api/refresh?wait=true (the full refresh path)
+
+Per-scenario throughput and p50/p90/p99 latency (after ``--warmup``
+seconds) go to a JSON file; compare two runs with bench/compare.py. With
+``--upstream-url`` the fake upstream's request counts over the run are
+included.
+
+``--spawn`` starts a fake upstream and the API (bench/serve.py) on free
+ports first, so a run is reproducible with one command:
+
+    python bench/loadgen.py --spawn --clients 32 --duration 30 --out load.json
+    python bench/loadgen.py --spawn --asgi --upstream-latency 0.05 --scenarios stocks=1,symbol=1
+    python bench/loadgen.py --url http://127.0.0.1:5000 --clients 64
+"""
+
+from contextlib import contextmanager
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+import harness
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SCENARIOS = "stocks=10,symbol=10,refresh=1"
+
+
+def parse_scenarios(spec):
+    """'stocks=10,symbol=5' -> {"stocks": 10.0, "symbol": 5.0}; raises ValueError"""
+    scenarios = {}
+    for part in spec.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in ("stocks", "symbol", "refresh"):
+            raise ValueError(f"Unknown scenario {name!r}; choose from stocks, symbol, refresh")
+        scenarios[name] = float(weight or 1)
+    return scenarios
+
+
+class Client:
+    """One closed-loop client; results are (scenario, seconds, status, bytes) tuples"""
+
+    def __init__(self, url, symbols, scenarios, conditional, seed):
+        self.url = url.rstrip("/")
+        self.symbols = symbols
+        self.names = list(scenarios)
+        self.weights = list(scenarios.values())
+        self.conditional = conditional
+        self.random = random.Random(seed)
+        self.session = requests.Session()
+        self.etag = None
+        self.results = []
+
+    def request(self, scenario):
+        headers = {}
+        if scenario == "stocks":
+            if self.etag and self.random.random() < self.conditional:
+                headers["If-None-Match"] = self.etag
+            return self.session.get(f"{self.url}/api/stocks", headers=headers, timeout=60)
+        if scenario == "symbol":
+            symbol = self.random.choice(self.symbols)
+            return self.session.get(f"{self.url}/api/stocks/{requests.utils.quote(symbol, safe='')}", timeout=60)
+        return self.session.post(f"{self.url}/api/refresh", params={"wait": "true"}, timeout=120)
+
+    def run(self, start_recording, deadline):
+        while True:
+            scenario = self.random.choices(self.names, self.weights)[0]
+            started = time.perf_counter()
+            if started >= deadline:
+                return
+            try:
+                response = self.request(scenario)
+                status, size = response.status_code, int(response.headers.get("Content-Length") or len(response.content))
+                if scenario == "stocks" and status == 200:
+                    self.etag = response.headers.get("ETag")
+            except requests.RequestException:
+                status, size = 0, 0
+            if started >= start_recording:
+                self.results.append((scenario, time.perf_counter() - started, status, size))
+
+
+def report(results, duration):
+    """Per-scenario and overall throughput, status counts and latency percentiles"""
+    by_scenario = {}
+    for scenario, seconds, status, size in results:
+        by_scenario.setdefault(scenario, []).append((seconds, status, size))
+    by_scenario["all"] = [(seconds, status, size) for _, seconds, status, size in results]
+    summary = {}
+    for scenario, rows in by_scenario.items():
+        ok = [seconds for seconds, status, _ in rows if status in (200, 304)]
+        summary[scenario] = dict(
+            harness.summarize(ok),
+            requests=len(rows),
+            errors=sum(1 for _, status, _ in rows if status not in (200, 304)),
+            not_modified=sum(1 for _, status, _ in rows if status == 304),
+            throughput_rps=round(len(ok) / duration, 2),
+            bytes_mean=round(sum(size for _, _, size in rows) / max(1, len(rows)), 1),
+        )
+    return summary
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+@contextmanager
+def spawned(args):
+    """Start fake_upstream.py and serve.py on free ports; yields (api url, upstream url)"""
+    upstream_port, api_port = free_port(), free_port()
+    upstream_url, api_url = f"http://127.0.0.1:{upstream_port}", f"http://127.0.0.1:{api_port}"
+    upstream_cmd = [sys.executable, os.path.join(BENCH_DIR, "fake_upstream.py"), "--port", str(upstream_port),
+                    "--latency", str(args.upstream_latency), "--jitter", str(args.upstream_jitter),
+                    "--error-rate", str(args.upstream_error_rate), "--seed", str(args.seed)]
+    if args.upstream_rate:
+        upstream_cmd += ["--rate", str(args.upstream_rate)]
+    api_cmd = [sys.executable, os.path.join(BENCH_DIR, "serve.py"), "--upstream", upstream_url,
+               "--port", str(api_port)] + (["--asgi"] if args.asgi else [])
+    processes = [subprocess.Popen(upstream_cmd, stdout=subprocess.DEVNULL)]
+    try:
+        wait_for(f"{upstream_url}/stats")
+        processes.append(subprocess.Popen(api_cmd))
+        wait_for(f"{api_url}/api/health")
+        yield api_url, upstream_url
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=30)
+
+
+def run(url, args, upstream_url=None):
+    scenarios = parse_scenarios(args.scenarios)
+    stocks = requests.get(f"{url}/api/stocks", timeout=60).json().get("data") or {}
+    symbols = [symbol for symbol, quote in stocks.items() if quote] or ["RELIANCE.NS"]
+    before = requests.get(f"{upstream_url}/stats", timeout=10).json() if upstream_url else None
+
+    clients = [Client(url, symbols, scenarios, args.conditional, args.seed + i) for i in range(args.clients)]
+    start_recording = time.perf_counter() + args.warmup
+    deadline = start_recording + args.duration
+    threads = [threading.Thread(target=client.run, args=(start_recording, deadline)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results = report([row for client in clients for row in client.results], args.duration)
+    if upstream_url:
+        after = requests.get(f"{upstream_url}/stats", timeout=10).json()
+        results["upstream"] = {key: after[key] - before.get(key, 0) for key in after}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--upstream-url", help="fake upstream to read request counts from")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS, help="weighted mix, e.g. stocks=10,symbol=10,refresh=1")
+    parser.add_argument("--conditional", type=float, default=0.5, help="share of /api/stocks requests sent with If-None-Match")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="load_results.json")
+    parser.add_argument("--spawn", action="store_true", help="start a fake upstream and the API first")
+    parser.add_argument("--asgi", action="store_true", help="with --spawn, serve asgi_app instead of Flask")
+    parser.add_argument("--upstream-latency", type=float, default=0.02)
+    parser.add_argument("--upstream-jitter", type=float, default=0.01)
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0)
+    parser.add_argument("--upstream-rate", type=float, help="fake upstream requests per second before 429")
+    args = parser.parse_args()
+    parse_scenarios(args.scenarios)
+
+    if args.spawn:
+        with spawned(args) as (url, upstream_url):
+            results = run(url, args, upstream_url)
+    else:
+        results = run(args.url, args, args.upstream_url)
+
+    params = {key: value for key, value in vars(args).items() if key not in ("out", "url", "upstream_url")}
+    harness.write_results(args.out, "load", params, results)
+    for scenario, summary in results.items():
+        if scenario != "upstream" and summary.get("count"):
+            print(f"{scenario:<8} {summary['throughput_rps']:>9.1f} req/s  p50 {summary['p50_ms']:>8.2f} ms  "
+                  f"p99 {summary['p99_ms']:>8.2f} ms  errors {summary['errors']}")
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
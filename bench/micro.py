@@ -0,0 +1,127 @@
+"""
+Micro-benchmarks for the NSE Stock Price API hot paths
+Times, with no network:
+
+- build_quote: one yfinance DataFrame -> quote dict
+- fetch_stock_data: fanning ``--symbols`` symbols over the worker pool
+  against an in-process source with ``--latency`` seconds per request
+  (or the fake upstream over HTTP with ``--upstream``)
+- publish_full / publish_1pct: QuoteCache apply + publish (including the
+  /api/stocks encoding) with every symbol / 1% of symbols changed
+- encode_stocks, encode_changes: the pre-built /api/stocks and
+  /api/stocks/changes bodies
+- columnar_json / columnar_msgpack / columnar_arrow: /api/stocks/bulk bodies
+  for every symbol (msgpack and Arrow when installed)
+
+Results (count, mean, p50, p90, p99, max in ms per operation) go to a JSON
+file; compare two runs with ``python bench/compare.py old.json new.json``.
+
+    python bench/micro.py --symbols 500 --out micro.json
+"""
+
+import argparse
+import logging
+import time
+
+import pandas as pd
+
+import harness
+import columnar
+from fake_upstream import FakeUpstreamClient, synthetic_bars
+from history_store import CLOSE, DATE, HIGH, LOW, OPEN, VOLUME
+from quote_cache import QuoteCache
+
+
+def measure(fn, repeat, warmup=1):
+    """Durations in seconds of ``repeat`` calls of ``fn`` (after ``warmup`` untimed calls)"""
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def frames(symbols):
+    """Two-bar yfinance-shaped DataFrames per symbol"""
+    result = {}
+    for symbol in symbols:
+        bars = synthetic_bars(symbol, days=2)
+        result[symbol] = pd.DataFrame({
+            "Open": bars[OPEN], "High": bars[HIGH], "Low": bars[LOW], "Close": bars[CLOSE], "Volume": bars[VOLUME],
+        }, index=pd.DatetimeIndex(bars[DATE].astype("datetime64[D]")))
+    return result
+
+
+def run(api, symbols, latency, repeat, upstream=None):
+    names = [f"SYM{i:04d}.NS" for i in range(symbols)]
+    history = frames(names)
+    quotes = {symbol: api.build_quote(symbol, frame) for symbol, frame in history.items()}
+    results = {}
+
+    frame = history[names[0]]
+    results["build_quote"] = measure(lambda: api.build_quote(names[0], frame), repeat * 100)
+
+    def source(symbol, timeout):
+        if latency:
+            time.sleep(latency)
+        return history[symbol]
+    results["fetch_stock_data"] = measure(lambda: api.fetch_stock_data(names, history_fn=source), repeat)
+    if upstream:
+        client = FakeUpstreamClient(upstream)
+        results["fetch_stock_data_http"] = measure(lambda: api.fetch_stock_data(names, history_fn=client.history),
+                                                   repeat)
+
+    cache = QuoteCache(publish_interval=0, encoder=api.encode_stocks_snapshot)
+    for symbol, quote in quotes.items():
+        cache.apply(symbol, quote)
+    cache.publish()
+    tick = [0]
+
+    def publish(share):
+        tick[0] += 1
+        for symbol in names[:max(1, int(len(names) * share))]:
+            cache.apply(symbol, dict(quotes[symbol], price=quotes[symbol]["price"] + tick[0] * 0.05))
+        cache.publish()
+    results["publish_full"] = measure(lambda: publish(1.0), repeat)
+    results["publish_1pct"] = measure(lambda: publish(0.01), repeat * 10)
+
+    snapshot = cache.snapshot()
+    results["encode_stocks"] = measure(lambda: api.encode_stocks_snapshot(snapshot), repeat)
+    encode_changes = api.encode_changes.__wrapped__  # past the per-generation lru_cache
+    results["encode_changes"] = measure(lambda: encode_changes(snapshot, snapshot.generation - 1), repeat * 10)
+
+    fields = tuple(columnar.QUOTE_FIELDS)
+    for media in columnar.available_media_types():
+        name = "columnar_" + {columnar.JSON: "json", columnar.MSGPACK: "msgpack", columnar.ARROW: "arrow"}[media]
+        results[name] = measure(lambda: columnar.encode(columnar.project(snapshot.data, names, fields), media,
+                                                        {"generation": snapshot.generation}), repeat)
+    return {name: harness.summarize(durations) for name, durations in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated seconds per upstream request")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--upstream", help="also time fetch_stock_data against this fake upstream URL")
+    parser.add_argument("--out", default="micro_results.json")
+    args = parser.parse_args()
+
+    api = harness.isolated_api()
+    logging.getLogger().setLevel(logging.WARNING)
+    results = run(api, args.symbols, args.latency, args.repeat, args.upstream)
+    harness.write_results(args.out, "micro", {
+        "symbols": args.symbols, "latency": args.latency, "repeat": args.repeat,
+        "fetch_max_workers": api.FETCH_MAX_WORKERS, "upstream": args.upstream,
+    }, results)
+    width = max(map(len, results))
+    for name, summary in results.items():
+        print(f"{name:<{width}}  p50 {summary['p50_ms']:>10.3f} ms  p99 {summary['p99_ms']:>10.3f} ms")
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Run the NSE Stock Price API against the fake upstream
+Quote and history fetches go to ``--upstream`` (a fake_upstream.py server)
+instead of yfinance; everything else (upstream guard, cache, refresh
+scheduler) is the production code. State lives in a temporary directory.
+
+    python bench/serve.py --upstream http://127.0.0.1:8765 --port 5000
+    python bench/serve.py --upstream http://127.0.0.1:8765 --port 5000 --asgi
+"""
+
+import argparse
+import logging
+
+import harness
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--upstream", default="http://127.0.0.1:8765")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--asgi", action="store_true", help="serve asgi_app with uvicorn instead of Flask")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    api = harness.isolated_api()
+    from fake_upstream import FakeUpstreamClient
+    client = FakeUpstreamClient(args.upstream)
+    api._yf_history = client.history
+    api._history_fetch = client.bars
+    logging.getLogger().setLevel(args.log_level)
+
+    if args.asgi:
+        import uvicorn
+        import asgi_app
+        uvicorn.run(asgi_app.app, host=args.host, port=args.port, log_level=args.log_level.lower())
+        return
+
+    api.start_worker()
+    if api.quote_cache.snapshot().available == 0:
+        api.refresh_scheduler.trigger()[0].wait()
+    logging.getLogger("werkzeug").setLevel(args.log_level)
+    api.app.run(host=args.host, port=args.port, debug=False, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
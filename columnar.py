@@ -0,0 +1,131 @@
+"""
+Columnar quote encodings for the NSE Stock Price API
+Projects cached quotes onto a chosen set of fields and lays them out as one
+array per field (the key names appear once, not once per symbol), encoded
+as JSON, MessagePack or Arrow IPC. MessagePack and Arrow need the optional
+``msgpack`` and ``pyarrow`` packages; without them only JSON is offered.
+"""
+
+import json
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional dependency
+    pa = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+MEDIA_ALIASES = {
+    "json": JSON,
+    "msgpack": MSGPACK,
+    "application/x-msgpack": MSGPACK,
+    "arrow": ARROW,
+}
+
+# Quote fields (build_quote plus the cache's staleness flags) and their Arrow types
+QUOTE_FIELDS = {
+    "symbol": "string",
+    "name": "string",
+    "price": "float64",
+    "previous_close": "float64",
+    "change": "float64",
+    "change_percent": "float64",
+    "volume": "int64",
+    "high": "float64",
+    "low": "float64",
+    "open": "float64",
+    "trade_date": "string",
+    "currency": "string",
+    "last_updated": "string",
+    "market_status": "string",
+    "stale": "bool",
+    "stale_age_seconds": "float64",
+}
+DEFAULT_FIELDS = ("price", "change", "change_percent", "volume", "last_updated")
+# Few distinct values per snapshot: dictionary-encoded in Arrow
+DICTIONARY_FIELDS = {"currency", "market_status", "trade_date"}
+
+
+def available_media_types():
+    types = [JSON]
+    if msgpack is not None:
+        types.append(MSGPACK)
+    if pa is not None:
+        types.append(ARROW)
+    return types
+
+
+def negotiate(accept, requested=None):
+    """Media type to send for an Accept header (or an explicit ``?format=``); None if none is acceptable"""
+    available = available_media_types()
+    if requested:
+        media = MEDIA_ALIASES.get(requested.lower(), requested.lower())
+        return media if media in available else None
+    best, best_q = None, 0.0
+    for part in (accept or "*/*").split(","):
+        name, _, params = part.strip().partition(";")
+        name = MEDIA_ALIASES.get(name.strip().lower(), name.strip().lower())
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        candidates = available if name in ("*/*", "application/*") else [name]
+        for media in candidates:
+            if media in available and q > best_q:
+                best, best_q = media, q
+                break
+    return best
+
+
+def parse_fields(fields):
+    """Validated field list (``"all"`` or empty -> defaults / every field); raises ValueError"""
+    if not fields:
+        return DEFAULT_FIELDS
+    if fields == ["all"] or fields == "all":
+        return tuple(QUOTE_FIELDS)
+    unknown = [f for f in fields if f not in QUOTE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}; choose from {', '.join(QUOTE_FIELDS)}")
+    return tuple(dict.fromkeys(fields))
+
+
+def project(data, symbols, fields):
+    """{"symbols": [...], "columns": {field: [...]}, "missing": [...]} from a snapshot's data"""
+    quotes = [data.get(symbol) for symbol in symbols]
+    columns = {field: [quote.get(field) if quote else None for quote in quotes] for field in fields}
+    return {
+        "symbols": list(symbols),
+        "columns": columns,
+        "missing": [symbol for symbol, quote in zip(symbols, quotes) if not quote],
+    }
+
+
+def encode(table, media, meta):
+    """Bytes of a projected table in ``media``; ``meta`` (generation, timestamps) travels alongside"""
+    if media == ARROW:
+        arrays = [pa.array(table["symbols"], type=pa.string())]
+        names = ["symbols"]
+        for field, values in table["columns"].items():
+            array = pa.array(values, type=pa.type_for_alias(QUOTE_FIELDS[field]))
+            arrays.append(array.dictionary_encode() if field in DICTIONARY_FIELDS else array)
+            names.append(field)
+        metadata = {key: json.dumps(value) for key, value in dict(meta, missing=table["missing"]).items()}
+        batch = pa.RecordBatch.from_arrays(arrays, names=names)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, batch.schema.with_metadata(metadata)) as writer:
+            writer.write_batch(batch)
+        return sink.getvalue().to_pybytes()
+    payload = dict(meta, status="success", **table)
+    if media == MSGPACK:
+        return msgpack.packb(payload, use_bin_type=True)
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,437 @@
+"""
+Rolling correlation and exposure engine for Trading Journal Pro
+Tracks daily returns of every held or watched symbol plus a benchmark
+(NIFTY) over a fixed window of stored days, keeping the running sums
+(sum of returns and sum of return outer products) from which covariance,
+correlation and beta follow directly:
+
+- a new stored day replaces the oldest row: a rank-1 update of the sums;
+- a symbol whose stored bars changed (e.g. a partial day re-fetched), or a
+  newly tracked symbol, updates one row/column of the sums;
+- live quotes for a day not yet stored form a provisional extra row, added
+  to the sums only when read.
+
+So a refresh costs O(changed x symbols), never a full N x N recompute from
+the window of returns. Exposure groups open positions by sector and
+strategy, with beta-weighted net exposure, and clusters held symbols whose
+returns move together.
+"""
+
+import logging
+import threading
+
+import numpy as np
+
+from history_store import CLOSE, DATE, day_strings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 60           # daily returns per rolling window
+DEFAULT_THRESHOLD = 0.7       # correlation at which held symbols count as one bet
+TRADING_DAYS = 252
+UNCLASSIFIED = "Unclassified"
+
+
+def aligned_closes(bars, days):
+    """Close on or before each of ``days`` (NaN before the first bar)"""
+    index = np.searchsorted(bars[DATE], days, side="right") - 1
+    closes = np.asarray(bars[CLOSE])[np.maximum(index, 0)]
+    return np.where(index >= 0, closes, np.nan)
+
+
+def returns_from_closes(closes):
+    """Simple returns between consecutive closes; undefined ones count as no move"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        returns = closes[1:] / closes[:-1] - 1
+    return np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+class RollingCovariance:
+    """Running sums over the last ``window`` return rows, one column per symbol
+
+    Rows live in a ring buffer (``head`` is the oldest); a live row can be
+    set per symbol and is folded in only by ``stats``.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.rows = np.zeros((window, 0))
+        self.head = 0
+        self.count = 0
+        self.sum = np.zeros(0)
+        self.outer = np.zeros((0, 0))
+        self.live = np.zeros(0)
+        self.live_set = np.zeros(0, dtype=bool)
+        self._pushes = 0
+
+    @property
+    def width(self):
+        return self.rows.shape[1]
+
+    def reset(self, returns):
+        """Start over from (days, symbols) returns, keeping the last ``window`` days"""
+        returns = np.asarray(returns, dtype=float)[-self.window:]
+        self.rows = np.zeros((self.window, returns.shape[1]))
+        self.rows[:len(returns)] = returns
+        self.head = len(returns) % self.window
+        self.count = len(returns)
+        self.live = np.zeros(returns.shape[1])
+        self.live_set = np.zeros(returns.shape[1], dtype=bool)
+        self._resum()
+
+    def _resum(self):
+        # unfilled rows are zero, so they add nothing
+        self.sum = self.rows.sum(axis=0)
+        self.outer = self.rows.T @ self.rows
+        self._pushes = 0
+
+    def chronological(self):
+        """Stored rows, oldest first"""
+        if self.count < self.window:
+            return self.rows[:self.count]
+        return np.roll(self.rows, -self.head, axis=0)
+
+    def push(self, row):
+        """Append one day's returns, dropping the oldest once the window is full"""
+        if self.count == self.window:
+            old = self.rows[self.head].copy()
+            self.sum -= old
+            self.outer -= np.outer(old, old)
+        else:
+            self.count += 1
+        self.rows[self.head] = row
+        self.head = (self.head + 1) % self.window
+        self.sum += row
+        self.outer += np.outer(row, row)
+        self._pushes += 1
+        if self._pushes >= self.window:
+            # bound floating-point drift from many add / subtract pairs
+            self._resum()
+
+    def set_column(self, column, values):
+        """Replace one symbol's returns (oldest first) and its row / column of the sums"""
+        slots = (self.head - self.count + np.arange(self.count)) % self.window
+        self.rows[slots, column] = values
+        cross = self.rows.T @ self.rows[:, column]
+        self.outer[column, :] = cross
+        self.outer[:, column] = cross
+        self.sum[column] = float(np.sum(values))
+
+    def add_columns(self, columns):
+        """Track more symbols: ``columns`` is (days, k), oldest first, matching the stored rows"""
+        k = columns.shape[1]
+        start = self.width
+        self.rows = np.hstack([self.rows, np.zeros((self.window, k))])
+        self.sum = np.concatenate([self.sum, np.zeros(k)])
+        outer = np.zeros((start + k, start + k))
+        outer[:start, :start] = self.outer
+        self.outer = outer
+        self.live = np.concatenate([self.live, np.zeros(k)])
+        self.live_set = np.concatenate([self.live_set, np.zeros(k, dtype=bool)])
+        for offset in range(k):
+            self.set_column(start + offset, columns[:, offset])
+
+    def set_live(self, column, value):
+        """Provisional return for today (None clears it)"""
+        self.live_set[column] = value is not None
+        self.live[column] = value if value is not None else 0.0
+
+    def stats(self):
+        """(observations, mean, covariance) including the live row if any symbol has one"""
+        count, total, outer = self.count, self.sum, self.outer
+        if self.live_set.any():
+            count, total, outer = count + 1, total + self.live, outer + np.outer(self.live, self.live)
+        if count < 2:
+            return count, np.zeros(self.width), np.zeros((self.width, self.width))
+        mean = total / count
+        covariance = (outer - np.outer(total, mean)) / (count - 1)
+        return count, mean, covariance
+
+
+def correlation_from_covariance(covariance):
+    deviation = np.sqrt(np.clip(np.diag(covariance), 0, None))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlation = covariance / np.outer(deviation, deviation)
+    correlation = np.clip(np.nan_to_num(correlation, nan=0.0), -1, 1)
+    np.fill_diagonal(correlation, np.where(deviation > 0, 1.0, 0.0))
+    return correlation
+
+
+def clusters(symbols, correlation, threshold):
+    """Groups of 2+ symbols linked by pairwise correlation >= ``threshold`` (single linkage)"""
+    parent = list(range(len(symbols)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(*np.nonzero(np.triu(correlation >= threshold, k=1))):
+        parent[find(i)] = find(j)
+    groups = {}
+    for i in range(len(symbols)):
+        groups.setdefault(find(i), []).append(i)
+    return [members for members in groups.values() if len(members) > 1]
+
+
+class CorrelationEngine:
+    """Rolling return statistics for a growing set of symbols, from a HistoryStore and live quotes
+
+    Column 0 is always ``benchmark``; its stored days (when it has enough)
+    define the date axis, otherwise the union of the tracked symbols' days.
+    """
+
+    def __init__(self, store, benchmark, window=DEFAULT_WINDOW):
+        self.store = store
+        self.benchmark = benchmark
+        self.window = window
+        self.symbols = []
+        self._index = {}
+        self._sources = {}        # symbol -> bars object the column was built from
+        self._days = None         # window + 1 stored days, oldest first
+        self._last_close = np.zeros(0)
+        self._quotes = {}         # symbol -> (trade_date, price) seen from the quote cache
+        self._covariance = RollingCovariance(window)
+        self._lock = threading.RLock()
+        self.track([benchmark])
+
+    # -- symbols and stored days -------------------------------------------
+
+    def track(self, symbols):
+        """Make sure every symbol has a column (benchmark first); returns the tracked list"""
+        with self._lock:
+            new = [s for s in dict.fromkeys(symbols) if s not in self._index]
+            for symbol in new:
+                self._index[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+            if new and self._days is not None:
+                columns, closes = self._columns(new)
+                self._covariance.add_columns(columns)
+                self._last_close = np.concatenate([self._last_close, closes])
+                for symbol in new:
+                    self._apply_quote(symbol)
+            return list(self.symbols)
+
+    def _axis(self, sources):
+        """window + 1 stored days to measure returns over"""
+        bench = sources.get(self.benchmark)
+        if bench is not None and bench.shape[1] > self.window:
+            return np.asarray(bench[DATE, -(self.window + 1):])
+        stored = [np.asarray(bars[DATE, -(self.window + 1):]) for bars in sources.values()
+                  if bars is not None and bars.shape[1]]
+        if not stored:
+            return np.empty(0)
+        return np.unique(np.concatenate(stored))[-(self.window + 1):]
+
+    def _columns(self, symbols, days=None, keep=True):
+        """((days - 1, k) returns, last closes) of ``symbols`` on the axis
+
+        ``keep=False`` reads the bars without remembering them as column
+        sources (symbols that are not tracked).
+        """
+        days = self._days if days is None else days
+        returns = np.zeros((max(len(days) - 1, 0), len(symbols)))
+        last = np.full(len(symbols), np.nan)
+        for k, symbol in enumerate(symbols):
+            bars = self.store.load(symbol)
+            if keep:
+                self._sources[symbol] = bars
+            if bars is not None and bars.shape[1] and len(days):
+                closes = aligned_closes(bars, days)
+                returns[:, k] = returns_from_closes(closes)
+                last[k] = closes[-1]
+        return returns, last
+
+    def sync(self):
+        """Catch up with stored bars: new days roll the window, changed symbols update their column
+
+        Only the changed symbols are re-read over the window; the others
+        contribute just their returns for the new days.
+        """
+        with self._lock:
+            sources = {symbol: self.store.load(symbol) for symbol in self.symbols}
+            changed = [s for s in self.symbols if sources[s] is not self._sources.get(s, False)]
+            if not changed:
+                return False
+            days = self._axis(sources)
+            previous = self._days
+            shift = self._shift(previous, days)
+            if shift is None:
+                returns, self._last_close = self._columns(self.symbols, days)
+                self._days = days
+                self._covariance.reset(returns)
+                logger.info(f"Correlation window rebuilt for {len(self.symbols)} symbols")
+            else:
+                returns, closes = self._columns(changed, days)
+                columns = [self._index[symbol] for symbol in changed]
+                self._days = days
+                if shift:
+                    rows, last = self._new_rows(sources, days[len(days) - shift - 1:])
+                    rows[:, columns] = returns[len(returns) - shift:]
+                    for row in rows:
+                        self._covariance.push(row)
+                    self._last_close = last
+                self._last_close[columns] = closes
+                stored = self._covariance.chronological()[:, columns]
+                returns = returns[len(returns) - len(stored):]
+                for k in np.flatnonzero(np.any(stored != returns, axis=0)):
+                    self._covariance.set_column(columns[k], returns[:, k])
+            for symbol in self.symbols:
+                self._apply_quote(symbol)
+            return True
+
+    def _new_rows(self, sources, tail):
+        """((len(tail) - 1, symbols) returns over ``tail``, closes on its last day) from unchanged sources"""
+        rows = np.zeros((len(tail) - 1, len(self.symbols)))
+        last = np.full(len(self.symbols), np.nan)
+        for column, symbol in enumerate(self.symbols):
+            bars = sources[symbol]
+            if bars is not None and bars.shape[1]:
+                closes = aligned_closes(bars, tail)
+                rows[:, column] = returns_from_closes(closes)
+                last[column] = closes[-1]
+        return rows, last
+
+    @staticmethod
+    def _shift(previous, days):
+        """Days appended since ``previous`` if ``days`` just extends it, else None (rebuild)"""
+        if previous is None or len(previous) < 2 or len(days) != len(previous):
+            return None
+        shift = int(np.searchsorted(days, previous[-1], side="right"))
+        shift = len(days) - shift
+        if shift >= len(days) - 1 or not np.array_equal(days[:len(days) - shift], previous[shift:]):
+            return None
+        return shift
+
+    # -- live quotes -------------------------------------------------------
+
+    def on_publish(self, snapshot):
+        """QuoteCache listener: set the live row for symbols whose quote changed"""
+        if snapshot.diffs and snapshot.diffs[-1][1] == snapshot.generation:
+            changed = snapshot.diffs[-1][2]
+        else:
+            changed = snapshot.data.keys()
+        with self._lock:
+            for symbol in changed:
+                quote = snapshot.data.get(symbol)
+                if quote is None:
+                    self._quotes.pop(symbol, None)
+                else:
+                    self._quotes[symbol] = (quote.get("trade_date"), quote.get("price"))
+                if symbol in self._index:
+                    self._apply_quote(symbol)
+
+    def _apply_quote(self, symbol):
+        """Set a tracked symbol's live row from its quote"""
+        if self._days is None or not len(self._days):
+            return
+        column = self._index[symbol]
+        self._covariance.set_live(column, self._live_return(symbol, self._last_close[column]))
+
+    def _live_return(self, symbol, last):
+        """Return of a quote for a day after the window against the last stored close, else None"""
+        trade_date, price = self._quotes.get(symbol, (None, None))
+        if trade_date and price and last > 0 and trade_date > day_strings(self._days[-1:])[0]:
+            return price / last - 1
+        return None
+
+    # -- reads -------------------------------------------------------------
+
+    def stats(self, symbols):
+        """Correlation, beta to the benchmark and annualized volatility (%) of ``symbols``
+
+        Tracked symbols come from the running sums. Any others are computed
+        from their stored bars for this call only and are not tracked, so
+        ad-hoc queries never grow the per-sync and per-publish work.
+        """
+        with self._lock:
+            if self._days is None:
+                self.sync()
+            days = self._days
+            extra = [s for s in dict.fromkeys(symbols) if s not in self._index]
+            if extra:
+                count, covariance, live = self._ad_hoc_covariance(symbols, extra)
+            else:
+                count, _, full = self._covariance.stats()
+                columns = [0] + [self._index[s] for s in symbols]
+                covariance = full[np.ix_(columns, columns)]
+                live = bool(self._covariance.live_set.any())
+        # row / column 0 is the benchmark, then ``symbols`` in order
+        variance = np.clip(np.diag(covariance), 0, None)
+        bench_variance = variance[0]
+        beta = covariance[1:, 0] / bench_variance if bench_variance > 0 else np.full(len(symbols), np.nan)
+        return {
+            "observations": int(count),
+            "days": day_strings(days[[1, -1]]) if len(days) > 1 else [],
+            "live": live,
+            "correlation": correlation_from_covariance(covariance[1:, 1:]),
+            "beta": beta,
+            "volatility": np.sqrt(variance[1:] * TRADING_DAYS) * 100,
+        }
+
+    def _ad_hoc_covariance(self, symbols, extra):
+        """(observations, covariance of benchmark + ``symbols``, live) with ``extra`` read untracked"""
+        stored = self._covariance.chronological()
+        returns, last = self._columns(extra, keep=False)
+        rows = {s: stored[:, self._index[s]] for s in symbols if s in self._index}
+        rows.update(zip(extra, returns[len(returns) - len(stored):].T))
+        last = dict(zip(extra, last))
+        matrix = np.column_stack([stored[:, 0]] + [rows[s] for s in symbols])
+        live = np.concatenate([[self._covariance.live[0]], np.zeros(len(symbols))])
+        live_set = self._covariance.live_set.any()
+        for k, symbol in enumerate(symbols):
+            if symbol in self._index:
+                live[k + 1] = self._covariance.live[self._index[symbol]]
+            else:
+                value = self._live_return(symbol, last[symbol]) if len(self._days) else None
+                if value is not None:
+                    live[k + 1], live_set = value, True
+        if live_set:
+            matrix = np.vstack([matrix, live])
+        count, width = matrix.shape
+        if count < 2:
+            return count, np.zeros((width, width)), bool(live_set)
+        total = matrix.sum(axis=0)
+        covariance = (matrix.T @ matrix - np.outer(total, total / count)) / (count - 1)
+        return count, covariance, bool(live_set)
+
+
+def exposure(positions, beta, sectors, threshold, correlation, symbols):
+    """Open positions grouped by sector and strategy, plus clusters of correlated holdings
+
+    ``positions`` are dicts with symbol (quote symbol), strategy and signed
+    value; ``beta`` / ``correlation`` are indexed like ``symbols``.
+    """
+    index = {symbol: i for i, symbol in enumerate(symbols)}
+    groups = {"sectors": {}, "strategies": {}}
+    total = {"gross": 0.0, "net": 0.0, "betaNet": 0.0, "positions": 0}
+    net_by_symbol = {}
+    for position in positions:
+        value = position["value"]
+        symbol_beta = beta[index[position["symbol"]]]
+        beta_value = value * symbol_beta if np.isfinite(symbol_beta) else 0.0
+        net_by_symbol[position["symbol"]] = net_by_symbol.get(position["symbol"], 0.0) + value
+        for kind, key in (("sectors", sectors.get(position["symbol"], UNCLASSIFIED)),
+                          ("strategies", position["strategy"] or UNCLASSIFIED), (None, None)):
+            bucket = total if kind is None else groups[kind].setdefault(
+                key, {"gross": 0.0, "net": 0.0, "betaNet": 0.0, "positions": 0})
+            bucket["gross"] += abs(value)
+            bucket["net"] += value
+            bucket["betaNet"] += beta_value
+            bucket["positions"] += 1
+
+    held = [s for s in symbols if s in net_by_symbol]
+    held_index = [index[s] for s in held]
+    found = clusters(held, correlation[np.ix_(held_index, held_index)], threshold) if held else []
+    bets = []
+    for members in found:
+        names = [held[i] for i in members]
+        sub = correlation[np.ix_([held_index[i] for i in members], [held_index[i] for i in members])]
+        bets.append({
+            "symbols": names,
+            "averageCorrelation": float((sub.sum() - len(members)) / (len(members) * (len(members) - 1))),
+            "net": sum(net_by_symbol[s] for s in names),
+        })
+    bets.sort(key=lambda bet: -abs(bet["net"]))
+    return {**groups, "total": total, "clusters": bets}
@@ -0,0 +1,207 @@
+"""
+Equity curve and drawdown engine for Trading Journal Pro
+Server-side replacement for generateEquityCurveValues, calculateMaxDrawdown
+and generateDrawdownData in app.js. Closed trades are kept in exit-date
+order with their cumulative equity, running peak and peak position, so
+closing a trade at the end of the curve is O(1) and a back-dated change
+only recomputes the suffix after it. Chart series are downsampled with
+LTTB (largest-triangle-three-buckets) to the requested pixel width.
+"""
+
+import numpy as np
+
+
+def lttb(x, y, threshold):
+    """Indices of ``threshold`` points of (x, y) picked by largest-triangle-three-buckets"""
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    every = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype="int64")
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        if end < next_end:
+            avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        else:
+            avg_x, avg_y = x[n - 1], y[n - 1]
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+class EquityCurve:
+    """Closed-trade equity curve with incremental close / reopen
+
+    Point ``i`` is the equity after the i-th closed trade in exit-date
+    order; the implicit start point is ``initial_capital``. Ties keep
+    arrival order, like the stable sort in app.js.
+    """
+
+    _FLOAT_COLUMNS = ("_day", "_pl", "_equity", "_peak")
+
+    def __init__(self, initial_capital, capacity=1024):
+        self.initial_capital = initial_capital
+        self._n = 0
+        self._day = np.empty(capacity)       # exit day (days since epoch)
+        self._pl = np.empty(capacity)
+        self._equity = np.empty(capacity)
+        self._peak = np.empty(capacity)      # running peak including this point
+        self._peak_at = np.empty(capacity, dtype="int64")  # index of that peak, -1 = start
+        self._id = np.empty(capacity, dtype=object)
+        self._days = {}                      # trade id -> exit day, for locating it again
+
+    @classmethod
+    def from_trades(cls, ids, days, pls, initial_capital):
+        """Build a curve from closed trades in one vectorized pass"""
+        order = np.argsort(days, kind="stable")
+        curve = cls(initial_capital, capacity=max(1024, len(order)))
+        n = curve._n = len(order)
+        curve._day[:n] = np.asarray(days, dtype="float64")[order]
+        curve._pl[:n] = np.asarray(pls, dtype="float64")[order]
+        curve._id[:n] = np.asarray(ids, dtype=object)[order]
+        curve._days = dict(zip(curve._id[:n].tolist(), curve._day[:n].tolist()))
+        curve._recompute_from(0)
+        return curve
+
+    def copy(self):
+        curve = EquityCurve(self.initial_capital, capacity=len(self._day))
+        curve._n = self._n
+        for name in self._FLOAT_COLUMNS + ("_peak_at", "_id"):
+            getattr(curve, name)[:self._n] = getattr(self, name)[:self._n]
+        curve._days = dict(self._days)
+        return curve
+
+    def __len__(self):
+        return self._n
+
+    def __contains__(self, trade_id):
+        return trade_id in self._days
+
+    # -- updates -----------------------------------------------------------
+
+    def close(self, trade_id, exit_day, pl):
+        """Add (or move) a closed trade; O(1) when it exits on or after the last point"""
+        if trade_id in self._days:
+            self.reopen(trade_id)
+        n = self._n
+        if n == len(self._day):
+            self._grow()
+        self._days[trade_id] = exit_day
+
+        if n == 0 or exit_day >= self._day[n - 1]:
+            equity = (self._equity[n - 1] if n else self.initial_capital) + pl
+            peak, peak_at = (self._peak[n - 1], self._peak_at[n - 1]) if n else (self.initial_capital, -1)
+            if equity > peak:
+                peak, peak_at = equity, n
+            self._day[n], self._pl[n], self._id[n] = exit_day, pl, trade_id
+            self._equity[n], self._peak[n], self._peak_at[n] = equity, peak, peak_at
+            self._n = n + 1
+            return
+
+        k = int(np.searchsorted(self._day[:n], exit_day, side="right"))
+        for name in self._FLOAT_COLUMNS + ("_id",):
+            column = getattr(self, name)
+            column[k + 1:n + 1] = column[k:n]
+        self._day[k], self._pl[k], self._id[k] = exit_day, pl, trade_id
+        self._n = n + 1
+        self._recompute_from(k)
+
+    def reopen(self, trade_id):
+        """Remove a trade from the curve (reopened, deleted or filtered out); False if absent"""
+        exit_day = self._days.pop(trade_id, None)
+        if exit_day is None:
+            return False
+        n = self._n
+        lo = int(np.searchsorted(self._day[:n], exit_day, side="left"))
+        hi = int(np.searchsorted(self._day[:n], exit_day, side="right"))
+        k = lo + int(np.flatnonzero(self._id[lo:hi] == trade_id)[0])
+        for name in self._FLOAT_COLUMNS + ("_id",):
+            column = getattr(self, name)
+            column[k:n - 1] = column[k + 1:n]
+        self._id[n - 1] = None
+        self._n = n - 1
+        self._recompute_from(k)
+        return True
+
+    def _grow(self):
+        for name in self._FLOAT_COLUMNS + ("_peak_at", "_id"):
+            column = getattr(self, name)
+            grown = np.empty(len(column) * 2, dtype=column.dtype)
+            grown[:self._n] = column[:self._n]
+            setattr(self, name, grown)
+
+    def _recompute_from(self, k):
+        """Recompute equity / peak columns for points k.. from point k-1"""
+        n = self._n
+        if k >= n:
+            return
+        if k:
+            base_equity, base_peak, base_peak_at = self._equity[k - 1], self._peak[k - 1], self._peak_at[k - 1]
+        else:
+            base_equity, base_peak, base_peak_at = self.initial_capital, self.initial_capital, -1
+        equity = base_equity + np.cumsum(self._pl[k:n])
+        running = np.maximum.accumulate(np.concatenate(([base_peak], equity)))
+        new_peak = equity > running[:-1]
+        peak_at = np.where(new_peak, np.arange(k, n), -1)
+        self._equity[k:n] = equity
+        self._peak[k:n] = running[1:]
+        self._peak_at[k:n] = np.maximum.accumulate(np.concatenate(([base_peak_at], peak_at)))[1:]
+
+    # -- reads -------------------------------------------------------------
+
+    def drawdown(self):
+        """Drawdown per point in percent of the running peak (generateDrawdownData)"""
+        peak = self._peak[:self._n]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(peak > 0, (peak - self._equity[:self._n]) / peak * 100, 0.0)
+
+    def summary(self):
+        """Max drawdown (calculateMaxDrawdown) plus depth and duration of the worst and current drawdowns"""
+        n = self._n
+        if n == 0:
+            return {
+                "maxDrawdown": 0, "peakTroughValue": 0, "maxDurationTrades": 0, "maxDurationDays": 0,
+                "currentDrawdown": 0, "currentDurationTrades": 0, "currentDurationDays": 0,
+            }
+        drawdown = self.drawdown()
+        points = np.arange(n)
+        peak_at = self._peak_at[:n]
+        days = self._day[:n]
+        duration_trades = points - peak_at
+        duration_days = days - np.where(peak_at >= 0, days[np.maximum(peak_at, 0)], days[0])
+        duration_trades[drawdown <= 0] = 0
+        duration_days[drawdown <= 0] = 0
+        worst = int(np.argmax(drawdown))
+        return {
+            "maxDrawdown": float(drawdown[worst]),
+            "peakTroughValue": float(self._peak[worst] - self._equity[worst]) if drawdown[worst] > 0 else 0.0,
+            "maxDurationTrades": int(duration_trades.max()),
+            "maxDurationDays": float(np.nan_to_num(duration_days).max()),
+            "currentDrawdown": float(drawdown[-1]),
+            "currentDurationTrades": int(duration_trades[-1]),
+            "currentDurationDays": float(np.nan_to_num(duration_days[-1])),
+        }
+
+    def series(self, width=None):
+        """Chart payloads ``{"equity", "drawdown"}`` ({labels, values}), each at most ``width`` points
+
+        Values follow generateEquityCurveData (cumulative P&L from 0) and
+        generateDrawdownData (percent below peak), both with a 'Start' point.
+        """
+        n = self._n
+        x = np.arange(n + 1, dtype="float64")
+        cumulative = np.concatenate(([0.0], self._equity[:n] - self.initial_capital))
+        drawdown = np.concatenate(([0.0], self.drawdown()))
+
+        def chart(values):
+            keep = lttb(x, values, width) if width else np.arange(n + 1)
+            days = self._day[keep[keep > 0] - 1].astype("int64").astype("datetime64[D]").astype(str)
+            labels = (["Start"] if len(keep) and keep[0] == 0 else []) + days.tolist()
+            return {"labels": labels, "values": values[keep].tolist()}
+
+        return {"points": n + 1, "equity": chart(cumulative), "drawdown": chart(drawdown)}
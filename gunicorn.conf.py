@@ -0,0 +1,18 @@
+"""
+Gunicorn settings for the NSE Stock Price API
+    NSE_QUOTE_TABLE=/dev/shm/nse_quotes.tbl gunicorn -c gunicorn.conf.py nse_stock_api:app
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+
+def post_worker_init(worker):
+    # Each worker either becomes the single refresher (writing the shared
+    # quote table) or a reader of it; see nse_stock_api.start_worker
+    import nse_stock_api
+    nse_stock_api.start_worker()
@@ -0,0 +1,184 @@
+"""
+Historical OHLCV store for the NSE Stock Price API
+Daily bars live on disk as one ``<SYMBOL>.npy`` per symbol: a (6, n)
+float64 array whose rows are the date/open/high/low/close/volume columns,
+each contiguous, sorted by date and opened memory-mapped. Updates fetch
+only bars newer than the last stored date and replace the file atomically.
+
+Update from the command line:
+    python history_store.py RELIANCE.NS TCS.NS      (default: nse_stock_api.NSE_STOCKS)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import logging
+import os
+import sys
+import tempfile
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ("date", "open", "high", "low", "close", "volume")
+DATE, OPEN, HIGH, LOW, CLOSE, VOLUME = range(len(COLUMNS))
+
+EPOCH = date(1970, 1, 1)
+
+
+def to_day(value):
+    """date / 'YYYY-MM-DD' -> days since 1970-01-01"""
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    return (value - EPOCH).days
+
+
+def day_strings(days):
+    """Array of day numbers -> list of 'YYYY-MM-DD'"""
+    return np.asarray(days, dtype="int64").astype("datetime64[D]").astype(str).tolist()
+
+
+def _yf_history(symbol, start=None, period=None):
+    import yfinance as yf
+    if start is not None:
+        return yf.Ticker(symbol).history(start=start, interval="1d", auto_adjust=False)
+    return yf.Ticker(symbol).history(period=period, interval="1d", auto_adjust=False)
+
+
+def frame_to_bars(hist):
+    """yfinance history DataFrame -> (6, n) bar array"""
+    if hist is None or hist.empty:
+        return np.empty((len(COLUMNS), 0))
+    days = np.asarray(hist.index.date, dtype="datetime64[D]").astype("int64").astype("float64")
+    bars = np.vstack([
+        days,
+        hist["Open"].to_numpy(dtype="float64"),
+        hist["High"].to_numpy(dtype="float64"),
+        hist["Low"].to_numpy(dtype="float64"),
+        hist["Close"].to_numpy(dtype="float64"),
+        hist["Volume"].to_numpy(dtype="float64") if "Volume" in hist.columns else np.zeros(len(hist)),
+    ])
+    return bars[:, ~np.isnan(bars[CLOSE])]
+
+
+class HistoryStore:
+    """Per-symbol columnar daily bars under ``root``"""
+
+    def __init__(self, root, fetch_fn=None, backfill_period="5y"):
+        self.root = root
+        self.fetch_fn = fetch_fn or _yf_history  # fetch_fn(symbol, start=..., period=...) -> DataFrame
+        self.backfill_period = backfill_period
+        self._maps = {}  # symbol -> (stat key, memory-mapped array)
+        self._write_locks = {}
+        self._locks_guard = threading.Lock()
+
+    def path(self, symbol):
+        return os.path.join(self.root, symbol.replace("/", "_") + ".npy")
+
+    def symbols(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name[:-4] for name in os.listdir(self.root) if name.endswith(".npy"))
+
+    def load(self, symbol):
+        """Memory-mapped (6, n) bars for a symbol, or None if nothing is stored"""
+        path = self.path(symbol)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._maps.pop(symbol, None)
+            return None
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached = self._maps.get(symbol)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        bars = np.load(path, mmap_mode="r")
+        self._maps[symbol] = (key, bars)
+        return bars
+
+    def last_date(self, symbol):
+        bars = self.load(symbol)
+        if bars is None or bars.shape[1] == 0:
+            return None
+        return EPOCH + timedelta(days=int(bars[DATE, -1]))
+
+    def range(self, symbol, start=None, end=None):
+        """Bars with start <= date <= end (inclusive; None = open-ended) as a (6, k) view"""
+        bars = self.load(symbol)
+        if bars is None:
+            return None
+        dates = bars[DATE]
+        lo = 0 if start is None else int(np.searchsorted(dates, to_day(start), side="left"))
+        hi = len(dates) if end is None else int(np.searchsorted(dates, to_day(end), side="right"))
+        return bars[:, lo:hi]
+
+    def append(self, symbol, new_bars):
+        """Merge new bars in (newer dates win) and atomically replace the file; returns rows added"""
+        with self._lock_for(symbol):
+            existing = self.load(symbol)
+            if new_bars.shape[1] == 0:
+                return 0
+            if existing is None or existing.shape[1] == 0:
+                merged = new_bars
+            else:
+                keep = existing[:, existing[DATE] < new_bars[DATE, 0]]
+                merged = np.hstack([keep, new_bars])
+            order = np.argsort(merged[DATE], kind="stable")
+            merged = np.ascontiguousarray(merged[:, order])
+            added = merged.shape[1] - (0 if existing is None else existing.shape[1])
+
+            os.makedirs(self.root, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=".history-", suffix=".npy", dir=self.root)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.save(f, merged)
+                os.replace(tmp_path, self.path(symbol))
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+            return added
+
+    def update(self, symbol):
+        """Fetch only bars newer than what is stored (or backfill); returns rows added"""
+        last = self.last_date(symbol)
+        if last is None:
+            hist = self.fetch_fn(symbol, period=self.backfill_period)
+        else:
+            # Re-fetch the last stored day too: it may have been a partial intraday bar
+            hist = self.fetch_fn(symbol, start=last.isoformat())
+        return self.append(symbol, frame_to_bars(hist))
+
+    def update_many(self, symbols, max_workers=8):
+        """Incrementally update several symbols concurrently: {symbol: rows added or None on error}"""
+        def safe_update(symbol):
+            try:
+                return self.update(symbol)
+            except Exception as e:
+                logger.error(f"Error updating history for {symbol}: {str(e)}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="history") as pool:
+            return dict(zip(symbols, pool.map(safe_update, symbols)))
+
+    def _lock_for(self, symbol):
+        with self._locks_guard:
+            return self._write_locks.setdefault(symbol, threading.Lock())
+
+
+def bars_payload(bars):
+    """(6, k) bars -> columnar JSON-ready dict"""
+    payload = {"date": day_strings(bars[DATE])}
+    for i, column in enumerate(COLUMNS[1:], start=1):
+        values = bars[i]
+        payload[column] = values.astype("int64").tolist() if column == "volume" else np.round(values, 2).tolist()
+    return payload
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    import nse_stock_api
+    store = nse_stock_api.history_store
+    targets = sys.argv[1:] or nse_stock_api.NSE_STOCKS
+    for symbol, added in store.update_many(list(dict.fromkeys(targets))).items():
+        logger.info(f"{symbol}: {'error' if added is None else f'+{added} bars'}")
@@ -0,0 +1,493 @@
+"""
+Technical-indicator scanner for the NSE universe
+Backend for the scan dashboard. The last ``WINDOW`` daily bars of every
+symbol in the history store are held as (symbols x bars) matrices, newest bar
+in the last column and shorter histories NaN-padded on the left, so every
+indicator is one NumPy expression over all symbols at once.
+
+Window indicators (SMA, Bollinger, N-day high/low, volume surge) are read off
+the trailing columns at scan time. Recursive ones (EMA, RSI, ATR) keep their
+smoothed state per symbol and advance it one bar at a time: a new bar for a
+set of symbols shifts only their rows and steps only their state.
+
+Scans are declarative: a list of ``"<left> <op> <right>"`` conditions over
+indicator names (``sma_50``, ``rsi_14``, ``high_20`` ...) or numbers, ANDed,
+plus an indicator to rank the matches by. See ``PRESETS``.
+"""
+
+import logging
+import re
+import threading
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from history_store import CLOSE, DATE, HIGH, LOW, OPEN, VOLUME, day_strings, to_day
+
+logger = logging.getLogger(__name__)
+
+# Bars kept per symbol: a year of sessions covers SMA-200 and warms up EMAs
+WINDOW = 260
+
+# Matrix rows hold these columns of the history store's bar layout
+BAR_COLUMNS = (OPEN, HIGH, LOW, CLOSE, VOLUME)
+O, H, L, C, V = range(len(BAR_COLUMNS))
+
+PRICE_FIELDS = {"open": O, "high": H, "low": L, "close": C, "volume": V}
+INDICATOR_PATTERN = re.compile(
+    r"^(sma|ema|rsi|atr|bb_upper|bb_lower|bb_width|pct_b|volume_surge|high|low|roc)_(\d+)$")
+RULE_PATTERN = re.compile(r"^\s*([\w.\-]+)\s*(crosses_above|crosses_below|<=|>=|==|<|>)\s*([\w.\-]+)\s*$")
+
+OPERATORS = {
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "==": np.equal,
+}
+
+BOLLINGER_WIDTH = 2.0
+
+PRESETS = {
+    "breakout_20": {"where": ["close > high_20", "volume_surge_20 > 1.5"], "rank": "volume_surge_20"},
+    "breakdown_20": {"where": ["close < low_20", "volume_surge_20 > 1.5"], "rank": "volume_surge_20"},
+    "oversold": {"where": ["rsi_14 < 30"], "rank": "rsi_14", "order": "asc"},
+    "overbought": {"where": ["rsi_14 > 70"], "rank": "rsi_14"},
+    "golden_cross": {"where": ["sma_50 crosses_above sma_200"], "rank": "volume_surge_20"},
+    "death_cross": {"where": ["sma_50 crosses_below sma_200"], "rank": "volume_surge_20"},
+    "bollinger_squeeze": {"where": ["bb_width_20 < 5"], "rank": "bb_width_20", "order": "asc"},
+    "volume_surge": {"where": ["volume_surge_20 > 2"], "rank": "volume_surge_20"},
+    "uptrend": {"where": ["close > ema_20", "ema_20 > sma_50", "sma_50 > sma_200"], "rank": "roc_20"},
+}
+
+
+def parse_rule(rule):
+    """``"rsi_14 < 30"`` or ``["rsi_14", "<", 30]`` -> (left, op, right); numbers become floats"""
+    if isinstance(rule, str):
+        match = RULE_PATTERN.match(rule)
+        if match is None:
+            raise ValueError(f"Cannot parse scan rule: {rule!r}")
+        rule = match.groups()
+    if len(rule) != 3:
+        raise ValueError(f"Scan rule needs <left> <op> <right>: {rule!r}")
+    left, op, right = rule
+    if op not in OPERATORS and op not in ("crosses_above", "crosses_below"):
+        raise ValueError(f"Unknown scan operator: {op}")
+    return _operand(left), op, _operand(right)
+
+
+def _operand(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        return str(value).strip().lower()
+
+
+def parse_indicator(name):
+    """``"sma_50"`` -> ("sma", 50); ValueError for names the scanner doesn't know"""
+    match = INDICATOR_PATTERN.match(name)
+    if match is None:
+        raise ValueError(f"Unknown indicator: {name}")
+    kind, n = match.group(1), int(match.group(2))
+    if n < 1:
+        raise ValueError(f"Indicator period must be positive: {name}")
+    return kind, n
+
+
+def shifted(x, k=1):
+    """Columns moved right by ``k`` (the value ``k`` bars earlier), NaN-filled"""
+    out = np.full_like(x, np.nan)
+    if k < x.shape[1]:
+        out[:, k:] = x[:, :x.shape[1] - k]
+    return out
+
+
+def rolling_extreme(x, n, reducer):
+    """``reducer`` (np.max / np.min) of each run of ``n`` columns ending at every column"""
+    out = np.full_like(x, np.nan)
+    if x.shape[1] >= n:
+        out[:, n - 1:] = reducer(sliding_window_view(x, n, axis=1), axis=2)
+    return out
+
+
+def rolling_mean(x, n):
+    """Mean of each run of ``n`` columns ending at every column; NaN until a row has n values"""
+    valid = ~np.isnan(x)
+    sums = np.cumsum(np.where(valid, x, 0.0), axis=1)
+    counts = np.cumsum(valid, axis=1)
+    sums[:, n:] -= sums[:, :-n].copy()
+    counts[:, n:] -= counts[:, :-n].copy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts == n, sums / n, np.nan)
+
+
+def smoother_input(kind, bars):
+    """Series a smoother consumes, from (5, rows, cols) bars; the first column has no prior close"""
+    close = bars[C]
+    if kind == "close":
+        return close
+    prior = np.concatenate([np.full((close.shape[0], 1), np.nan), close[:, :-1]], axis=1)
+    if kind == "gain":
+        return np.maximum(close - prior, 0.0)
+    if kind == "loss":
+        return np.maximum(prior - close, 0.0)
+    # true range
+    return np.fmax(bars[H] - bars[L], np.fmax(np.abs(bars[H] - prior), np.abs(bars[L] - prior)))
+
+
+def smooth(series, n, alpha):
+    """Every step of exponential smoothing over the columns of ``series``, seeded with the first n-bar mean"""
+    seeds = rolling_mean(series, n)
+    states = np.empty_like(series)
+    state = np.full(series.shape[0], np.nan)
+    for j in range(series.shape[1]):
+        state = np.where(np.isnan(state), seeds[:, j], state + alpha * (series[:, j] - state))
+        states[:, j] = state
+    return states
+
+
+def rsi(gain, loss):
+    return np.where(loss == 0, np.where(gain == 0, 50.0, 100.0), 100 - 100 / (1 + gain / loss))
+
+
+def indicator_series(name, bars):
+    """Full history of an indicator, (symbols x bars), from (5, symbols, bars) matrices
+
+    Each column holds the value at that bar's close, as ``IndicatorScanner.value``
+    does for the newest bar.
+    """
+    if name in PRICE_FIELDS:
+        return bars[PRICE_FIELDS[name]]
+    close = bars[C]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if name == "change_pct":
+            return (close / shifted(close) - 1) * 100
+        kind, n = parse_indicator(name)
+        if kind == "sma":
+            return rolling_mean(close, n)
+        if kind == "ema":
+            return smooth(close, n, 2.0 / (n + 1))
+        if kind == "rsi":
+            return rsi(smooth(smoother_input("gain", bars), n, 1.0 / n),
+                       smooth(smoother_input("loss", bars), n, 1.0 / n))
+        if kind == "atr":
+            return smooth(smoother_input("tr", bars), n, 1.0 / n)
+        if kind in ("bb_upper", "bb_lower", "bb_width", "pct_b"):
+            middle = rolling_mean(close, n)
+            spread = BOLLINGER_WIDTH * np.sqrt(np.maximum(rolling_mean(close * close, n) - middle * middle, 0.0))
+            upper, lower = middle + spread, middle - spread
+            return {"bb_upper": upper, "bb_lower": lower, "bb_width": (upper - lower) / middle * 100,
+                    "pct_b": (close - lower) / (upper - lower)}[kind]
+        if kind == "volume_surge":
+            return bars[V] / shifted(rolling_mean(bars[V], n))
+        if kind == "high":
+            return shifted(rolling_extreme(bars[H], n, np.max))
+        if kind == "low":
+            return shifted(rolling_extreme(bars[L], n, np.min))
+        # roc
+        return (close / shifted(close, n) - 1) * 100
+
+
+class Smoother:
+    """Exponential smoothing of one input series per symbol, seeded with the first n-bar mean
+
+    ``alpha`` is 2/(n+1) for EMA and 1/n for Wilder's smoothing (RSI, ATR).
+    ``current`` is the value at the newest bar, ``previous`` the one before.
+    """
+
+    def __init__(self, kind, n, alpha):
+        self.kind, self.n, self.alpha = kind, n, alpha
+        self.current = np.empty(0)
+        self.previous = np.empty(0)
+
+    def compute(self, bars):
+        """Run over every column of (5, rows, cols) bars: one vector step per bar"""
+        states = smooth(smoother_input(self.kind, bars), self.n, self.alpha)
+        self.current = states[:, -1].copy()
+        self.previous = states[:, -2].copy() if states.shape[1] > 1 else np.full(states.shape[0], np.nan)
+
+    def _step(self, state, x, seed):
+        return np.where(np.isnan(state), seed, state + self.alpha * (x - state))
+
+    def advance(self, rows, bars, appended):
+        """Step ``rows`` for their newest bar; ``bars`` holds their trailing columns
+
+        ``appended`` marks rows whose newest bar is new (the rest replaced an
+        intraday bar, so they re-step from the previous state).
+        """
+        series = smoother_input(self.kind, bars)
+        seed = series[:, -self.n:].mean(axis=1) if series.shape[1] >= self.n else np.full(len(rows), np.nan)
+        base = np.where(appended, self.current[rows], self.previous[rows])
+        self.previous[rows] = base
+        self.current[rows] = self._step(base, series[:, -1], seed)
+
+    def grow(self, count):
+        self.current = np.concatenate([self.current, np.full(count, np.nan)])
+        self.previous = np.concatenate([self.previous, np.full(count, np.nan)])
+
+
+class IndicatorScanner:
+    """Indicators over (symbols x bars) matrices, kept current bar by bar"""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.symbols = []
+        self.loaded_at = None
+        self._rows = {}
+        self._bars = np.full((len(BAR_COLUMNS), 0, window), np.nan)
+        self._day = np.empty(0)                # newest bar's day per symbol (NaN if none)
+        self._smoothers = {}                   # (kind, n, alpha) -> Smoother
+        self._values = {}                      # (name, lag) -> vector, until the next update
+        self._lock = threading.RLock()
+        self._primed = False
+
+    # -- loading -----------------------------------------------------------
+
+    def load(self, store, symbols=None):
+        """(Re)build the matrices from a HistoryStore (every stored symbol by default)"""
+        symbols = list(dict.fromkeys(symbols if symbols is not None else store.symbols()))
+        bars = np.full((len(BAR_COLUMNS), len(symbols), self.window), np.nan)
+        day = np.full(len(symbols), np.nan)
+        for row, symbol in enumerate(symbols):
+            stored = store.load(symbol)
+            if stored is not None and stored.shape[1]:
+                tail = stored[:, -self.window:]
+                bars[:, row, -tail.shape[1]:] = tail[list(BAR_COLUMNS)]
+                day[row] = tail[DATE, -1]
+        with self._lock:
+            self.symbols = symbols
+            self._rows = {symbol: row for row, symbol in enumerate(symbols)}
+            self._bars, self._day = bars, day
+            for smoother in self._smoothers.values():
+                smoother.compute(self._bars)
+            self._values = {}
+            self.loaded_at = time.time()
+        logger.info(f"Indicator scanner loaded {len(symbols)} symbols")
+
+    def reload(self, store, symbols):
+        """Re-read some symbols from the store (e.g. after a history refresh)"""
+        if not symbols:
+            return
+        with self._lock:
+            rows = self._ensure_rows(symbols)
+            for row, symbol in zip(rows, symbols):
+                stored = store.load(symbol)
+                self._bars[:, row] = np.nan
+                self._day[row] = np.nan
+                if stored is not None and stored.shape[1]:
+                    tail = stored[:, -self.window:]
+                    self._bars[:, row, -tail.shape[1]:] = tail[list(BAR_COLUMNS)]
+                    self._day[row] = tail[DATE, -1]
+            for smoother in self._smoothers.values():
+                part = Smoother(smoother.kind, smoother.n, smoother.alpha)
+                part.compute(self._bars[:, rows])
+                smoother.current[rows], smoother.previous[rows] = part.current, part.previous
+            self._values = {}
+
+    def _ensure_rows(self, symbols):
+        """Row numbers for ``symbols``, appending empty rows for new ones"""
+        new = [s for s in dict.fromkeys(symbols) if s not in self._rows]
+        if new:
+            for symbol in new:
+                self._rows[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+            padding = np.full((len(BAR_COLUMNS), len(new), self.window), np.nan)
+            self._bars = np.concatenate([self._bars, padding], axis=1)
+            self._day = np.concatenate([self._day, np.full(len(new), np.nan)])
+            for smoother in self._smoothers.values():
+                smoother.grow(len(new))
+        return np.array([self._rows[s] for s in symbols], dtype="int64")
+
+    # -- incremental updates -----------------------------------------------
+
+    def update(self, bars):
+        """Apply the newest bar per symbol: ``{symbol: (day, open, high, low, close, volume)}``
+
+        A bar dated after a symbol's last one is appended (its row shifts left
+        by one column); a bar for the same day replaces the last column, as a
+        live intraday bar does; older bars are ignored. Returns the number of
+        symbols updated.
+        """
+        if not bars:
+            return 0
+        with self._lock:
+            symbols = list(bars)
+            rows = self._ensure_rows(symbols)
+            values = np.array([bars[s] for s in symbols], dtype="float64")
+            days = values[:, 0]
+            last = self._day[rows]
+            appended = np.isnan(last) | (days > last)
+            keep = appended | (days == last)
+            rows, values, appended = rows[keep], values[keep], appended[keep]
+            if not len(rows):
+                return 0
+
+            shifted = rows[appended]
+            if len(shifted):
+                self._bars[:, shifted, :-1] = self._bars[:, shifted, 1:]
+            self._bars[:, rows, -1] = values[:, 1:].T
+            self._day[rows] = values[:, 0]
+
+            for smoother in self._smoothers.values():
+                # the n-bar seed plus one prior close is all a step can need
+                trailing = self._bars[:, rows, -(smoother.n + 1):]
+                smoother.advance(rows, trailing, appended)
+            self._values = {}
+            return len(rows)
+
+    def on_publish(self, snapshot):
+        """QuoteCache listener: fold the changed symbols' live bars in
+
+        Quotes carry the day's open/high/low/close/volume plus ``trade_date``.
+        The first snapshot seen is taken whole.
+        """
+        if self.loaded_at is None:
+            return
+        if not self._primed:
+            changed = snapshot.data.keys()
+            self._primed = True
+        elif snapshot.diffs and snapshot.diffs[-1][1] == snapshot.generation:
+            changed = snapshot.diffs[-1][2]
+        else:
+            return
+        bars = {}
+        for symbol in changed:
+            quote = snapshot.data.get(symbol)
+            if quote is None or not quote.get("trade_date"):
+                continue
+            bars[symbol] = (to_day(quote["trade_date"]), quote["open"], quote["high"], quote["low"],
+                            quote["price"], quote["volume"])
+        self.update(bars)
+
+    # -- indicators --------------------------------------------------------
+
+    def _smoother(self, kind, n, alpha):
+        key = (kind, n, alpha)
+        smoother = self._smoothers.get(key)
+        if smoother is None:
+            smoother = self._smoothers[key] = Smoother(kind, n, alpha)
+            smoother.compute(self._bars)
+        return smoother
+
+    def _window(self, column, n, lag, before=False):
+        """The ``n`` columns ending at bar ``-1-lag`` (or just before it)"""
+        end = self.window - lag - (1 if before else 0)
+        if n > end or n < 1:
+            return np.full((len(self.symbols), 1), np.nan)
+        return self._bars[column, :, end - n:end]
+
+    def value(self, name, lag=0):
+        """Indicator vector over all symbols at bar ``-1-lag`` (0 = newest, 1 = the one before)"""
+        key = (name, lag)
+        with self._lock:
+            cached = self._values.get(key)
+            if cached is None:
+                cached = self._values[key] = self._compute(name, lag)
+            return cached
+
+    def _compute(self, name, lag):
+        if name in PRICE_FIELDS:
+            return self._bars[PRICE_FIELDS[name], :, -1 - lag]
+        if name == "change_pct":
+            close = self._window(C, 2, lag)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return (close[:, -1] / close[:, 0] - 1) * 100
+        kind, n = parse_indicator(name)
+        if kind in ("ema", "rsi", "atr") and lag > 1:
+            raise ValueError(f"{name} is only kept for the last two bars")
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if kind == "sma":
+                return self._window(C, n, lag).mean(axis=1)
+            if kind == "ema":
+                smoother = self._smoother("close", n, 2.0 / (n + 1))
+                return smoother.current if lag == 0 else smoother.previous
+            if kind == "rsi":
+                gain, loss = self._smoother("gain", n, 1.0 / n), self._smoother("loss", n, 1.0 / n)
+                return rsi(gain.current, loss.current) if lag == 0 else rsi(gain.previous, loss.previous)
+            if kind == "atr":
+                smoother = self._smoother("tr", n, 1.0 / n)
+                return smoother.current if lag == 0 else smoother.previous
+            if kind in ("bb_upper", "bb_lower", "bb_width", "pct_b"):
+                closes = self._window(C, n, lag)
+                middle, spread = closes.mean(axis=1), BOLLINGER_WIDTH * closes.std(axis=1)
+                upper, lower = middle + spread, middle - spread
+                if kind == "bb_upper":
+                    return upper
+                if kind == "bb_lower":
+                    return lower
+                if kind == "bb_width":
+                    return (upper - lower) / middle * 100
+                return (self._bars[C, :, -1 - lag] - lower) / (upper - lower)
+            if kind == "volume_surge":
+                return self._bars[V, :, -1 - lag] / self._window(V, n, lag, before=True).mean(axis=1)
+            if kind == "high":
+                return self._window(H, n, lag, before=True).max(axis=1)
+            if kind == "low":
+                return self._window(L, n, lag, before=True).min(axis=1)
+            # roc
+            closes = self._window(C, n + 1, lag)
+            return (closes[:, -1] / closes[:, 0] - 1) * 100
+
+    # -- scanning ----------------------------------------------------------
+
+    def _operand_values(self, operand, lag):
+        return operand if isinstance(operand, float) else self.value(operand, lag)
+
+    def scan(self, where, rank=None, order="desc", limit=50, fields=None, symbols=None):
+        """Symbols matching every rule in ``where``, ranked by the ``rank`` indicator
+
+        Rules are strings (``"close > sma_50"``, or several joined by ``;``)
+        or ``[left, op, right]`` triples; ``crosses_above`` / ``crosses_below`` compare the newest bar
+        with the one before. Symbols without enough history for a rule never
+        match it. Raises ValueError for unknown indicators or malformed rules.
+        """
+        started = time.perf_counter()
+        if isinstance(where, str):
+            where = [rule for rule in where.split(";") if rule.strip()]
+        rules = [parse_rule(rule) for rule in where]
+        with self._lock:
+            matched = np.ones(len(self.symbols), dtype=bool)
+            if symbols is not None:
+                matched &= np.isin(np.array(self.symbols, dtype=object), list(symbols))
+            with np.errstate(invalid="ignore"):
+                for left, op, right in rules:
+                    now_left, now_right = self._operand_values(left, 0), self._operand_values(right, 0)
+                    if op in OPERATORS:
+                        matched &= OPERATORS[op](now_left, now_right)
+                        continue
+                    before_left, before_right = self._operand_values(left, 1), self._operand_values(right, 1)
+                    if op == "crosses_above":
+                        matched &= (now_left > now_right) & (before_left <= before_right)
+                    else:
+                        matched &= (now_left < now_right) & (before_left >= before_right)
+
+            rows = np.flatnonzero(matched)
+            if rank is not None:
+                scores = self.value(rank)[rows]
+                # NaN scores rank last either way
+                keys = np.where(np.isnan(scores), np.inf, -scores if order != "asc" else scores)
+                rows = rows[np.argsort(keys, kind="stable")]
+            rows = rows[:limit] if limit is not None else rows
+
+            names = list(dict.fromkeys(
+                (fields or []) + ["close"] + [o for rule in rules for o in (rule[0], rule[2]) if isinstance(o, str)]
+                + ([rank] if rank else [])))
+            columns = {name: np.round(self.value(name)[rows], 2).tolist() for name in names}
+            dates = day_strings(np.nan_to_num(self._day[rows]))
+            results = []
+            for i, row in enumerate(rows.tolist()):
+                entry = {"symbol": self.symbols[row], "date": dates[i]}
+                for name in names:
+                    value = columns[name][i]
+                    entry[name] = None if value != value else value
+                results.append(entry)
+            return {
+                "matched": int(matched.sum()),
+                "scanned": len(self.symbols),
+                "results": results,
+                "seconds": round(time.perf_counter() - started, 4),
+            }
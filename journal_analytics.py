@@ -0,0 +1,366 @@
+"""
+Journal analytics engine for Trading Journal Pro
+Server-side port of calculateEnhancedAnalyticsMetrics,
+calculateStrategyPerformance and generateMonthlyDataChronological from
+app.js. Trades are converted once into columnar NumPy arrays (TradeFrame);
+every metric is then a handful of vectorized passes, and results are
+cached per (trade-set version, filter). Equity curves are cached the same
+way and can be advanced from an earlier version by a list of changed trades.
+"""
+
+from collections import OrderedDict
+import threading
+
+import numpy as np
+import pandas as pd
+
+from equity_curve import EquityCurve
+
+# Same constants as the TradingJournalPro constructor in app.js
+INITIAL_CAPITAL = 1000000
+RISK_FREE_RATE = 6.0
+
+SECONDS_PER_DAY = 86400.0
+MONTH_NAMES = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def _to_float(values):
+    """JS-style numeric coercion: missing / unparsable -> NaN"""
+    return pd.to_numeric(pd.Series(values, dtype="object"), errors="coerce").to_numpy(dtype="float64")
+
+
+def _to_days(values):
+    """Date strings -> fractional days since epoch (NaN if empty or unparsable)"""
+    parsed = pd.to_datetime(pd.Series(values, dtype="object"), errors="coerce", format="mixed")
+    seconds = parsed.to_numpy(dtype="datetime64[s]").astype("int64").astype("float64")
+    seconds[parsed.isna().to_numpy()] = np.nan
+    return seconds / SECONDS_PER_DAY
+
+
+class TradeFrame:
+    """Columnar view of a journal trade list (app.js trade schema)"""
+
+    FIELDS = ("id", "symbol", "orderType", "entryDate", "entryPrice", "quantity",
+              "strategy", "account", "exitDate", "exitPrice")
+
+    def __init__(self, trades):
+        self._build({key: [t.get(key) for t in trades] for key in self.FIELDS})
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Build from ``{field: list}`` (e.g. TradeStore.columns()) without per-trade dicts"""
+        frame = cls.__new__(cls)
+        frame._build(columns)
+        return frame
+
+    def _build(self, columns):
+        n = len(columns["symbol"])
+        text = lambda key: np.array([v or "" for v in columns[key]], dtype=object)
+
+        self.size = n
+        self.ids = [i if v is None else v for i, v in enumerate(columns["id"])]
+        self.symbol = text("symbol")
+        self.entry_price = _to_float(columns["entryPrice"])
+        self.exit_price = _to_float(columns["exitPrice"])
+        self.quantity = _to_float(columns["quantity"])
+        self.direction = np.where(np.array(columns["orderType"], dtype=object) == "Buy", 1.0, -1.0)
+        self.entry_day = _to_days(columns["entryDate"])
+        self.exit_day = _to_days(columns["exitDate"])
+
+        # Truthiness as app.js tests it: `t.exitDate && t.exitPrice`
+        has_exit_date = text("exitDate") != ""
+        has_exit_price = np.nan_to_num(self.exit_price) != 0
+        self.has_exit_date = has_exit_date
+        self.closed = has_exit_date & has_exit_price
+
+        # calculatePL: 0 unless both exit fields are set
+        self.pl = np.where(self.closed, (self.exit_price - self.entry_price) * self.quantity * self.direction, 0.0)
+        self.pl = np.nan_to_num(self.pl)
+
+        self.strategy_names, self.strategy = np.unique(text("strategy").astype(str), return_inverse=True)
+        self.account_names, self.account = np.unique(text("account").astype(str), return_inverse=True)
+        if n == 0:
+            self.strategy = np.zeros(0, dtype=int)
+            self.account = np.zeros(0, dtype=int)
+
+    def mask(self, strategy=None, account=None, outcome=None):
+        """Boolean mask equivalent to getFilteredTrades"""
+        mask = np.ones(self.size, dtype=bool)
+        if strategy:
+            mask &= self._code_mask(self.strategy_names, self.strategy, strategy)
+        if account:
+            mask &= self._code_mask(self.account_names, self.account, account)
+        if outcome:
+            # The outcome filter only ever rejects closed trades
+            reject = {
+                "win": self.pl <= 0,
+                "loss": self.pl >= 0,
+                "breakeven": self.pl != 0,
+            }.get(outcome)
+            if reject is not None:
+                mask &= ~(self.closed & reject)
+        return mask
+
+    @staticmethod
+    def _code_mask(names, codes, value):
+        index = np.searchsorted(names, value)
+        if index >= len(names) or names[index] != value:
+            return np.zeros(len(codes), dtype=bool)
+        return codes == index
+
+
+def max_drawdown(equity):
+    """calculateMaxDrawdown: (percentage, peak-to-trough value) of an equity curve"""
+    if len(equity) < 2:
+        return 0.0, 0.0
+    peaks = np.maximum.accumulate(equity)
+    drawdowns = (peaks - equity) / peaks
+    i = int(np.argmax(drawdowns))
+    if drawdowns[i] <= 0:
+        return 0.0, 0.0
+    return float(drawdowns[i] * 100), float(peaks[i] - equity[i])
+
+
+def median(values):
+    return float(np.median(values)) if len(values) else 0.0
+
+
+def std_dev(values):
+    """calculateStandardDeviation (population)"""
+    return float(np.std(values)) if len(values) else 0.0
+
+
+def compute_metrics(frame, mask, open_prices=None, initial_capital=INITIAL_CAPITAL,
+                    risk_free_rate=RISK_FREE_RATE):
+    """calculateEnhancedAnalyticsMetrics over the trades selected by ``mask``
+
+    ``open_prices`` (symbol -> current price) values open positions; app.js
+    used a random simulated price, here a missing quote contributes 0.
+    """
+    closed = mask & frame.closed
+    open_ = mask & ~frame.closed
+    pl = frame.pl[closed]
+    total_closed = len(pl)
+
+    wins = pl[pl > 0]
+    losses = pl[pl < 0]
+    total_pl = float(pl.sum())
+    gross_profits = float(wins.sum())
+    gross_losses = float(abs(losses.sum()))
+
+    returns = pl / initial_capital * 100
+    avg_return = float(returns.mean()) if total_closed else 0.0
+    sd = std_dev(returns)
+    excess = avg_return - risk_free_rate / 252
+
+    # Equity curve in exit-date order (stable, like Array.prototype.sort)
+    order = np.argsort(frame.exit_day[closed], kind="stable")
+    equity = initial_capital + np.concatenate(([0.0], np.cumsum(pl[order])))
+    dd_pct, dd_value = max_drawdown(equity)
+
+    hold = np.ceil(frame.exit_day[closed] - frame.entry_day[closed])
+    hold = hold[~np.isnan(hold)]
+
+    open_pl = 0.0
+    if open_prices and open_.any():
+        current = np.array([open_prices.get(s, np.nan) for s in frame.symbol[open_]], dtype="float64")
+        unrealized = (current - frame.entry_price[open_]) * frame.quantity[open_] * frame.direction[open_]
+        open_pl = float(np.nansum(unrealized))
+
+    total_return = total_pl / initial_capital * 100
+    win_rate = len(wins) / total_closed if total_closed else 0
+    avg_win = gross_profits / len(wins) if len(wins) else 0
+    avg_loss = gross_losses / len(losses) if len(losses) else 0
+    return {
+        "totalTrades": int(mask.sum()),
+        "totalClosed": total_closed,
+        "totalOpen": int(open_.sum()),
+        "winRate": win_rate * 100,
+        "totalPL": total_pl,
+        "avgPL": total_pl / total_closed if total_closed else 0,
+        "profitFactor": gross_profits / gross_losses if gross_losses > 0 else 0,
+        "bestTrade": float(pl.max()) if total_closed else 0,
+        "worstTrade": float(pl.min()) if total_closed else 0,
+        "wins": len(wins),
+        "losses": len(losses),
+        "avgWin": avg_win,
+        "avgLoss": avg_loss,
+        "expectancy": win_rate * avg_win - (len(losses) / total_closed if total_closed else 0) * avg_loss,
+        "totalReturn": total_return,
+        "roi": total_return,
+        "sharpeRatio": excess / sd if sd > 0 else 0,
+        "maxDrawdown": dd_pct,
+        "peakTroughValue": dd_value,
+        "avgHoldTime": float(hold.mean()) if len(hold) else 0,
+        "medianHoldTime": median(hold),
+        "grossProfits": gross_profits,
+        "grossLosses": gross_losses,
+        "openPL": open_pl,
+    }
+
+
+def strategy_performance(frame, mask):
+    """calculateStrategyPerformance: one bincount pass per statistic"""
+    selected = mask & frame.has_exit_date & (frame.strategy_names[frame.strategy] != "")
+    codes = frame.strategy[selected]
+    pl = frame.pl[selected]
+    if len(codes) == 0:
+        return []
+    k = len(frame.strategy_names)
+
+    trades = np.bincount(codes, minlength=k)
+    total_pl = np.bincount(codes, weights=pl, minlength=k)
+    investment = np.bincount(codes, weights=frame.entry_price[selected] * frame.quantity[selected], minlength=k)
+    wins = np.bincount(codes, weights=pl > 0, minlength=k)
+    losses = np.bincount(codes, weights=pl < 0, minlength=k)
+    gross_profits = np.bincount(codes, weights=np.where(pl > 0, pl, 0), minlength=k)
+    gross_losses = -np.bincount(codes, weights=np.where(pl < 0, pl, 0), minlength=k)
+    best = np.full(k, -np.inf)
+    worst = np.full(k, np.inf)
+    np.maximum.at(best, codes, pl)
+    np.minimum.at(worst, codes, pl)
+
+    # Object.keys order: first appearance in the filtered trade list
+    _, first_seen = np.unique(codes, return_index=True)
+    result = []
+    for code in codes[np.sort(first_seen)]:
+        n = int(trades[code])
+        result.append({
+            "strategy": str(frame.strategy_names[code]),
+            "totalTrades": n,
+            "winRate": wins[code] / n * 100,
+            "totalPL": float(total_pl[code]),
+            "avgPL": float(total_pl[code] / n),
+            "roi": float(total_pl[code] / investment[code] * 100) if investment[code] > 0 else 0,
+            "profitFactor": float(gross_profits[code] / gross_losses[code]) if gross_losses[code] > 0 else 0,
+            "bestTrade": float(best[code]),
+            "worstTrade": float(worst[code]),
+            "wins": int(wins[code]),
+            "losses": int(losses[code]),
+        })
+    return result
+
+
+def monthly_pl(frame, mask):
+    """generateMonthlyDataChronological: P&L per exit month, newest first"""
+    selected = mask & frame.has_exit_date & ~np.isnan(frame.exit_day)
+    if not selected.any():
+        return {"labels": [], "values": []}
+    months = frame.exit_day[selected].astype("int64").astype("datetime64[D]").astype("datetime64[M]").astype("int64")
+    keys, inverse = np.unique(months, return_inverse=True)
+    totals = np.bincount(inverse, weights=frame.pl[selected])
+    keys, totals = keys[::-1], totals[::-1]
+    return {
+        "labels": [f"{MONTH_NAMES[m % 12]} {1970 + m // 12}" for m in keys.tolist()],
+        "values": totals.tolist(),
+    }
+
+
+def equity_curve(frame, mask, initial_capital=INITIAL_CAPITAL):
+    """EquityCurve of the closed trades selected by ``mask``"""
+    selected = mask & frame.closed & ~np.isnan(frame.exit_day)
+    ids = [frame.ids[i] for i in np.flatnonzero(selected)]
+    return EquityCurve.from_trades(ids, frame.exit_day[selected], frame.pl[selected], initial_capital)
+
+
+def apply_changes(curve, changes, strategy=None, account=None, outcome=None):
+    """Advance a curve by changed trades: closed ones are (re)placed, anything else removed"""
+    for trade in changes:
+        frame = TradeFrame([trade])
+        if trade.get("deleted") or not frame.mask(strategy, account, outcome)[0] \
+                or not frame.closed[0] or np.isnan(frame.exit_day[0]):
+            curve.reopen(frame.ids[0])
+        else:
+            curve.close(frame.ids[0], float(frame.exit_day[0]), float(frame.pl[0]))
+    return curve
+
+
+class AnalyticsEngine:
+    """Caches TradeFrames per trade-set version and results per (version, filter)"""
+
+    def __init__(self, max_frames=8, max_results=256, max_curves=32):
+        self.max_frames = max_frames
+        self.max_results = max_results
+        self.max_curves = max_curves
+        self._frames = OrderedDict()
+        self._results = OrderedDict()
+        self._curves = OrderedDict()
+        self._lock = threading.Lock()
+
+    def frame(self, version, trades_fn):
+        """TradeFrame for ``version``, building it from ``trades_fn()`` on a miss
+
+        ``trades_fn`` returns a trade list, or a TradeFrame it built itself.
+        """
+        with self._lock:
+            if version in self._frames:
+                self._frames.move_to_end(version)
+                return self._frames[version]
+        frame = trades_fn()
+        if not isinstance(frame, TradeFrame):
+            frame = TradeFrame(frame)
+        with self._lock:
+            self._frames[version] = frame
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+        return frame
+
+    def analyze(self, version, trades_fn, strategy=None, account=None, outcome=None,
+                open_prices=None, initial_capital=INITIAL_CAPITAL):
+        key = (version, strategy or "", account or "", outcome or "", initial_capital)
+        with self._lock:
+            if key in self._results and open_prices is None:
+                self._results.move_to_end(key)
+                return self._results[key]
+
+        frame = self.frame(version, trades_fn)
+        mask = frame.mask(strategy, account, outcome)
+        result = {
+            "metrics": compute_metrics(frame, mask, open_prices, initial_capital),
+            "strategies": strategy_performance(frame, mask),
+            "monthly": monthly_pl(frame, mask),
+        }
+        if open_prices is None:
+            with self._lock:
+                self._results[key] = result
+                while len(self._results) > self.max_results:
+                    self._results.popitem(last=False)
+        return result
+
+    def curve(self, version, trades_fn=None, strategy=None, account=None, outcome=None,
+              initial_capital=INITIAL_CAPITAL, base_version=None, changes=None):
+        """EquityCurve for ``version``, advanced from ``base_version`` by ``changes`` when that is cached
+
+        Returns None if neither the trades nor a cached base curve are available.
+        """
+        key = (version, strategy or "", account or "", outcome or "", initial_capital)
+        with self._lock:
+            curve = self._curves.get(key)
+            if curve is not None:
+                self._curves.move_to_end(key)
+                return curve
+            base = None
+            if base_version is not None and changes is not None:
+                base = self._curves.get((base_version,) + key[1:])
+
+        if base is not None:
+            curve = apply_changes(base.copy(), changes, strategy, account, outcome)
+        elif trades_fn is not None:
+            frame = self.frame(version, trades_fn)
+            curve = equity_curve(frame, frame.mask(strategy, account, outcome), initial_capital)
+        else:
+            return None
+        with self._lock:
+            self._curves[key] = curve
+            while len(self._curves) > self.max_curves:
+                self._curves.popitem(last=False)
+        return curve
+
+    def latest_curve_version(self, strategy=None, account=None, outcome=None, initial_capital=INITIAL_CAPITAL):
+        """Most recently used cached curve version for this filter, or None"""
+        rest = (strategy or "", account or "", outcome or "", initial_capital)
+        with self._lock:
+            for key in reversed(self._curves):
+                if key[1:] == rest:
+                    return key[0]
+        return None
@@ -0,0 +1,271 @@
+"""
+Mark-to-market engine for Trading Journal Pro
+Values open journal positions at the live quotes in the quote cache,
+replacing simulateCurrentPrice in app.js. Positions are indexed by quote
+symbol, each symbol holding its positions as NumPy columns; a cache publish
+revalues only the symbols whose quotes changed and adjusts the account
+totals by those symbols' deltas, so the work per refresh follows the
+changed symbols rather than the number of open positions.
+"""
+
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def is_open(trade):
+    """Not closed in the calculatePL sense (``exitDate && exitPrice``)"""
+    return not (trade.get("exitDate") and trade.get("exitPrice"))
+
+
+def as_number(value):
+    """Stored trade field -> float; missing is 0, anything non-numeric NaN (reported as unpriced)"""
+    if value is None or value == "":
+        return 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class SymbolBook:
+    """Open positions in one symbol as parallel columns"""
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=object)
+        self.signed_qty = np.empty(0)   # quantity, negative for shorts
+        self.entry = np.empty(0)
+        self.account = np.empty(0, dtype="int64")
+        self.price = None
+        self.pl = np.empty(0)
+        self.contribution = np.zeros(0)  # unrealized P&L per account code
+
+    def __len__(self):
+        return len(self.ids)
+
+    def extend(self, ids, signed_qty, entry, account):
+        self.ids = np.concatenate([self.ids, np.array(ids, dtype=object)])
+        self.signed_qty = np.concatenate([self.signed_qty, signed_qty])
+        self.entry = np.concatenate([self.entry, entry])
+        self.account = np.concatenate([self.account, np.asarray(account, dtype="int64")])
+
+    def remove(self, trade_id):
+        keep = self.ids != trade_id
+        self.ids, self.signed_qty = self.ids[keep], self.signed_qty[keep]
+        self.entry, self.account = self.entry[keep], self.account[keep]
+
+    def revalue(self, account_count):
+        """Recompute position P&L at ``self.price``; returns the per-account change"""
+        if self.price is None:
+            self.pl = np.full(len(self.ids), np.nan)
+            new = np.zeros(account_count)
+        else:
+            self.pl = (self.price - self.entry) * self.signed_qty
+            # a position with a non-numeric entry or quantity stays unpriced instead of poisoning its account
+            new = np.bincount(self.account, weights=np.nan_to_num(self.pl), minlength=account_count)
+        old = np.zeros(account_count)
+        old[:len(self.contribution)] = self.contribution
+        self.contribution = new
+        return new - old
+
+
+class MarkToMarket:
+    """Unrealized P&L of open trades, kept current from quote cache publishes
+
+    ``symbol_key`` maps a journal symbol ("RELIANCE") to its quote symbol
+    ("RELIANCE.NS"). ``on_update(updates, generation)`` receives
+    ``{"position:<id>": ..., "account:<name>": ..., "total": ...}`` deltas.
+    """
+
+    def __init__(self, symbol_key=None, on_update=None):
+        self.symbol_key = symbol_key or (lambda symbol: symbol)
+        self.on_update = on_update
+        self.version = None      # trade-store version the positions reflect
+        self.generation = 0      # bumped per batch of updates
+        self._lock = threading.Lock()
+        self._books = {}         # quote symbol -> SymbolBook
+        self._positions = {}     # trade id -> (quote symbol, trade dict)
+        self._accounts = []      # account code -> name
+        self._account_codes = {}
+        self._account_pl = np.zeros(0)
+        self._prices = {}        # quote symbol -> latest price
+        self.primed = False      # seen a full snapshot yet?
+
+    # -- positions ---------------------------------------------------------
+
+    def load(self, trades, version=None):
+        """Replace every position with the open ones among ``trades``"""
+        with self._lock:
+            self._books, self._positions = {}, {}
+            self._accounts, self._account_codes = [], {}
+            self._account_pl = np.zeros(0)
+            grouped = {}  # quote symbol -> ([ids], [signed qty], [entry], [account code])
+            for trade in trades:
+                if is_open(trade):
+                    symbol, columns = self._position(trade)
+                    for column, value in zip(grouped.setdefault(symbol, ([], [], [], [])), columns):
+                        column.append(value)
+            for symbol, columns in grouped.items():
+                self._books.setdefault(symbol, SymbolBook()).extend(*columns)
+            for symbol, book in self._books.items():
+                book.price = self._prices.get(symbol)
+                self._apply_delta(book.revalue(len(self._accounts)))
+            self.version = version
+            self.generation += 1
+
+    def update_trade(self, trade):
+        """Add, move or drop one trade's position (``{"id", "deleted": True}`` drops it)"""
+        with self._lock:
+            updates = self._update_trade(trade)
+            self.generation += 1
+            generation = self.generation
+        self._emit(updates, generation)
+
+    def sync(self, store):
+        """Catch up with trade-store writes (from any process) since ``self.version``"""
+        version = store.version
+        if version == self.version:
+            return
+        changes = store.changes_since(self.version) if self.version is not None else None
+        if changes is None:
+            self.load(store.open_trades(), version)
+            return
+        with self._lock:
+            updates = {}
+            for trade in changes:
+                updates.update(self._update_trade(trade))
+            self.version = version
+            self.generation += 1
+            generation = self.generation
+        self._emit(updates, generation)
+
+    def _update_trade(self, trade):
+        trade_id = trade.get("id")
+        previous = self._positions.pop(trade_id, None)
+        touched = set()
+        if previous is not None:
+            touched.add(previous[0])
+            self._books[previous[0]].remove(trade_id)
+        if not trade.get("deleted") and is_open(trade):
+            touched.add(self._add(trade))
+        updates = {}
+        if previous is not None and (trade.get("deleted") or not is_open(trade)):
+            updates[f"position:{trade_id}"] = None
+        for symbol in touched:
+            updates.update(self._revalue(symbol))
+        return updates
+
+    def _position(self, trade):
+        """Register one open trade: (quote symbol, (id, signed qty, entry, account code))"""
+        symbol = self.symbol_key(trade.get("symbol") or "")
+        account = trade.get("account") or ""
+        code = self._account_codes.get(account)
+        if code is None:
+            code = self._account_codes[account] = len(self._accounts)
+            self._accounts.append(account)
+            self._account_pl = np.append(self._account_pl, 0.0)
+        direction = 1.0 if trade.get("orderType") == "Buy" else -1.0
+        self._positions[trade.get("id")] = (symbol, trade)
+        return symbol, (trade.get("id"), as_number(trade.get("quantity")) * direction,
+                        as_number(trade.get("entryPrice")), code)
+
+    def _add(self, trade):
+        symbol, columns = self._position(trade)
+        self._books.setdefault(symbol, SymbolBook()).extend(*([value] for value in columns))
+        return symbol
+
+    # -- quotes ------------------------------------------------------------
+
+    def on_publish(self, snapshot):
+        """QuoteCache listener: revalue only the symbols changed in this generation
+
+        The first snapshot seen (e.g. the current one, passed in at startup)
+        is taken whole.
+        """
+        if not self.primed:
+            changed = snapshot.data.keys()
+            self.primed = True
+        elif snapshot.diffs and snapshot.diffs[-1][1] == snapshot.generation:
+            changed = snapshot.diffs[-1][2]
+        else:
+            return
+        with self._lock:
+            updates = {}
+            for symbol in changed:
+                quote = snapshot.data.get(symbol)
+                self._prices[symbol] = quote["price"] if quote is not None else None
+                if symbol in self._books:
+                    updates.update(self._revalue(symbol))
+            if not updates:
+                return
+            self.generation += 1
+            mtm_generation = self.generation
+        self._emit(updates, mtm_generation)
+
+    def _revalue(self, symbol):
+        """Revalue one symbol's book; returns the position / account / total updates"""
+        book = self._books[symbol]
+        book.price = self._prices.get(symbol)
+        delta = book.revalue(len(self._accounts))
+        self._apply_delta(delta)
+        updates = {f"position:{p['id']}": p for p in self._book_positions(symbol, book)}
+        for code in np.flatnonzero(delta):
+            updates[f"account:{self._accounts[code]}"] = float(self._account_pl[code])
+        updates["total"] = float(self._account_pl.sum())
+        if not len(book):
+            del self._books[symbol]
+        return updates
+
+    def _apply_delta(self, delta):
+        self._account_pl[:len(delta)] += delta
+
+    def _book_positions(self, symbol, book):
+        positions = []
+        for trade_id, pl in zip(book.ids.tolist(), book.pl.tolist()):
+            trade = self._positions[trade_id][1]
+            positions.append({
+                "id": trade_id,
+                "symbol": trade.get("symbol"),
+                "quoteSymbol": symbol,
+                "account": trade.get("account"),
+                "orderType": trade.get("orderType"),
+                "quantity": trade.get("quantity"),
+                "entryPrice": trade.get("entryPrice"),
+                "price": book.price,
+                "unrealizedPL": None if np.isnan(pl) else pl,
+            })
+        return positions
+
+    def _emit(self, updates, generation):
+        if updates and self.on_update is not None:
+            try:
+                self.on_update(updates, generation)
+            except Exception as e:
+                logger.error(f"Mark-to-market listener failed: {str(e)}")
+
+    # -- reads -------------------------------------------------------------
+
+    def symbols(self):
+        """Quote symbols with open positions"""
+        with self._lock:
+            return list(self._books)
+
+    def payload(self, account=None):
+        """Per-position, per-account and total unrealized P&L (optionally one account)"""
+        with self._lock:
+            positions = [p for symbol, book in self._books.items() for p in self._book_positions(symbol, book)
+                         if account is None or p["account"] == account]
+            accounts = {name: float(self._account_pl[code]) for code, name in enumerate(self._accounts)
+                        if account is None or name == account}
+            unpriced = sum(1 for p in positions if p["unrealizedPL"] is None)
+            return {
+                "generation": self.generation,
+                "version": self.version,
+                "total": sum(accounts.values()),
+                "accounts": accounts,
+                "positions": positions,
+                "unpriced": unpriced,
+            }
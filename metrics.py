@@ -0,0 +1,193 @@
+"""
+Prometheus-style metrics for the NSE Stock Price API
+Counters, gauges and histograms kept in process and rendered in the
+Prometheus text exposition format (version 0.0.4) for ``/metrics``, without
+a client library. Recording is a dict update under a lock (about a
+microsecond), so it is safe on hot paths; gauges can instead be computed
+from a callback at scrape time.
+
+Histogram.time() is a context manager and a decorator:
+
+    with REFRESH_SECONDS.time():
+        ...
+
+    @HOT_PATH.time("encode_stocks")
+    def encode(...):
+        ...
+"""
+
+from bisect import bisect_left
+from functools import wraps
+import math
+import threading
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds, from sub-millisecond encodes to minute-long refreshes
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Registry:
+    """The metrics rendered by one ``/metrics`` endpoint"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, names, values, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labels=(), fn=None, registry=REGISTRY):
+        """``fn()`` (gauges and counters only) returns the value at scrape time: a number,
+        or {label values tuple: number}"""
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.fn = fn
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _add(self, labels, amount):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def label_sets(self):
+        """Label value tuples recorded so far"""
+        return list(self._values)
+
+    def samples(self):
+        values = self.fn() if self.fn is not None else dict(self._values)
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            if value is not None:
+                yield "", self.labels, labels, value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        self._add(labels, amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        self._add(labels, amount)
+
+
+class Timer:
+    """Observe elapsed seconds into a histogram, as a context manager or a decorator"""
+
+    __slots__ = ("histogram", "labels", "_started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self._started, *self.labels)
+
+    def __call__(self, fn):
+        histogram, labels = self.histogram, self.labels
+
+        @wraps(fn)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, *labels)
+        return timed
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labels, registry=registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # per-bucket (not cumulative) counts, then sum and count
+                series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, *labels):
+        return Timer(self, labels)
+
+    def count(self, *labels):
+        series = self._values.get(labels)
+        return series[-1] if series else 0
+
+    def samples(self):
+        with self._lock:
+            values = {labels: list(series) for labels, series in self._values.items()}
+        names = self.labels + ("le",)
+        for labels, series in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                yield "_bucket", names, labels + (_format_value(bound),), cumulative
+            yield "_sum", self.labels, labels, series[-2]
+            yield "_count", self.labels, labels, series[-1]
@@ -5,15 +5,42 @@ NSE Stock Price API Server
 Fetches real-time stock data from yfinance for Trading Journal Pro
 """
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 import yfinance as yf
 import json
 from datetime import datetime, timedelta
+import hashlib
 import logging
-from threading import Timer
+import math
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import time
 import os
 
+import numpy as np
+
+from backtester import BarMatrix, backtest
+import columnar
+from correlation_engine import DEFAULT_THRESHOLD as CORRELATION_THRESHOLD, CorrelationEngine, exposure
+from history_store import CLOSE, HistoryStore, bars_payload
+from indicator_scanner import PRESETS as SCAN_PRESETS, IndicatorScanner
+from journal_analytics import AnalyticsEngine, TradeFrame
+from mark_to_market import MarkToMarket
+import metrics
+from optimizer import Sweep
+from risk_engine import RiskEngine, symbol_returns
+from trade_import import import_csv
+from prebuilt_response import PrebuiltBody
+from quote_cache import QuoteCache, per_generation
+from quote_stream import QuoteBroker, format_sse
+from quote_table import SharedQuoteWorker
+from snapshot_file import read_snapshot, write_snapshot
+from symbol_registry import SingleFlight, SymbolRegistry
+from upstream_client import UpstreamClient, UpstreamRejected
+from refresh_scheduler import RefreshScheduler, is_market_open
+from trade_store import FIELDS as TRADE_FIELDS, INSERT_COLUMNS, TradeStore
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all domains
 
@@ -21,9 +48,102 @@ CORS(app)  # Enable CORS for all domains
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Global stock data cache
-stock_cache = {}
-last_update = None
+# Prometheus metrics (/metrics); gauges are read from live objects at scrape time
+HOT_PATH_SECONDS = metrics.Histogram("nse_hot_path_seconds", "Time spent in instrumented hot paths", ("path",))
+REFRESH_SECONDS = metrics.Histogram("nse_refresh_duration_seconds", "Duration of a full refresh cycle")
+REFRESH_FAILURES = metrics.Counter("nse_refresh_failures_total", "Refresh cycles that fetched no symbol")
+# Upstream series are per symbol only for watched and held symbols; requested ones share "other"
+UPSTREAM_SECONDS = metrics.Histogram("nse_upstream_request_seconds", "yfinance request latency per symbol",
+                                     ("symbol",), buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+UPSTREAM_ERRORS = metrics.Counter("nse_upstream_errors_total", "Failed yfinance requests per symbol (error or empty)",
+                                  ("symbol", "kind"))
+HTTP_SECONDS = metrics.Histogram("nse_http_request_seconds", "Time to build a response, per route",
+                                 ("route", "method"))
+HTTP_BYTES = metrics.Histogram("nse_http_response_bytes", "Response body size, per route", ("route",),
+                               buckets=metrics.SIZE_BUCKETS)
+HTTP_RESPONSES = metrics.Counter("nse_http_responses_total", "Responses per route and status", ("route", "status"))
+HTTP_CONDITIONAL = metrics.Counter("nse_http_conditional_requests_total",
+                                   "Requests with If-None-Match / If-Modified-Since, by whether they got a 304",
+                                   ("route", "result"))
+
+def not_modified_ratio():
+    routes = {route for route, _ in HTTP_CONDITIONAL.label_sets()}
+    return {(route,): HTTP_CONDITIONAL.value(route, "hit") /
+            (HTTP_CONDITIONAL.value(route, "hit") + HTTP_CONDITIONAL.value(route, "miss")) for route in routes}
+
+metrics.Gauge("nse_http_not_modified_ratio", "Share of conditional requests answered 304, per route", ("route",),
+              fn=not_modified_ratio)
+
+def observe_request(route, method, status, seconds, conditional=False):
+    """Record one response's route, status and latency (its size goes to observe_response_size)"""
+    HTTP_SECONDS.observe(seconds, route, method)
+    HTTP_RESPONSES.inc(route, str(status))
+    if conditional:
+        HTTP_CONDITIONAL.inc(route, "hit" if status == 304 else "miss")
+
+def observe_response_size(route, size):
+    HTTP_BYTES.observe(size, route)
+
+@HOT_PATH_SECONDS.time("encode_stocks")
+def encode_stocks_snapshot(snapshot):
+    """Build the /api/stocks body once per cache generation"""
+    return PrebuiltBody({
+        "status": "success",
+        "data": dict(snapshot.data),
+        "last_updated": snapshot.last_update.isoformat() if snapshot.last_update else None,
+        "total_stocks": snapshot.available
+    }, last_modified=datetime.fromtimestamp(snapshot.published_at) if snapshot.published_at else None)
+
+# Global stock data cache (readers use quote_cache.snapshot())
+quote_cache = QuoteCache(encoder=encode_stocks_snapshot)
+
+# Push stream subscribers are fed from every cache publish
+quote_broker = QuoteBroker()
+quote_cache.add_listener(HOT_PATH_SECONDS.time("stream_publish")(quote_broker.publish))
+STREAM_KEEPALIVE = float(os.environ.get('STREAM_KEEPALIVE', 15))
+
+# Upstream fetch tuning
+FETCH_MAX_WORKERS = int(os.environ.get('FETCH_MAX_WORKERS', 32))
+FETCH_TIMEOUT = float(os.environ.get('FETCH_TIMEOUT', 10))
+
+# Upstream guard shared by every yfinance call: request budget (per second and burst),
+# circuit breaker (consecutive failures, seconds open) and per-symbol backoff (seconds)
+UPSTREAM_RATE = float(os.environ.get('NSE_UPSTREAM_RATE', 20))
+UPSTREAM_BURST = int(os.environ.get('NSE_UPSTREAM_BURST', 40))
+UPSTREAM_FAILURES = int(os.environ.get('NSE_UPSTREAM_FAILURES', 10))
+UPSTREAM_RESET = float(os.environ.get('NSE_UPSTREAM_RESET', 60))
+SYMBOL_BACKOFF = float(os.environ.get('NSE_SYMBOL_BACKOFF', 30))
+SYMBOL_BACKOFF_MAX = float(os.environ.get('NSE_SYMBOL_BACKOFF_MAX', 1800))
+
+# Multi-process sharing (Gunicorn): one worker refreshes into this table
+QUOTE_TABLE_PATH = os.environ.get('NSE_QUOTE_TABLE')
+QUOTE_TABLE_CAPACITY = int(os.environ.get('NSE_QUOTE_TABLE_CAPACITY', 4096))
+
+# Last published generation is kept here for warm restarts ('' disables)
+CACHE_FILE = os.environ.get('NSE_CACHE_FILE', 'nse_quote_cache.json')
+
+# Daily OHLCV bars, stored per symbol as memory-mapped columns
+HISTORY_DIR = os.environ.get('NSE_HISTORY_DIR', 'history')
+
+# Journal trades (SQLite, WAL mode)
+TRADE_DB = os.environ.get('NSE_TRADE_DB', 'trades.db')
+
+# Backtest processes per parameter sweep (0 = one per CPU)
+OPTIMIZER_WORKERS = int(os.environ.get('NSE_OPTIMIZER_WORKERS', 0))
+
+# Symbol universe: optional file of extra symbols (one per line, or a CSV with a SYMBOL
+# column); symbols outside NSE_STOCKS and open positions refresh only while recently requested
+SYMBOLS_FILE = os.environ.get('NSE_SYMBOLS_FILE')
+HOT_SYMBOL_TTL = float(os.environ.get('NSE_HOT_SYMBOL_TTL', 900))
+MAX_BULK_SYMBOLS = int(os.environ.get('NSE_MAX_BULK_SYMBOLS', 2000))
+
+# Rolling correlation: benchmark index (stored alongside the stocks) and window in days
+BENCHMARK_SYMBOL = os.environ.get('NSE_BENCHMARK_SYMBOL', '^NSEI')
+CORRELATION_WINDOW = int(os.environ.get('NSE_CORRELATION_WINDOW', 60))
+
+# Refresh cadence (seconds)
+REFRESH_INTERVAL_OPEN = float(os.environ.get('REFRESH_INTERVAL_OPEN', 60))
+REFRESH_INTERVAL_CLOSED = float(os.environ.get('REFRESH_INTERVAL_CLOSED', 1800))
 
 # NSE Stock symbols (Top 50 most traded)
 NSE_STOCKS = [
@@ -38,129 +158,1189 @@ NSE_STOCKS = [
     "EICHERMOT.NS", "APOLLOHOSP.NS", "BPCL.NS", "HINDALCO.NS",
     "DIVISLAB.NS", "HEROMOTOCO.NS", "SHREECEM.NS", "BAJAJ-AUTO.NS",
     "ADANIPORTS.NS", "TATASTEEL.NS", "INDUSINDBK.NS", "UPL.NS",
-    "NESTLEIND.NS", "HDFCLIFE.NS", "SBILIFE.NS"
+    "HDFCLIFE.NS", "SBILIFE.NS"
 ]
 
-def fetch_stock_data(symbols):
-    """Fetch stock data from yfinance"""
-    stock_data = {}
+# Sector of each watched symbol, for exposure grouping
+NSE_SECTORS = {
+    "RELIANCE.NS": "Energy", "ONGC.NS": "Energy", "BPCL.NS": "Energy", "COALINDIA.NS": "Energy",
+    "NTPC.NS": "Power", "POWERGRID.NS": "Power",
+    "TCS.NS": "IT", "INFY.NS": "IT", "HCLTECH.NS": "IT", "WIPRO.NS": "IT", "TECHM.NS": "IT",
+    "HDFCBANK.NS": "Banking", "ICICIBANK.NS": "Banking", "SBIN.NS": "Banking", "KOTAKBANK.NS": "Banking",
+    "AXISBANK.NS": "Banking", "INDUSINDBK.NS": "Banking",
+    "BAJFINANCE.NS": "Financial Services", "BAJAJFINSV.NS": "Financial Services",
+    "HDFCLIFE.NS": "Insurance", "SBILIFE.NS": "Insurance",
+    "BHARTIARTL.NS": "Telecom",
+    "ITC.NS": "FMCG", "HINDUNILVR.NS": "FMCG", "NESTLEIND.NS": "FMCG", "BRITANNIA.NS": "FMCG",
+    "ASIANPAINT.NS": "Consumer Durables", "TITAN.NS": "Consumer Durables",
+    "MARUTI.NS": "Automobile", "M&M.NS": "Automobile", "TATAMOTORS.NS": "Automobile",
+    "EICHERMOT.NS": "Automobile", "HEROMOTOCO.NS": "Automobile", "BAJAJ-AUTO.NS": "Automobile",
+    "SUNPHARMA.NS": "Healthcare", "DRREDDY.NS": "Healthcare", "CIPLA.NS": "Healthcare",
+    "DIVISLAB.NS": "Healthcare", "APOLLOHOSP.NS": "Healthcare",
+    "ULTRACEMCO.NS": "Construction Materials", "GRASIM.NS": "Construction Materials",
+    "SHREECEM.NS": "Construction Materials",
+    "JSWSTEEL.NS": "Metals & Mining", "HINDALCO.NS": "Metals & Mining", "TATASTEEL.NS": "Metals & Mining",
+    "ADANIENT.NS": "Metals & Mining",
+    "LT.NS": "Construction", "ADANIPORTS.NS": "Services", "UPL.NS": "Chemicals",
+}
+
+def normalize_symbol(symbol):
+    """'reliance' -> 'RELIANCE.NS' (indices such as '^NSEI' are left as they are)"""
+    symbol = symbol.strip().upper()
+    if not symbol.endswith('.NS') and not symbol.startswith('^'):
+        symbol += '.NS'
+    return symbol
+
+# Known symbols and their refresh tier; on-demand fetches of one symbol are coalesced
+symbol_registry = SymbolRegistry(NSE_STOCKS, symbol_key=lambda symbol: normalize_symbol(symbol),
+                                 hot_ttl=HOT_SYMBOL_TTL)
+if SYMBOLS_FILE:
+    symbol_registry.load(SYMBOLS_FILE)
+quote_fetches = SingleFlight()
+
+def record_upstream(symbol, seconds, outcome):
+    label = symbol if symbol_registry.watched(symbol) else "other"
+    UPSTREAM_SECONDS.observe(seconds, label)
+    if outcome != "ok":
+        UPSTREAM_ERRORS.inc(label, outcome)
+
+# Every upstream call (refresh, on-demand, history) goes through one budget and breaker;
+# while the breaker is open cached quotes are served, flagged stale
+upstream = UpstreamClient(rate=UPSTREAM_RATE, burst=UPSTREAM_BURST, failure_threshold=UPSTREAM_FAILURES,
+                          reset_timeout=UPSTREAM_RESET, backoff_base=SYMBOL_BACKOFF,
+                          backoff_max=SYMBOL_BACKOFF_MAX, on_result=record_upstream)
+
+# Local historical bar store; range queries never touch the network
+history_store = HistoryStore(HISTORY_DIR)
+_history_fetch = history_store.fetch_fn
+history_store.fetch_fn = lambda symbol, **kwargs: upstream.call(symbol, _history_fetch, symbol, **kwargs)
+
+# Indicators over every stored symbol, loaded on the first scan; live bars come from quote publishes
+indicator_scanner = IndicatorScanner()
+quote_cache.add_listener(HOT_PATH_SECONDS.time("indicators")(indicator_scanner.on_publish))
+
+trade_store = TradeStore(TRADE_DB)
+
+# Open trades valued at live quotes; each publish revalues only changed symbols
+mtm_broker = QuoteBroker()
+mark_to_market = MarkToMarket(symbol_key=lambda symbol: normalize_symbol(symbol), on_update=mtm_broker.broadcast)
+
+def mark_positions(snapshot):
+    mark_to_market.sync(trade_store)
+    mark_to_market.on_publish(snapshot)
+
+quote_cache.add_listener(HOT_PATH_SECONDS.time("mark_to_market")(mark_positions))
+
+# Rolling return covariance of held and watched symbols; quotes for an unstored day update a live row
+correlation_engine = CorrelationEngine(history_store, BENCHMARK_SYMBOL, CORRELATION_WINDOW)
+quote_cache.add_listener(HOT_PATH_SECONDS.time("correlation")(correlation_engine.on_publish))
+
+def _yf_history(symbol, timeout):
+    """Default data source: the last two daily bars for one symbol from yfinance"""
+    return yf.Ticker(symbol).history(period="2d", timeout=timeout)
+
+def upstream_history(symbol, timeout):
+    """_yf_history through the upstream guard (raises UpstreamRejected without a request)"""
+    return upstream.call(symbol, _yf_history, symbol, timeout, budget_timeout=timeout / 2)
+
+def build_quote(symbol, hist):
+    """Build the per-symbol quote dict from a history DataFrame (None if empty)"""
+    if hist is None or hist.empty:
+        return None
+
+    current_price = hist['Close'].iloc[-1]
+    prev_close = hist['Close'].iloc[-2] if len(hist) > 1 else current_price
+
+    change = current_price - prev_close
+    change_percent = (change / prev_close) * 100 if prev_close != 0 else 0
+
+    return {
+        "symbol": symbol,
+        "name": symbol.replace(".NS", ""),
+        "price": round(float(current_price), 2),
+        "previous_close": round(float(prev_close), 2),
+        "change": round(float(change), 2),
+        "change_percent": round(float(change_percent), 2),
+        "volume": int(hist['Volume'].iloc[-1]) if 'Volume' in hist.columns else 0,
+        "high": round(float(hist['High'].iloc[-1]), 2),
+        "low": round(float(hist['Low'].iloc[-1]), 2),
+        "open": round(float(hist['Open'].iloc[-1]), 2),
+        "trade_date": hist.index[-1].date().isoformat() if hasattr(hist.index[-1], "date") else None,
+        "currency": "INR",
+        "last_updated": datetime.now().isoformat(),
+        "market_status": "open" if is_market_open() else "closed"
+    }
+
+def _fetch_one(symbol, history_fn, timeout, started_at):
+    started_at[symbol] = time.monotonic()
+    return build_quote(symbol, history_fn(symbol, timeout))
+
+def fetch_stock_data(symbols, history_fn=None, max_workers=None, timeout=None, on_quote=None):
+    """Fetch stock data concurrently from yfinance (or any ``history_fn(symbol, timeout)``)
+
+    Symbols are fanned out over a bounded worker pool. ``timeout`` is handed to
+    the data source and is also enforced per symbol from the moment a worker
+    picks it up; a symbol that overruns is reported as a failure (``None``) so
+    one hung request cannot stall the whole refresh.
+
+    ``on_quote(symbol, quote_or_none)`` is called for each symbol as soon as
+    its result is known, so callers can apply updates incrementally. Symbols
+    the upstream guard refuses (breaker open, backing off, out of budget)
+    count as failures without a request.
+    """
+    history_fn = history_fn or upstream_history
+    max_workers = max_workers or FETCH_MAX_WORKERS
+    timeout = timeout or FETCH_TIMEOUT
+
+    stock_data = dict.fromkeys(symbols)  # keeps the caller's symbol order
     successful_fetches = 0
+    rejected = 0
+    started = time.monotonic()
+    started_at = {}
 
     logger.info(f"Fetching data for {len(symbols)} stocks...")
 
-    for symbol in symbols:
-        try:
-            ticker = yf.Ticker(symbol)
-            hist = ticker.history(period="2d")
-
-            if not hist.empty and len(hist) > 0:
-                current_price = hist['Close'].iloc[-1]
-                prev_close = hist['Close'].iloc[-2] if len(hist) > 1 else current_price
-
-                change = current_price - prev_close
-                change_percent = (change / prev_close) * 100 if prev_close != 0 else 0
-
-                stock_data[symbol] = {
-                    "symbol": symbol,
-                    "name": symbol.replace(".NS", ""),
-                    "price": round(float(current_price), 2),
-                    "previous_close": round(float(prev_close), 2),
-                    "change": round(float(change), 2),
-                    "change_percent": round(float(change_percent), 2),
-                    "volume": int(hist['Volume'].iloc[-1]) if 'Volume' in hist.columns else 0,
-                    "high": round(float(hist['High'].iloc[-1]), 2),
-                    "low": round(float(hist['Low'].iloc[-1]), 2),
-                    "open": round(float(hist['Open'].iloc[-1]), 2),
-                    "currency": "INR",
-                    "last_updated": datetime.now().isoformat(),
-                    "market_status": "closed" if datetime.now().weekday() > 4 else "open"
-                }
-                successful_fetches += 1
-            else:
-                stock_data[symbol] = None
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch")
+    try:
+        pending = {pool.submit(_fetch_one, symbol, history_fn, timeout, started_at): symbol
+                   for symbol in symbols}
 
-        except Exception as e:
-            logger.error(f"Error fetching {symbol}: {str(e)}")
-            stock_data[symbol] = None
+        while pending:
+            done, _ = wait(pending, timeout=min(timeout, 0.25), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                symbol = pending.pop(future)
+                try:
+                    stock_data[symbol] = future.result()
+                except UpstreamRejected as e:
+                    logger.debug(f"Skipped {symbol}: {str(e)}")
+                    stock_data[symbol] = None
+                    rejected += 1
+                except Exception as e:
+                    logger.error(f"Error fetching {symbol}: {str(e)}")
+                    stock_data[symbol] = None
+                if stock_data[symbol] is not None:
+                    successful_fetches += 1
+                if on_quote:
+                    on_quote(symbol, stock_data[symbol])
+
+            now = time.monotonic()
+            for future, symbol in list(pending.items()):
+                if symbol in started_at and now - started_at[symbol] > timeout:
+                    del pending[future]
+                    logger.error(f"Timed out fetching {symbol} after {timeout}s")
+                    if on_quote:
+                        on_quote(symbol, None)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
 
-    logger.info(f"Successfully fetched {successful_fetches}/{len(symbols)} stocks")
+    logger.info(f"Successfully fetched {successful_fetches}/{len(symbols)} stocks "
+                f"in {time.monotonic() - started:.2f}s ({rejected} refused by the upstream guard)")
     return stock_data
 
+def _apply_quote(symbol, quote):
+    quote_cache.apply(symbol, quote)
+    quote_cache.maybe_publish()
+
+@REFRESH_SECONDS.time()
 def update_stock_cache():
-    """Update the stock cache with fresh data"""
-    global stock_cache, last_update
+    """Update the stock cache with fresh data for the hot symbols (raises if every symbol failed)"""
+    try:
+        mark_to_market.sync(trade_store)
+        symbol_registry.pin(mark_to_market.symbols())
+    except Exception as e:
+        # positions only add symbols to refresh; never let them stop the quote refresh
+        logger.error(f"Could not read open positions: {str(e)}")
+    stock_data = fetch_stock_data(symbol_registry.hot(), on_quote=_apply_quote)
+    snapshot = quote_cache.mark_refreshed()
+    logger.info(f"Stock cache updated at {snapshot.last_update} (generation {snapshot.generation})")
+
+    if not any(stock_data.values()):
+        REFRESH_FAILURES.inc()
+        raise RuntimeError(f"No data fetched for any of {len(stock_data)} stocks")
 
+# The only refresh loop; /api/refresh wakes it instead of starting another
+refresh_scheduler = RefreshScheduler(
+    update_stock_cache,
+    open_interval=REFRESH_INTERVAL_OPEN,
+    closed_interval=REFRESH_INTERVAL_CLOSED,
+)
+
+def persist_snapshot(snapshot):
     try:
-        stock_cache = fetch_stock_data(NSE_STOCKS)
-        last_update = datetime.now()
-        logger.info(f"Stock cache updated at {last_update}")
+        write_snapshot(CACHE_FILE, snapshot)
+    except OSError as e:
+        logger.error(f"Could not persist quote cache to {CACHE_FILE}: {str(e)}")
 
-        # Schedule next update in 5 minutes
-        Timer(300, update_stock_cache).start()
+_persistence_enabled = False
 
-    except Exception as e:
-        logger.error(f"Error updating stock cache: {str(e)}")
-        # Retry in 1 minute on error
-        Timer(60, update_stock_cache).start()
+def enable_persistence():
+    """Warm-start from CACHE_FILE (quotes served as stale) and persist every new generation
+
+    Returns True if cached quotes were restored. Call only in the process
+    that refreshes.
+    """
+    global _persistence_enabled
+    if not CACHE_FILE or _persistence_enabled:
+        return False
+    _persistence_enabled = True
+
+    restored = False
+    started = time.monotonic()
+    try:
+        loaded = read_snapshot(CACHE_FILE)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Ignoring unreadable quote cache {CACHE_FILE}: {str(e)}")
+        loaded = None
+    if loaded is not None:
+        data, last_update, generation = loaded
+        snapshot = quote_cache.restore(data, last_update=last_update, generation=generation)
+        restored = snapshot.available > 0
+        logger.info(f"Restored {snapshot.available} cached stocks from {CACHE_FILE} "
+                    f"in {(time.monotonic() - started) * 1000:.1f}ms (served as stale until refreshed)")
+
+    quote_cache.add_listener(persist_snapshot)
+    return restored
+
+def shared_quote_worker(scheduler):
+    """SharedQuoteWorker on QUOTE_TABLE_PATH that runs ``scheduler`` while it is the writer (None if unset)"""
+    if not QUOTE_TABLE_PATH:
+        return None
+    return SharedQuoteWorker(QUOTE_TABLE_PATH, quote_cache, scheduler,
+                             capacity=QUOTE_TABLE_CAPACITY,
+                             on_writer=enable_persistence,
+                             on_request=lambda symbols: ensure_quotes(symbols),
+                             touch_interval=HOT_SYMBOL_TTL / 4)
+
+shared_worker = shared_quote_worker(refresh_scheduler)
+
+def start_worker():
+    """Start refreshing in this process, or follow the shared quote table if configured"""
+    if shared_worker is not None:
+        shared_worker.start()
+    else:
+        enable_persistence()
+        refresh_scheduler.start()
+
+def refresh_status():
+    status = refresh_scheduler.status()
+    status["role"] = shared_worker.role if shared_worker is not None else "standalone"
+    return status
+
+@app.before_request
+def sync_shared_quotes():
+    """Readers pick up the writer's latest generation before answering"""
+    if shared_worker is not None:
+        shared_worker.sync()
+
+def send_prebuilt(body):
+    """Serve a PrebuiltBody, answering conditional requests with 304"""
+    coding, payload, etag = body.select(request.headers.get('Accept-Encoding'))
+    headers = body.headers(coding, etag)
+    if body.not_modified(request.headers.get('If-None-Match'), request.headers.get('If-Modified-Since')):
+        headers.pop('Content-Type')
+        headers.pop('Content-Encoding', None)
+        return Response(status=304, headers=headers)
+    return Response(payload, status=200, headers=headers)
 
 @app.route('/api/stocks', methods=['GET'])
 def get_all_stocks():
-    """Get all cached stock data"""
-    return jsonify({
+    """Get all cached stock data (pre-serialized once per cache generation)"""
+    snapshot = quote_cache.snapshot()
+    return send_prebuilt(snapshot.encoded or encode_stocks_snapshot(snapshot))
+
+@per_generation(maxsize=64)
+@HOT_PATH_SECONDS.time("encode_changes")
+def encode_changes(snapshot, since):
+    """Build the /api/stocks/changes body for one (generation, since) pair
+
+    Symbols that changed but have since left the cache (a reader's
+    ``replace``) are left out.
+    """
+    changed = snapshot.changed_since(since)
+    full = changed is None
+    symbols = snapshot.data.keys() if full else changed
+    return PrebuiltBody({
         "status": "success",
-        "data": stock_cache,
-        "last_updated": last_update.isoformat() if last_update else None,
-        "total_stocks": len([s for s in stock_cache.values() if s is not None])
+        "generation": snapshot.generation,
+        "since": since,
+        "full": full,
+        "data": {symbol: snapshot.data[symbol] for symbol in symbols if symbol in snapshot.data},
+        "last_updated": snapshot.last_update.isoformat() if snapshot.last_update else None
+    })
+
+@app.route('/api/stocks/changes', methods=['GET'])
+def get_stock_changes():
+    """Get only the stocks that changed since a client-supplied cache generation
+
+    Falls back to the full data set (``"full": true``) when ``since`` is
+    missing, unknown or older than the retained diff history.
+    """
+    since = request.args.get('since', type=int)
+    snapshot = quote_cache.snapshot()
+    return send_prebuilt(encode_changes(snapshot, since if since is not None else -1))
+
+def needs_fetch(symbol, data):
+    """True if a lookup of ``symbol`` should go upstream: uncached, or cached but cold"""
+    return symbol_registry.valid(symbol) and (symbol not in data or symbol_registry.tier(symbol) != "hot") \
+        and not upstream.backed_off(symbol)
+
+def fetch_on_demand(symbol, publish=True):
+    """Fetch one symbol now and (optionally) publish it; concurrent callers share one upstream request"""
+    def fetch():
+        try:
+            quote = build_quote(symbol, upstream_history(symbol, FETCH_TIMEOUT))
+        except UpstreamRejected:
+            quote = None
+        except Exception as e:
+            logger.error(f"Error fetching {symbol} on demand: {str(e)}")
+            quote = None
+        if quote is not None:
+            symbol_registry.add([symbol])
+            quote_cache.apply(symbol, quote)
+            if publish:
+                quote_cache.publish()
+        return quote
+
+    return quote_fetches.do(symbol, fetch)
+
+def ensure_quotes(symbols):
+    """Fetch those of ``symbols`` that are uncached or cold, keep them all hot, and return the data to answer from
+
+    Readers of the shared quote table never go upstream or publish: they
+    hand the symbols to the writer and wait for its publish.
+    """
+    if shared_worker is not None and shared_worker.role == "reader":
+        shared_worker.request([symbol for symbol in symbols if symbol_registry.valid(symbol)], FETCH_TIMEOUT)
+        return quote_cache.snapshot().data
+
+    data = quote_cache.snapshot().data
+    wanted = [symbol for symbol in symbols if needs_fetch(symbol, data)]
+    if len(wanted) == 1:
+        fetch_on_demand(wanted[0])
+    elif wanted:
+        with ThreadPoolExecutor(max_workers=min(FETCH_MAX_WORKERS, len(wanted)),
+                                thread_name_prefix="on-demand") as pool:
+            list(pool.map(lambda symbol: fetch_on_demand(symbol, publish=False), wanted))
+        quote_cache.publish()
+    for symbol in symbols:
+        if symbol in symbol_registry:
+            symbol_registry.touch(symbol)
+    return quote_cache.snapshot().data
+
+def stock_payload(symbol):
+    """Body and status code for a single-stock lookup
+
+    A symbol that is not cached, or is cached but cold (not refreshed by the
+    cycle), is fetched on demand and then kept hot for a while.
+    """
+    symbol = normalize_symbol(symbol)
+
+    data = ensure_quotes([symbol])
+    quote = data.get(symbol)
+    if quote:
+        return {
+            "status": "success",
+            "data": quote
+        }, 200
+    elif symbol in data or symbol in symbol_registry:
+        return {
+            "status": "error",
+            "message": f"No data available for {symbol}"
+        }, 404
+    else:
+        return {
+            "status": "error",
+            "message": f"Stock {symbol} not found"
+        }, 404
+
+def stock_cached(symbol):
+    """True if a lookup can be answered without an upstream fetch (or, on a reader, without waiting for the writer)"""
+    symbol = normalize_symbol(symbol)
+    data = quote_cache.snapshot().data
+    if shared_worker is not None and shared_worker.role == "reader":
+        return symbol in data or not symbol_registry.valid(symbol)
+    return not needs_fetch(symbol, data)
+
+@per_generation(maxsize=256)
+@HOT_PATH_SECONDS.time("encode_bulk")
+def encode_bulk(snapshot, symbols, fields, media):
+    """Encoded bulk body and its ETag for one (generation, normalized symbol tuple, fields, media type)"""
+    body = columnar.encode(columnar.project(snapshot.data, symbols, fields), media, {
+        "generation": snapshot.generation,
+        "last_updated": snapshot.last_update.isoformat() if snapshot.last_update else None,
     })
+    return body, f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+def bulk_quotes(symbols, fields, accept=None, requested_format=None, if_none_match=None):
+    """``(status, headers, body)`` for a bulk lookup; uncached or cold symbols are fetched first (concurrently)"""
+    def error(message, status):
+        return status, {"Content-Type": "application/json"}, json.dumps({
+            "status": "error",
+            "message": message
+        }).encode("utf-8")
+
+    media = columnar.negotiate(accept, requested_format)
+    if media is None:
+        return error(f"Cannot produce {requested_format or accept}; available: "
+                     f"{', '.join(columnar.available_media_types())}", 406)
+    symbols = tuple(dict.fromkeys(normalize_symbol(s) for s in symbols if s and s.strip()))
+    if not symbols or len(symbols) > MAX_BULK_SYMBOLS:
+        return error(f"Give between 1 and {MAX_BULK_SYMBOLS} symbols", 400)
+    try:
+        fields = columnar.parse_fields(fields)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    ensure_quotes(symbols)
+    body, etag = encode_bulk(quote_cache.snapshot(), symbols, fields, media)
+    headers = {"Content-Type": media, "ETag": etag, "Vary": "Accept", "Cache-Control": "no-cache"}
+    if if_none_match and etag in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}:
+        del headers["Content-Type"]
+        return 304, headers, b""
+    return 200, headers, body
+
+@app.route('/api/stocks/bulk', methods=['GET', 'POST'])
+def get_stocks_bulk():
+    """Several stocks in one columnar response (one array per field)
+
+    ``?symbols=A,B&fields=price,change`` or a POSTed ``{"symbols": [...],
+    "fields": [...]}``; ``fields=all`` for every field. JSON, MessagePack
+    or Arrow IPC by Accept header (or ``?format=json|msgpack|arrow``).
+    """
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or not isinstance(body.get('symbols'), list):
+            return jsonify({
+                "status": "error",
+                "message": "Expected a JSON body with a 'symbols' list"
+            }), 400
+        symbols, fields = body['symbols'], body.get('fields')
+        if isinstance(fields, str):
+            fields = [f for f in fields.split(',') if f]
+    else:
+        symbols = request.args.get('symbols', '').split(',')
+        fields = [f for f in request.args.get('fields', '').split(',') if f]
+    status, headers, payload = bulk_quotes(
+        [str(s) for s in symbols],
+        fields if isinstance(fields, list) else None,
+        request.headers.get('Accept'),
+        request.args.get('format'),
+        request.headers.get('If-None-Match'),
+    )
+    return Response(payload, status=status, headers=headers)
 
 @app.route('/api/stocks/<symbol>', methods=['GET'])
 def get_stock(symbol):
     """Get specific stock data"""
-    symbol = symbol.upper()
-    if not symbol.endswith('.NS'):
-        symbol += '.NS'
+    payload, status = stock_payload(symbol)
+    return jsonify(payload), status
+
+@app.route('/api/history/<symbol>', methods=['GET'])
+def get_history(symbol):
+    """Daily OHLCV bars from the local store (``?from=YYYY-MM-DD&to=YYYY-MM-DD``, inclusive)"""
+    symbol = normalize_symbol(symbol)
+    try:
+        bars = history_store.range(symbol, request.args.get('from') or None, request.args.get('to') or None)
+    except ValueError:
+        return jsonify({
+            "status": "error",
+            "message": "Dates must be YYYY-MM-DD"
+        }), 400
+
+    if bars is None:
+        return jsonify({
+            "status": "error",
+            "message": f"No history stored for {symbol}"
+        }), 404
+    return jsonify({
+        "status": "success",
+        "symbol": symbol,
+        "count": bars.shape[1],
+        "data": bars_payload(bars)
+    })
+
+@app.route('/api/history/refresh', methods=['POST'])
+def refresh_history():
+    """Fetch only new daily bars (``?symbols=A,B``; default the hot symbols and the benchmark)"""
+    symbols = [normalize_symbol(s) for s in request.args.get('symbols', '').split(',') if s.strip()]
+    results = history_store.update_many(symbols or list(dict.fromkeys(symbol_registry.hot() + [BENCHMARK_SYMBOL])),
+                                        max_workers=FETCH_MAX_WORKERS)
+    if indicator_scanner.loaded_at is not None:
+        indicator_scanner.reload(history_store, [s for s, added in results.items() if added])
+    return jsonify({
+        "status": "success",
+        "added": results
+    })
+
+def run_scan(spec):
+    """Scan from ``{preset, where, rank, order, limit, fields, symbols}`` (explicit keys override the preset)"""
+    if indicator_scanner.loaded_at is None:
+        indicator_scanner.load(history_store)
+        indicator_scanner.on_publish(quote_cache.snapshot())
+    preset = spec.get('preset')
+    if preset and preset not in SCAN_PRESETS:
+        raise ValueError(f"Unknown preset {preset}; choose from {', '.join(SCAN_PRESETS)}")
+    spec = dict(SCAN_PRESETS.get(preset, {}), **{k: v for k, v in spec.items() if v not in (None, '', [])})
+    if not spec.get('where'):
+        raise ValueError("Give scan rules in 'where' or a preset")
+    symbols = spec.get('symbols')
+    return indicator_scanner.scan(
+        spec['where'],
+        rank=spec.get('rank'),
+        order=spec.get('order', 'desc'),
+        limit=min(int(spec.get('limit') or 50), 1000),
+        fields=spec.get('fields'),
+        symbols=[normalize_symbol(s) for s in symbols] if symbols else None
+    )
 
-    if symbol in stock_cache:
-        if stock_cache[symbol]:
+@app.route('/api/scan', methods=['GET', 'POST'])
+def scan_stocks():
+    """Indicator scan over every stored symbol
+
+    GET: ``?preset=breakout_20`` or ``?where=rsi_14 < 30;close > sma_200``
+    with optional ``rank``, ``order``, ``limit`` and comma-separated
+    ``fields`` / ``symbols``. POST takes the same keys as JSON (lists for
+    ``where``, ``fields`` and ``symbols``).
+    """
+    if request.method == 'POST':
+        spec = request.get_json(silent=True)
+        if not isinstance(spec, dict):
             return jsonify({
-                "status": "success",
-                "data": stock_cache[symbol]
-            })
-        else:
+                "status": "error",
+                "message": "Expected a JSON scan object"
+            }), 400
+    else:
+        args = request.args
+        spec = {
+            "preset": args.get('preset'),
+            "where": [r for r in args.get('where', '').split(';') if r.strip()],
+            "rank": args.get('rank'),
+            "order": args.get('order'),
+            "limit": args.get('limit'),
+            "fields": [f.strip() for f in args.get('fields', '').split(',') if f.strip()],
+            "symbols": [s.strip() for s in args.get('symbols', '').split(',') if s.strip()],
+        }
+    try:
+        result = run_scan(spec)
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e),
+            "presets": list(SCAN_PRESETS)
+        }), 400
+    return jsonify({"status": "success", **result})
+
+@app.route('/api/stream', methods=['GET'])
+def stream_quotes():
+    """Server-Sent Events stream of quote deltas (``?symbols=RELIANCE,TCS`` for a subset)
+
+    The first event is a ``snapshot`` of the subscribed symbols; every later
+    ``quotes`` event carries only the symbols that changed. Each client keeps
+    at most one pending quote per symbol, so slow readers skip to the latest
+    price. Run under an async worker (e.g. ``gunicorn -k gevent``) to hold
+    many idle connections without a thread each.
+    """
+    symbols = [normalize_symbol(s) for s in request.args.get('symbols', '').split(',') if s.strip()]
+
+    def initial():
+        snapshot = quote_cache.snapshot()
+        data = snapshot.data
+        return ({s: data.get(s) for s in symbols} if symbols else dict(data)), snapshot.generation
+
+    return event_stream(quote_broker, symbols, initial, "snapshot", "quotes")
+
+def event_stream(broker, keys, initial, initial_event, update_event):
+    """SSE response: ``initial()`` -> (data, id) first, then the broker's deltas for ``keys``"""
+    def events():
+        # Subscribe before reading the initial state so no update falls in between
+        subscriber = broker.subscribe(keys or None)
+        try:
+            data, event_id = initial()
+            yield format_sse(data, event=initial_event, event_id=event_id)
+            while True:
+                updates, generation = subscriber.wait(STREAM_KEEPALIVE)
+                if updates:
+                    yield format_sse(updates, event=update_event, event_id=generation)
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            broker.unsubscribe(subscriber)
+
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def mtm_payload(account=None):
+    """Current mark-to-market, caught up with trade writes from any process"""
+    mark_to_market.sync(trade_store)
+    if not mark_to_market.primed:
+        mark_to_market.on_publish(quote_cache.snapshot())
+    return mark_to_market.payload(account)
+
+@app.route('/api/mtm', methods=['GET'])
+def get_mtm():
+    """Unrealized P&L of open trades at cached quotes: per position, per account (``?account=``) and total"""
+    return jsonify({
+        "status": "success",
+        **mtm_payload(request.args.get('account') or None)
+    })
+
+@app.route('/api/mtm/stream', methods=['GET'])
+def stream_mtm():
+    """Server-Sent Events of mark-to-market changes
+
+    Starts with an ``mtm`` snapshot (as /api/mtm); later ``mtm_update``
+    events carry only changed ``position:<id>``, ``account:<name>`` and
+    ``total`` entries (a position set to null was closed or deleted).
+    """
+    def initial():
+        payload = mtm_payload()
+        return payload, payload["generation"]
+
+    return event_stream(mtm_broker, None, initial, "mtm", "mtm_update")
+
+@app.route('/api/trades/import', methods=['POST'])
+def import_trades():
+    """Stream a broker CSV into the trade store (raw body or multipart ``file``)
+
+    ``?dayfirst=true`` reads ambiguous numeric dates as DD/MM. The response
+    summarises rejected rows per reason with sample row numbers.
+    """
+    upload = request.files.get('file')
+    source = upload.stream if upload is not None else request.stream
+    try:
+        summary = import_csv(
+            source,
+            trade_store,
+            dayfirst=request.args.get('dayfirst', '').lower() in ('1', 'true', 'yes'),
+        )
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Could not import CSV: {str(e)}"
+        }), 400
+    return jsonify({
+        "status": "success",
+        **summary
+    })
+
+TRADE_FILTERS = ("account", "strategy", "symbol", "status", "outcome", "from", "to", "exit_from", "exit_to")
+
+@app.route('/api/trades', methods=['GET'])
+def list_trades():
+    """One page of journal trades from the indexed store
+
+    Filters: ``account``, ``strategy``, ``symbol``, ``status``, ``outcome``
+    (win/loss/breakeven), ``from``/``to`` (entry date), ``exit_from``/``exit_to``.
+    Paging and order: ``limit`` (max 1000), ``offset``, ``sort`` (entryDate,
+    exitDate, pl or id), ``order=asc|desc``; ``total=false`` skips the count.
+    """
+    filters = {k: request.args[k] for k in TRADE_FILTERS if request.args.get(k)}
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 1000)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    try:
+        trades, total = trade_store.query(
+            filters,
+            sort=request.args.get('sort', 'entryDate'),
+            descending=request.args.get('order', 'desc').lower() != 'asc',
+            limit=limit,
+            offset=offset,
+            with_total=request.args.get('total', '').lower() not in ('0', 'false', 'no'),
+        )
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+    return jsonify({
+        "status": "success",
+        "data": trades,
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "version": trade_store.version
+    })
+
+def mark_trades_changed():
+    """Push a single-trade edit to MTM subscribers now rather than at the next quote refresh"""
+    if mark_to_market.version is not None:
+        mark_to_market.sync(trade_store)
+
+def save_trade(trade, status=200):
+    """Upsert a trade body; returns a Flask response"""
+    if not isinstance(trade, dict):
+        return jsonify({
+            "status": "error",
+            "message": "Expected a JSON trade object"
+        }), 400
+    try:
+        saved = trade_store.upsert(trade)
+    except (sqlite3.IntegrityError, ValueError) as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Invalid trade: {str(e)}"
+        }), 400
+    mark_trades_changed()
+    return jsonify({
+        "status": "success",
+        "data": saved,
+        "version": trade_store.version
+    }), status
+
+@app.route('/api/trades', methods=['POST'])
+def create_trade():
+    """Add a trade (or update it, if the body carries an existing ``id``)"""
+    return save_trade(request.get_json(silent=True), status=201)
+
+@app.route('/api/trades/<int:trade_id>', methods=['GET'])
+def get_trade(trade_id):
+    trade = trade_store.get(trade_id)
+    if trade is None:
+        return jsonify({
+            "status": "error",
+            "message": f"Trade {trade_id} not found"
+        }), 404
+    return jsonify({
+        "status": "success",
+        "data": trade
+    })
+
+@app.route('/api/trades/<int:trade_id>', methods=['PUT'])
+def update_trade(trade_id):
+    """Write the given fields of one trade (creating it if needed); other fields are kept"""
+    trade = request.get_json(silent=True)
+    if isinstance(trade, dict):
+        trade = dict(trade, id=trade_id)
+    return save_trade(trade)
+
+@app.route('/api/trades/<int:trade_id>', methods=['DELETE'])
+def delete_trade(trade_id):
+    if not trade_store.delete(trade_id):
+        return jsonify({
+            "status": "error",
+            "message": f"Trade {trade_id} not found"
+        }), 404
+    mark_trades_changed()
+    return jsonify({
+        "status": "success",
+        "version": trade_store.version
+    })
+
+@app.route('/api/backtest', methods=['POST'])
+def run_backtest():
+    """Backtest a rule-based strategy over stored daily bars
+
+    Body: ``{"strategy": {...}, "symbols": [...], "from", "to", "engine",
+    "save"}`` (see backtester.py for the strategy format). Returns journal
+    trades plus journal metrics; ``"save": true`` also writes the trades to
+    the trade store.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('strategy'), dict):
+        return jsonify({
+            "status": "error",
+            "message": "Expected {\"strategy\": {...}}"
+        }), 400
+    symbols = body.get('symbols')
+    try:
+        matrix = BarMatrix.from_store(history_store, [normalize_symbol(s) for s in symbols] if symbols else None,
+                                      body.get('from') or None, body.get('to') or None)
+        result = backtest(matrix, body['strategy'], body.get('engine') or 'auto')
+    except (TypeError, KeyError, ValueError) as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+
+    if body.get('save') and result['trades']:
+        columns = {column: field for field, column in TRADE_FIELDS.items()}
+        trade_store.insert_many([tuple(trade[columns[c]] for c in INSERT_COLUMNS) for trade in result['trades']])
+        mark_trades_changed()
+        result['version'] = trade_store.version
+    return jsonify({"status": "success", **result})
+
+@app.route('/api/optimize', methods=['POST'])
+def optimize_strategy():
+    """Parameter sweep / walk-forward optimization, streamed as NDJSON rows
+
+    Body: ``{"template", "params", "samples", "seed", "objective",
+    "min_trades", "walk_forward", "symbols", "from", "to"}`` (see
+    optimizer.py). One ``result`` row per backtest as it finishes, ``fold``
+    rows for walk-forward, then a ``summary`` row.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('template'), dict):
+        return jsonify({
+            "status": "error",
+            "message": "Expected {\"template\": {...}, \"params\": {...}}"
+        }), 400
+    for key, example in (('params', '{"name": [values] or {"min", "max", "step"}}'),
+                         ('walk_forward', '{"train": bars, "test": bars}')):
+        if body.get(key) is not None and not isinstance(body[key], dict):
             return jsonify({
                 "status": "error",
-                "message": f"No data available for {symbol}"
+                "message": f"{key} must be an object: {example}"
+            }), 400
+    symbols = body.get('symbols')
+    try:
+        matrix = BarMatrix.from_store(history_store, [normalize_symbol(s) for s in symbols] if symbols else None,
+                                      body.get('from') or None, body.get('to') or None)
+        sweep = Sweep(matrix, body['template'], body.get('params') or {}, body.get('samples'), body.get('seed'),
+                      body.get('objective') or 'profitFactor', body.get('min_trades') or 1,
+                      body.get('walk_forward'), max_workers=OPTIMIZER_WORKERS or None)
+    except (TypeError, KeyError, ValueError) as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+
+    def rows():
+        for row in sweep:
+            yield json.dumps(row) + "\n"
+
+    return Response(rows(), mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
+
+analytics_engine = AnalyticsEngine()
+
+def stored_trade_frame():
+    return TradeFrame.from_columns(trade_store.columns())
+
+def live_prices():
+    """Current price by journal symbol (with and without the .NS suffix)"""
+    prices = {}
+    for symbol, quote in quote_cache.snapshot().data.items():
+        if quote is not None:
+            prices[symbol] = prices[quote["name"]] = quote["price"]
+    return prices
+
+@app.route('/api/analytics', methods=['GET'])
+def stored_trade_analytics():
+    """Journal metrics over the trade store (same filters and output as the POST form)"""
+    version = f"store:{trade_store.version}"
+    live = request.args.get('live', '').lower() in ('1', 'true', 'yes')
+    result = analytics_engine.analyze(
+        version,
+        stored_trade_frame,
+        strategy=request.args.get('strategy'),
+        account=request.args.get('account'),
+        outcome=request.args.get('outcome'),
+        open_prices=live_prices() if live else None,
+    )
+    return jsonify({
+        "status": "success",
+        "version": version,
+        **result
+    })
+
+@app.route('/api/analytics', methods=['POST'])
+def journal_analytics():
+    """Journal metrics for a posted trade list (``{"trades": [...], "version": ...}``)
+
+    Filters mirror the journal UI: ``?strategy=&account=&outcome=win|loss|breakeven``.
+    Results are cached per (version, filter); without a ``version`` the body
+    hash is used. ``?live=true`` values open positions at cached quotes.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get("trades"), list):
+        return jsonify({
+            "status": "error",
+            "message": "Expected a JSON body with a 'trades' list"
+        }), 400
+
+    version = body.get("version")
+    if version is None:
+        version = hashlib.blake2b(request.get_data(), digest_size=16).hexdigest()
+    live = request.args.get('live', '').lower() in ('1', 'true', 'yes')
+    result = analytics_engine.analyze(
+        str(version),
+        lambda: body["trades"],
+        strategy=request.args.get('strategy'),
+        account=request.args.get('account'),
+        outcome=request.args.get('outcome'),
+        open_prices=live_prices() if live else None,
+    )
+    return jsonify({
+        "status": "success",
+        "version": str(version),
+        **result
+    })
+
+@app.route('/api/analytics/equity', methods=['GET'])
+def stored_trade_equity():
+    """Equity curve over the trade store, advanced incrementally from the last cached version"""
+    filters = {k: request.args.get(k) for k in ("strategy", "account", "outcome")}
+    version = f"store:{trade_store.version}"
+    base_version = analytics_engine.latest_curve_version(**filters)
+    changes = None
+    if base_version is not None and base_version.startswith("store:") and base_version != version:
+        changes = trade_store.changes_since(int(base_version[len("store:"):]))
+    curve = analytics_engine.curve(
+        version,
+        stored_trade_frame,
+        base_version=base_version if changes is not None else None,
+        changes=changes,
+        **filters
+    )
+    return jsonify({
+        "status": "success",
+        "version": version,
+        "summary": curve.summary(),
+        **curve.series(request.args.get('width', type=int))
+    })
+
+@app.route('/api/analytics/equity', methods=['POST'])
+def journal_equity():
+    """Equity curve and drawdown series, downsampled to ``?width=`` points
+
+    Post the full ``{"trades": [...]}`` (as for /api/analytics), or advance
+    a curve the server already holds with ``{"version": new, "base_version":
+    old, "changes": [trade, ...]}``: changed trades are re-placed (or removed
+    when reopened, ``"deleted": true`` or filtered out) without a rebuild.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not (isinstance(body.get("trades"), list)
+                                          or isinstance(body.get("changes"), list)):
+        return jsonify({
+            "status": "error",
+            "message": "Expected a JSON body with a 'trades' or 'changes' list"
+        }), 400
+
+    version = body.get("version")
+    if version is None:
+        version = hashlib.blake2b(request.get_data(), digest_size=16).hexdigest()
+    trades = body.get("trades")
+    base_version = body.get("base_version")
+    curve = analytics_engine.curve(
+        str(version),
+        (lambda: trades) if isinstance(trades, list) else None,
+        strategy=request.args.get('strategy'),
+        account=request.args.get('account'),
+        outcome=request.args.get('outcome'),
+        base_version=str(base_version) if base_version is not None else None,
+        changes=body.get("changes"),
+    )
+    if curve is None:
+        return jsonify({
+            "status": "error",
+            "message": f"Unknown base_version {base_version}; post the full trade list"
+        }), 409
+    return jsonify({
+        "status": "success",
+        "version": str(version),
+        "summary": curve.summary(),
+        **curve.series(request.args.get('width', type=int))
+    })
+
+def position_price(symbol):
+    """Cached quote price of a quote symbol, else its last stored close"""
+    quote = quote_cache.snapshot().data.get(symbol)
+    if quote is not None:
+        return quote["price"]
+    bars = history_store.load(symbol)
+    return float(bars[CLOSE, -1]) if bars is not None and bars.shape[1] else None
+
+risk_engine = RiskEngine(
+    returns_fn=lambda symbols, lookback: symbol_returns(history_store, symbols, lookback),
+    price_fn=position_price,
+    symbol_key=lambda symbol: normalize_symbol(symbol),
+)
+
+@app.route('/api/risk', methods=['GET'])
+def stored_trade_risk():
+    """Monte Carlo VaR / CVaR, probability of ruin and drawdown distribution per account
+
+    Query: ``paths`` (default 100000), ``trades`` (future trades per path,
+    default each account's closed count, up to 500), ``horizon`` (days, open positions),
+    ``confidence`` (%), ``ruin`` (fraction of capital), ``lookback`` (days of
+    returns), ``capital``, ``seed`` (reproducible runs), ``account``.
+    Cached until the trade store changes.
+    """
+    params = {k: request.args.get(k) for k in ("paths", "trades", "horizon", "confidence", "ruin",
+                                                "lookback", "capital") if request.args.get(k)}
+    seed = request.args.get('seed')
+    version = f"store:{trade_store.version}"
+    try:
+        result = risk_engine.analyze(version, stored_trade_frame,
+                                     seed=int(seed) if seed not in (None, "") else None, **params)
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+    account = request.args.get('account')
+    if account:
+        if account not in result["accounts"]:
+            return jsonify({
+                "status": "error",
+                "message": f"No trades in account {account}"
             }), 404
+        result = dict(result, total=result["accounts"][account], accounts={account: result["accounts"][account]})
+    return jsonify({
+        "status": "success",
+        **result
+    })
+
+@app.route('/api/correlation', methods=['GET'])
+def correlation_matrix():
+    """Rolling return correlation, beta to the benchmark and exposure of held and watched symbols
+
+    ``?scope=held|watched|all`` (default all) or ``?symbols=A,B`` picks the
+    matrix symbols; ``threshold`` (default 0.7) sets when held symbols count
+    as one bet; ``matrix=false`` leaves out the correlation matrix.
+    """
+    frame = analytics_engine.frame(f"store:{trade_store.version}", stored_trade_frame)
+    open_rows = np.flatnonzero(~frame.closed)
+    positions = []
+    for row in open_rows.tolist():
+        symbol = normalize_symbol(frame.symbol[row])
+        price = position_price(symbol)
+        if price is None or not np.isfinite(frame.entry_price[row]):
+            price = frame.entry_price[row]
+        positions.append({
+            "symbol": symbol,
+            "strategy": frame.strategy_names[frame.strategy[row]],
+            "value": float(np.nan_to_num(price * frame.quantity[row] * frame.direction[row])),
+        })
+    held = list(dict.fromkeys(p["symbol"] for p in positions))
+    watched = list(symbol_registry.core)
+    requested = [normalize_symbol(s) for s in request.args.get('symbols', '').split(',') if s.strip()]
+    scope = request.args.get('scope', 'all')
+    if requested:
+        symbols = list(dict.fromkeys(requested))
+    elif scope in ('held', 'watched', 'all'):
+        symbols = {"held": held, "watched": watched, "all": list(dict.fromkeys(held + watched))}[scope]
     else:
         return jsonify({
             "status": "error",
-            "message": f"Stock {symbol} not found"
-        }), 404
+            "message": "scope must be held, watched or all"
+        }), 400
+    threshold = request.args.get('threshold', CORRELATION_THRESHOLD, type=float)
+
+    # only held and watched symbols are tracked; ad-hoc ?symbols= are computed per request
+    correlation_engine.track([BENCHMARK_SYMBOL] + held + watched)
+    correlation_engine.sync()
+    tracked = list(dict.fromkeys(symbols + held))
+    stats = correlation_engine.stats(tracked)
+    result = {
+        "status": "success",
+        "benchmark": BENCHMARK_SYMBOL,
+        "window": CORRELATION_WINDOW,
+        "observations": stats["observations"],
+        "days": stats["days"],
+        "live": stats["live"],
+        "symbols": symbols,
+        "held": held,
+        "beta": {s: (None if not np.isfinite(b) else round(float(b), 4))
+                 for s, b in zip(symbols, stats["beta"].tolist())},
+        "volatility": {s: round(float(v), 2) for s, v in zip(symbols, stats["volatility"].tolist())},
+        "exposure": exposure(positions, stats["beta"], NSE_SECTORS, threshold, stats["correlation"], tracked),
+    }
+    if request.args.get('matrix', 'true').lower() not in ('0', 'false', 'no'):
+        result["correlation"] = stats["correlation"][:len(symbols), :len(symbols)].round(4).tolist()
+    return jsonify(result)
+
+def health_payload(refresh_status):
+    """Body of /api/health, given the active scheduler's status"""
+    snapshot = quote_cache.snapshot()
+    return {
+        "status": "degraded" if upstream.degraded else "healthy",
+        "service": "NSE Stock Price API",
+        "last_update": snapshot.last_update.isoformat() if snapshot.last_update else None,
+        "cached_stocks": len(snapshot.data),
+        "stale_stocks": sum(1 for q in snapshot.data.values() if q is not None and q.get("stale")),
+        "generation": snapshot.generation,
+        "stream_subscribers": quote_broker.subscriber_count,
+        "symbols": dict(symbol_registry.status(), on_demand_fetches=quote_fetches.executed,
+                        coalesced_requests=quote_fetches.coalesced),
+        "upstream": upstream.status(),
+        "quote_table": shared_worker.status() if shared_worker is not None else None,
+        "refresh": refresh_status
+    }
+
+metrics.Gauge("nse_cache_generation", "Current quote cache generation", fn=lambda: quote_cache.snapshot().generation)
+metrics.Gauge("nse_cache_symbols", "Symbols with a cached quote", fn=lambda: quote_cache.snapshot().available)
+metrics.Gauge("nse_cache_stale_symbols", "Cached quotes flagged stale",
+              fn=lambda: sum(1 for q in quote_cache.snapshot().data.values() if q is not None and q.get("stale")))
+metrics.Gauge("nse_cache_age_seconds", "Seconds since the last good quote, per symbol", ("symbol",),
+              fn=lambda: {(symbol,): age for symbol, age in quote_cache.ages().items()})
+metrics.Gauge("nse_stream_subscribers", "Active push stream subscribers", ("stream",),
+              fn=lambda: {("quotes",): quote_broker.subscriber_count, ("mtm",): mtm_broker.subscriber_count})
+metrics.Gauge("nse_upstream_circuit_open", "1 while the upstream circuit breaker is not closed",
+              fn=lambda: int(upstream.degraded))
+metrics.Counter("nse_upstream_refused_total", "Upstream calls refused locally, by reason", ("reason",),
+                fn=lambda: {(reason,): count for reason, count in upstream.rejected.items()})
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    observe_request(route, request.method, response.status_code, time.perf_counter() - g.request_started,
+                    conditional='If-None-Match' in request.headers or 'If-Modified-Since' in request.headers)
+    size = None if response.is_streamed else response.calculate_content_length()
+    if size is not None:
+        observe_response_size(route, size)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics for this process"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
-        "status": "healthy",
-        "service": "NSE Stock Price API",
-        "last_update": last_update.isoformat() if last_update else None,
-        "cached_stocks": len(stock_cache)
-    })
+    return jsonify(health_payload(refresh_status()))
+
+def refresh_backoff(scheduler):
+    """``(body, retry_after)`` while a manual refresh must wait out the failure backoff, else None"""
+    remaining = math.ceil(scheduler.backoff_remaining())
+    if not remaining:
+        return None
+    return {
+        "status": "error",
+        "message": f"Refreshes are failing ({scheduler.consecutive_failures} in a row); next attempt in {remaining}s"
+    }, remaining
 
 @app.route('/api/refresh', methods=['POST'])
 def force_refresh():
-    """Force refresh stock data"""
-    update_stock_cache()
+    """Force refresh stock data (joins a refresh that is already running)
+
+    503 with Retry-After while failed refreshes are backing off.
+    """
+    if shared_worker is not None and shared_worker.role == "reader":
+        shared_worker.request_refresh()
+        return jsonify({
+            "status": "success",
+            "message": "Refresh requested from the quote table writer",
+            "completed": False
+        })
+    refresh_scheduler.start()
+    backoff = refresh_backoff(refresh_scheduler)
+    if backoff is not None:
+        body, retry_after = backoff
+        return jsonify(body), 503, {"Retry-After": str(retry_after)}
+    done, joined = refresh_scheduler.trigger()
+    if request.args.get('wait', '').lower() in ('1', 'true', 'yes'):
+        done.wait(FETCH_TIMEOUT * 3)
     return jsonify({
         "status": "success",
-        "message": "Stock cache refresh initiated"
+        "message": "Joined refresh in progress" if joined else "Stock cache refresh initiated",
+        "completed": done.is_set()
     })
 
 if __name__ == '__main__':
     logger.info("Starting NSE Stock Price API Server...")
 
-    # Initial data fetch
-    update_stock_cache()
+    # Serve the persisted cache straight away if there is one; otherwise
+    # wait for the first fetch. The scheduler keeps the cache fresh.
+    start_worker()
+    if quote_cache.snapshot().available == 0 and (shared_worker is None or shared_worker.role == "writer"):
+        refresh_scheduler.trigger()[0].wait()
 
     # Start the Flask server
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,271 @@
+"""
+Parameter sweeps and walk-forward optimization for Trading Journal Pro
+Expands a strategy template over a parameter grid (or a random sample of
+it), runs every combination on a BacktestPool and streams one result row per
+backtest as it finishes, scored with the journal's own metric definitions.
+
+A template is a backtester strategy with ``{name}`` placeholders:
+
+    {"template": {"entry": ["close > high_{lookback}"], "stop": {"atr": "{stop_atr}"},
+                  "target": {"r": "{target_r}"}},
+     "params": {"lookback": [10, 20, 55],
+                "stop_atr": {"min": 1, "max": 3, "step": 0.5},
+                "target_r": [1.5, 2, 3]},
+     "samples": 200, "seed": 7,                  (random search; omit for the full grid)
+     "objective": "profitFactor", "min_trades": 30,
+     "walk_forward": {"train": 500, "test": 125}} (bars; "step", "anchored" optional)
+
+With ``walk_forward`` each fold sweeps its in-sample window, picks the best
+parameters by ``objective`` and runs them on the following out-of-sample
+window; indicators always see the full history before a window.
+
+Sweep from the command line (one JSON row per line on stdout):
+    python optimizer.py sweep.json [SYMBOLS...]
+"""
+
+from concurrent.futures import FIRST_COMPLETED, wait
+from itertools import product
+import logging
+import re
+import sys
+import time
+
+import numpy as np
+
+from backtester import BacktestPool, normalize_strategy, result_or_error
+from history_store import day_strings
+from journal_analytics import TradeFrame, compute_metrics
+
+logger = logging.getLogger(__name__)
+
+# Metrics copied into each result row
+RESULT_METRICS = ("totalTrades", "winRate", "totalPL", "profitFactor", "expectancy", "maxDrawdown",
+                  "sharpeRatio", "roi", "avgHoldTime")
+METRIC_NAMES = tuple(compute_metrics(TradeFrame([]), np.zeros(0, dtype=bool)))
+# Objectives where smaller is better
+MINIMIZED = {"maxDrawdown", "peakTroughValue", "avgLoss", "grossLosses"}
+
+MAX_COMBINATIONS = 100000
+PLACEHOLDER = re.compile(r"^\{(\w+)\}$")
+
+
+def render(template, params):
+    """Template with ``{name}`` placeholders filled in; a placeholder alone keeps the value's type"""
+    if isinstance(template, dict):
+        return {key: render(value, params) for key, value in template.items()}
+    if isinstance(template, list):
+        return [render(value, params) for value in template]
+    if isinstance(template, str):
+        whole = PLACEHOLDER.match(template)
+        if whole and whole.group(1) in params:
+            return params[whole.group(1)]
+        try:
+            return template.format(**params)
+        except (KeyError, IndexError) as e:
+            raise ValueError(f"Template placeholder has no parameter: {e}")
+    return template
+
+
+def parameter_values(name, spec):
+    """A parameter's candidate values: a list, ``{"min", "max", "step"}`` (inclusive) or one value"""
+    if isinstance(spec, list):
+        if not spec:
+            raise ValueError(f"Parameter {name} has no values")
+        return spec
+    if isinstance(spec, dict):
+        if "step" not in spec:
+            raise ValueError(f"Parameter {name} needs a step for a grid (or use random search)")
+        low, high, step = float(spec["min"]), float(spec["max"]), float(spec["step"])
+        if step <= 0 or high < low:
+            raise ValueError(f"Parameter {name} needs min <= max and a positive step")
+        values = np.round(np.arange(low, high + step / 2, step), 10)
+        return [int(v) if float(v).is_integer() and all(isinstance(spec[k], int) for k in ("min", "max", "step"))
+                else float(v) for v in values]
+    return [spec]
+
+
+def parameter_grid(space):
+    """Every combination of the parameter values, as dicts"""
+    names = list(space)
+    values = [parameter_values(name, space[name]) for name in names]
+    count = int(np.prod([len(v) for v in values])) if values else 1
+    if count > MAX_COMBINATIONS:
+        raise ValueError(f"Grid has {count} combinations (limit {MAX_COMBINATIONS}); use samples")
+    return [dict(zip(names, combination)) for combination in product(*values)]
+
+
+def parameter_samples(space, samples, seed=None):
+    """Random search: ``samples`` draws, uniform over ranges without a step, else over the grid values"""
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for name, spec in space.items():
+        if isinstance(spec, dict) and "step" not in spec:
+            columns[name] = rng.uniform(float(spec["min"]), float(spec["max"]), samples).round(6).tolist()
+        else:
+            values = parameter_values(name, spec)
+            columns[name] = [values[i] for i in rng.integers(0, len(values), samples)]
+    return [{name: columns[name][i] for name in space} for i in range(samples)]
+
+
+def walk_forward_windows(bars, train, test, step=None, anchored=False):
+    """[(train window, test window)] as (first, stop) bar indices, moving forward by ``step``"""
+    train, test, step = int(train), int(test), int(step or test)
+    if min(train, test, step) <= 0:
+        raise ValueError("walk_forward needs positive train, test and step")
+    windows = []
+    start = 0
+    while start + train + test <= bars:
+        windows.append(((0 if anchored else start, start + train), (start + train, start + train + test)))
+        start += step
+    if not windows:
+        raise ValueError(f"Only {bars} bars: too few for train={train} + test={test}")
+    return windows
+
+
+def score(metrics, objective):
+    return -metrics[objective] if objective in MINIMIZED else metrics[objective]
+
+
+class Sweep:
+    """One parameter sweep (optionally walk-forward) over a BarMatrix; iterate it for result rows
+
+    Rows, in completion order:
+      {"type": "result", "fold", "phase": "full" | "in_sample", "index", "params", <metrics>}
+      {"type": "fold", "fold", "train", "test", "params", "in_sample", "out_of_sample"}
+      {"type": "summary", "combinations", "backtests", "best" | "folds", "seconds"}
+    """
+
+    def __init__(self, matrix, template, params, samples=None, seed=None, objective="profitFactor",
+                 min_trades=1, walk_forward=None, engine="auto", max_workers=None):
+        if objective not in METRIC_NAMES:
+            raise ValueError(f"Unknown objective {objective}; choose from {', '.join(METRIC_NAMES)}")
+        self.matrix = matrix
+        self.template = template
+        self.objective = objective
+        self.fields = RESULT_METRICS + ((objective,) if objective not in RESULT_METRICS else ())
+        self.min_trades = int(min_trades)
+        self.engine = engine
+        self.max_workers = max_workers
+        self.combinations = parameter_samples(params, int(samples), seed) if samples else parameter_grid(params)
+        self.strategies = [dict(render(template, p), name=template.get("name") or "Sweep")
+                           for p in self.combinations]
+        for strategy in self.strategies[:1]:
+            normalize_strategy(strategy)  # a malformed template fails here, not in every worker
+        dates = matrix.bars.shape[2]
+        if walk_forward and not isinstance(walk_forward, dict):
+            raise ValueError('walk_forward must be an object: {"train": bars, "test": bars}')
+        if walk_forward:
+            self.windows = walk_forward_windows(dates, walk_forward.get("train"), walk_forward.get("test"),
+                                                walk_forward.get("step"), walk_forward.get("anchored", False))
+        else:
+            self.windows = [((0, dates), None)]
+
+    def _dates(self, window):
+        first, stop = window
+        return day_strings(self.matrix.dates[[first, stop - 1]])
+
+    def _row(self, fold, phase, index, result):
+        row = {"type": "result", "fold": fold, "phase": phase, "index": index, "params": self.combinations[index]}
+        if "error" in result:
+            row["error"] = result["error"]
+        else:
+            row.update({key: result["metrics"][key] for key in self.fields})
+        return row
+
+    def _best(self, results):
+        """Index of the best eligible result (None if nothing traded enough)"""
+        best, best_score = None, None
+        for index, result in results.items():
+            if "error" in result or result["metrics"]["totalTrades"] < self.min_trades:
+                continue
+            value = score(result["metrics"], self.objective)
+            if best_score is None or value > best_score:
+                best, best_score = index, value
+        return best
+
+    def __iter__(self):
+        started = time.perf_counter()
+        walk_forward = self.windows[0][1] is not None
+        phase = "in_sample" if walk_forward else "full"
+        folds = []
+        backtests = 0
+        with BacktestPool(self.matrix, self.max_workers) as pool:
+            pending = {}
+            results = [dict() for _ in self.windows]
+            remaining = [len(self.strategies)] * len(self.windows)
+            for fold, (train, _) in enumerate(self.windows):
+                for index, strategy in enumerate(self.strategies):
+                    pending[pool.submit(strategy, self.engine, False, train)] = (fold, index, False)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    fold, index, out_of_sample = pending.pop(future)
+                    result = result_or_error(future, f"{fold}/{index}")
+                    backtests += 1
+                    if out_of_sample:
+                        train, test = self.windows[fold]
+                        best = results[fold][index]
+                        row = {
+                            "type": "fold",
+                            "fold": fold,
+                            "train": self._dates(train),
+                            "test": self._dates(test),
+                            "params": self.combinations[index],
+                            "in_sample": {key: best["metrics"][key] for key in self.fields},
+                            "out_of_sample": ({key: result["metrics"][key] for key in self.fields}
+                                              if "error" not in result else {"error": result["error"]}),
+                        }
+                        folds.append(row)
+                        yield row
+                        continue
+
+                    results[fold][index] = result if "error" in result else {"metrics": result["metrics"]}
+                    remaining[fold] -= 1
+                    yield self._row(fold if walk_forward else None, phase, index, result)
+                    if walk_forward and remaining[fold] == 0:
+                        best = self._best(results[fold])
+                        if best is None:
+                            folds.append({"type": "fold", "fold": fold, "params": None,
+                                          "train": self._dates(self.windows[fold][0]),
+                                          "test": self._dates(self.windows[fold][1])})
+                            yield folds[-1]
+                        else:
+                            future = pool.submit(self.strategies[best], self.engine, False, self.windows[fold][1])
+                            pending[future] = (fold, best, True)
+                        # only the chosen parameters matter once a fold is decided
+                        results[fold] = {best: results[fold][best]} if best is not None else {}
+
+        summary = {"type": "summary", "combinations": len(self.combinations), "backtests": backtests,
+                   "objective": self.objective}
+        if walk_forward:
+            folds.sort(key=lambda row: row["fold"])
+            tested = [row["out_of_sample"] for row in folds if "error" not in row.get("out_of_sample", {"error": 1})]
+            summary["folds"] = len(folds)
+            summary["out_of_sample"] = {
+                "totalTrades": sum(m["totalTrades"] for m in tested),
+                "totalPL": sum(m["totalPL"] for m in tested),
+                self.objective: float(np.mean([m[self.objective] for m in tested])) if tested else 0,
+            }
+        else:
+            best = self._best(results[0])
+            summary["best"] = {"params": self.combinations[best],
+                               **{key: results[0][best]["metrics"][key] for key in self.fields}} \
+                if best is not None else None
+        summary["seconds"] = round(time.perf_counter() - started, 3)
+        yield summary
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    import json
+    import nse_stock_api
+    from backtester import BarMatrix
+    with open(sys.argv[1]) as f:
+        spec = json.load(f)
+    matrix = BarMatrix.from_store(nse_stock_api.history_store, sys.argv[2:] or None,
+                                  spec.get("from"), spec.get("to"))
+    sweep = Sweep(matrix, spec["template"], spec.get("params", {}), spec.get("samples"), spec.get("seed"),
+                  spec.get("objective", "profitFactor"), spec.get("min_trades", 1), spec.get("walk_forward"))
+    for row in sweep:
+        print(json.dumps(row), flush=True)
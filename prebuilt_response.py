@@ -0,0 +1,93 @@
+"""
+Pre-serialized HTTP bodies for the NSE Stock Price API
+A payload is encoded to JSON (plus gzip and, when the optional ``brotli``
+package is installed, brotli) exactly once; requests then only pick the
+right bytes or answer 304 Not Modified.
+"""
+
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import timezone
+import gzip
+import hashlib
+import json
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+
+def parse_accept_encoding(header):
+    """Return {coding: q} from an Accept-Encoding header"""
+    codings = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[name.strip().lower()] = q
+    return codings
+
+
+class PrebuiltBody:
+    """Immutable encoded representations of one JSON payload"""
+
+    __slots__ = ("variants", "etag", "modified", "last_modified")
+
+    def __init__(self, payload, last_modified=None):
+        raw = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        digest = hashlib.blake2b(raw, digest_size=12).hexdigest()
+
+        # coding -> (bytes, strong ETag for that representation)
+        self.variants = {"identity": (raw, f'"{digest}"')}
+        self.variants["gzip"] = (gzip.compress(raw, compresslevel=6), f'"{digest}-gz"')
+        if brotli is not None:
+            self.variants["br"] = (brotli.compress(raw, quality=5), f'"{digest}-br"')
+
+        self.etag = digest
+        self.modified = last_modified.astimezone(timezone.utc).replace(microsecond=0) \
+            if last_modified else None
+        self.last_modified = format_datetime(self.modified, usegmt=True) if self.modified else None
+
+    def select(self, accept_encoding):
+        """Pick ``(coding, body, etag)`` for an Accept-Encoding header"""
+        accepted = parse_accept_encoding(accept_encoding)
+        for coding in ("br", "gzip"):
+            if coding in self.variants and accepted.get(coding, accepted.get("*", 0)) > 0:
+                return (coding,) + self.variants[coding]
+        return ("identity",) + self.variants["identity"]
+
+    def not_modified(self, if_none_match=None, if_modified_since=None):
+        """True if the client's cached copy is current (If-None-Match wins over If-Modified-Since)"""
+        if if_none_match:
+            if if_none_match.strip() == "*":
+                return True
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return any(etag in tags for _, etag in self.variants.values())
+        if if_modified_since and self.modified:
+            try:
+                return self.modified <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def headers(self, coding, etag):
+        """Response headers for the chosen representation"""
+        headers = {
+            "Content-Type": "application/json",
+            "ETag": etag,
+            "Vary": "Accept-Encoding",
+            "Cache-Control": "no-cache",
+        }
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        if self.last_modified:
+            headers["Last-Modified"] = self.last_modified
+        return headers
@@ -0,0 +1,208 @@
+"""
+Quote cache for the NSE Stock Price API
+Double-buffered: the refresher applies per-symbol updates to a private
+working copy and publishes immutable snapshots by swapping one reference,
+so readers never take a lock or see a half-built dict.
+"""
+
+from datetime import datetime
+from functools import wraps
+from types import MappingProxyType
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot:
+    """An immutable, published view of the cache"""
+
+    __slots__ = ("data", "last_update", "generation", "published_at", "diffs", "encoded")
+
+    def __init__(self, data, last_update, generation, published_at, diffs=()):
+        self.data = data                  # read-only mapping: symbol -> quote dict (or None)
+        self.last_update = last_update    # datetime of the last completed refresh
+        self.generation = generation      # increases by one on every publish
+        self.published_at = published_at  # epoch seconds
+        self.diffs = diffs                # ((base, generation, changed symbols), ...) oldest first
+        self.encoded = None               # set by the cache's encoder before publishing
+
+    @property
+    def available(self):
+        """Number of symbols that have a quote (fresh or stale)"""
+        return sum(1 for quote in self.data.values() if quote is not None)
+
+    def changed_since(self, since):
+        """Symbols changed after generation ``since``, or None if that generation was evicted"""
+        if since >= self.generation:
+            return frozenset() if since == self.generation else None
+        if not self.diffs or self.diffs[0][0] > since:
+            return None
+        changed = set()
+        for _, generation, symbols in self.diffs:
+            if generation > since:
+                changed.update(symbols)
+        return changed
+
+
+# Per-quote fields that move on every fetch without the quote itself changing
+VOLATILE_FIELDS = ("last_updated", "stale_age_seconds")
+
+
+def _quote_changed(old, new):
+    if old is new:
+        return False
+    if old is None or new is None:
+        return True
+    return any(old.get(k) != new.get(k) for k in new.keys() | old.keys() if k not in VOLATILE_FIELDS)
+
+
+EMPTY_SNAPSHOT = Snapshot(MappingProxyType({}), None, 0, 0.0)
+
+
+def per_generation(maxsize=128):
+    """Memoize ``build(snapshot, *args)`` on ``(snapshot.generation, *args)``
+
+    Only the newest generation asked for is kept; its entries are dropped
+    as soon as a newer one arrives, and no snapshot is held by the cache.
+    Calls with an older snapshot are built but not cached.
+    """
+    def decorate(build):
+        lock = threading.Lock()
+        generation, entries = -1, {}
+
+        @wraps(build)
+        def cached(snapshot, *args):
+            nonlocal generation, entries
+            with lock:
+                if snapshot.generation > generation:
+                    generation, entries = snapshot.generation, {}
+                current = entries if snapshot.generation == generation else None
+            value = current.get(args) if current is not None else None
+            if value is None:
+                value = build(snapshot, *args)
+                if current is not None and len(current) < maxsize:
+                    current[args] = value
+            return value
+
+        return cached
+    return decorate
+
+
+class QuoteCache:
+    """Per-symbol quote cache with last-good-value retention
+
+    Writers (the refresher) call ``apply`` for each symbol as it arrives and
+    ``publish`` to make the changes visible. Readers only ever call
+    ``snapshot``, which is a single attribute read.
+    """
+
+    def __init__(self, publish_interval=0.5, encoder=None, diff_history=256):
+        self.publish_interval = publish_interval
+        self.diff_history = diff_history  # generations of diffs kept for changes_since
+        self.encoder = encoder  # encoder(snapshot) -> pre-serialized body, run once per generation
+        self._write_lock = threading.Lock()  # serialises writers only
+        self._working = {}
+        self._fetched_at = {}  # symbol -> epoch of the last good quote
+        self._dirty = False
+        self._last_publish = 0.0
+        self._snapshot = EMPTY_SNAPSHOT
+        self._listeners = []
+
+    def snapshot(self):
+        """Return the current published snapshot (lock-free)"""
+        return self._snapshot
+
+    def add_listener(self, listener):
+        """Call ``listener(snapshot)`` after every publish (from the writer's thread)"""
+        self._listeners.append(listener)
+
+    def apply(self, symbol, quote):
+        """Record one fetch result; a failed fetch (None) keeps the last good quote"""
+        with self._write_lock:
+            if quote is not None:
+                self._working[symbol] = dict(quote, stale=False)
+                self._fetched_at[symbol] = time.time()
+            elif self._working.get(symbol) is not None:
+                self._working[symbol] = dict(self._working[symbol], stale=True)
+            else:
+                self._working[symbol] = None
+            self._dirty = True
+
+    def maybe_publish(self):
+        """Publish if there are pending changes and ``publish_interval`` has elapsed"""
+        if self._dirty and time.monotonic() - self._last_publish >= self.publish_interval:
+            self.publish()
+
+    def restore(self, data, last_update=None, generation=None):
+        """Load previously persisted quotes, all flagged stale until refreshed, and publish"""
+        with self._write_lock:
+            for symbol, quote in data.items():
+                if quote is None:
+                    self._working.setdefault(symbol, None)
+                    continue
+                self._working[symbol] = dict(quote, stale=True)
+                try:
+                    self._fetched_at[symbol] = datetime.fromisoformat(quote["last_updated"]).timestamp()
+                except (KeyError, TypeError, ValueError):
+                    self._fetched_at[symbol] = time.time()
+            self._dirty = True
+        return self.publish(last_update=last_update, generation=generation)
+
+    def replace(self, data, last_update=None, generation=None):
+        """Replace the whole working set (e.g. with a snapshot written by another process) and publish"""
+        with self._write_lock:
+            self._working = dict(data)
+            self._dirty = True
+        return self.publish(last_update=last_update, generation=generation)
+
+    def publish(self, last_update=None, generation=None):
+        """Swap in a new immutable snapshot built from the working copy
+
+        ``generation`` lets a follower adopt the writer's numbering; it must
+        be greater than the current one.
+        """
+        with self._write_lock:
+            now = time.time()
+            data = {}
+            for symbol, quote in self._working.items():
+                if quote is not None and quote.get("stale") and symbol in self._fetched_at:
+                    quote = dict(quote, stale_age_seconds=round(now - self._fetched_at[symbol], 1))
+                    self._working[symbol] = quote
+                data[symbol] = quote
+
+            previous = self._snapshot
+            changed = frozenset(
+                symbol for symbol, quote in data.items()
+                if symbol not in previous.data or _quote_changed(previous.data[symbol], quote)
+            )
+            generation = max(generation or 0, previous.generation + 1)
+            snapshot = Snapshot(
+                MappingProxyType(data),
+                last_update or previous.last_update,
+                generation,
+                now,
+                (previous.diffs + ((previous.generation, generation, changed),))[-self.diff_history:],
+            )
+            if self.encoder is not None:
+                snapshot.encoded = self.encoder(snapshot)
+            self._snapshot = snapshot
+            self._dirty = False
+            self._last_publish = time.monotonic()
+
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.error(f"Quote cache listener failed: {str(e)}")
+        return snapshot
+
+    def ages(self, now=None):
+        """Seconds since the last good quote, per symbol"""
+        now = time.time() if now is None else now
+        return {symbol: now - fetched_at for symbol, fetched_at in list(self._fetched_at.items())}
+
+    def mark_refreshed(self):
+        """Publish the end of a full refresh cycle"""
+        return self.publish(last_update=datetime.now())
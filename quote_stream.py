@@ -0,0 +1,117 @@
+"""
+Quote push stream for the NSE Stock Price API
+Fans each published cache generation out to subscribers as per-symbol
+deltas. Every subscriber holds at most one pending quote per symbol, so a
+slow consumer only ever skips to the latest price (drop-to-latest) instead
+of buffering without limit.
+"""
+
+import json
+import threading
+
+
+class Subscriber:
+    """One stream client's mailbox of pending quote updates"""
+
+    def __init__(self, symbols=None, notify=None):
+        self.symbols = frozenset(symbols) if symbols else None  # None = every symbol
+        self.notify = notify  # optional wake-up hook, e.g. for an asyncio loop
+        self.generation = 0
+        self.dropped = 0      # updates superseded before the client read them
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def offer(self, updates, generation):
+        with self._lock:
+            for symbol, quote in updates.items():
+                if symbol in self._pending:
+                    self.dropped += 1
+                self._pending[symbol] = quote
+            self.generation = generation
+        self._ready.set()
+        if self.notify is not None:
+            self.notify()
+
+    def drain(self):
+        """Take every pending update: ``(updates, generation)``"""
+        with self._lock:
+            updates, self._pending = self._pending, {}
+            self._ready.clear()
+            return updates, self.generation
+
+    def wait(self, timeout=None):
+        """Block until updates arrive (or ``timeout``), then drain"""
+        self._ready.wait(timeout)
+        return self.drain()
+
+
+class QuoteBroker:
+    """Routes changed symbols to the subscribers interested in them"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._all = set()        # subscribers to every symbol
+        self._by_symbol = {}     # symbol -> set of subscribers
+
+    def subscribe(self, symbols=None, notify=None):
+        subscriber = Subscriber(symbols, notify)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if subscriber.symbols is None:
+                self._all.add(subscriber)
+            else:
+                for symbol in subscriber.symbols:
+                    self._by_symbol.setdefault(symbol, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            self._all.discard(subscriber)
+            for symbol in subscriber.symbols or ():
+                subscribers = self._by_symbol.get(symbol)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._by_symbol[symbol]
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, snapshot):
+        """QuoteCache listener: push the symbols changed in this generation"""
+        if not snapshot.diffs:
+            return
+        _, generation, changed = snapshot.diffs[-1]
+        if generation != snapshot.generation or not changed:
+            return
+
+        self.broadcast({symbol: snapshot.data.get(symbol) for symbol in changed}, generation)
+
+    def broadcast(self, updates, generation):
+        """Offer ``{key: value}`` updates to every subscriber interested in their keys"""
+        with self._lock:
+            everyone = list(self._all)
+            targeted = {}
+            for key, value in updates.items():
+                for subscriber in self._by_symbol.get(key, ()):
+                    targeted.setdefault(subscriber, {})[key] = value
+
+        for subscriber in everyone:
+            subscriber.offer(updates, generation)
+        for subscriber, subset in targeted.items():
+            subscriber.offer(subset, generation)
+
+
+def format_sse(data, event=None, event_id=None):
+    """Encode one Server-Sent Events message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
@@ -0,0 +1,401 @@
+"""
+Shared-memory quote table for multi-process workers
+A fixed-layout NumPy structured array in an mmap'd file (put it on
+/dev/shm for pure shared memory). One writer process publishes every cache
+generation into it under a seqlock; any number of reader processes map the
+same pages and copy a consistent view without locks, pickling or IPC.
+
+Symbols that do not fit (past ``capacity``, or not a short ASCII name) are
+left out of the table rather than failing the publish; the header counts
+them so every worker can report it.
+
+Readers never fetch: they append the symbols they are asked for (and
+manual refresh requests) to a small request file, and the writer fetches
+them, keeps them hot and publishes.
+"""
+
+from datetime import datetime
+import fcntl
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from snapshot_file import LeaderLock
+
+logger = logging.getLogger(__name__)
+
+MAGIC = 0x4E534551  # "NSEQ"
+LAYOUT_VERSION = 4
+REQUEST_POLL_SECONDS = 0.05  # how often the writer looks for reader requests
+REFRESH_REQUEST = "*"        # request-file line asking the writer for a full refresh (never a symbol)
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "<u4"),
+    ("layout", "<u4"),
+    ("capacity", "<u4"),
+    ("count", "<u4"),
+    ("seq", "<u8"),           # seqlock: odd while the writer is mid-update
+    ("generation", "<u8"),
+    ("last_update", "<f8"),   # epoch seconds, 0 = never
+    ("published_at", "<f8"),
+    ("dropped", "<u4"),       # symbols of the last publish left out of the table
+    ("_pad", "V4"),
+    ("served_at", "<f8"),     # reader requests sent before this epoch have been published
+])
+
+ROW_DTYPE = np.dtype([
+    ("symbol", "S32"),
+    ("trade_date", "S10"),    # YYYY-MM-DD of the quote's bar, empty if unknown
+    ("has_quote", "u1"),
+    ("stale", "u1"),
+    ("market_open", "u1"),
+    ("_pad", "V3"),  # keep the floats 8-byte aligned
+    ("price", "<f8"),
+    ("previous_close", "<f8"),
+    ("change", "<f8"),
+    ("change_percent", "<f8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("volume", "<i8"),
+    ("updated_at", "<f8"),    # epoch of the quote's own last_updated
+    ("stale_age", "<f8"),
+])
+
+PRICE_FIELDS = ("price", "previous_close", "change", "change_percent", "open", "high", "low")
+
+
+class QuoteTable:
+    """Array-backed symbol -> quote table in a shared mapping"""
+
+    def __init__(self, path, capacity=4096, writer=False):
+        """Map the table at ``path``; only the writer creates or re-lays it out
+
+        Readers raise FileNotFoundError until the writer has created it.
+        """
+        self.path = path
+        if writer:
+            size = HEADER_DTYPE.itemsize + capacity * ROW_DTYPE.itemsize
+            if not os.path.exists(path) or os.path.getsize(path) != size:
+                with open(path, "wb") as f:
+                    f.truncate(size)
+        else:
+            size = os.path.getsize(path)
+        self._mm = np.memmap(path, dtype=np.uint8, mode="r+" if writer else "r", shape=(size,))
+        self.header = self._mm[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)
+        self.rows = self._mm[HEADER_DTYPE.itemsize:].view(ROW_DTYPE)
+        if writer and (self.header["magic"][0] != MAGIC or self.header["layout"][0] != LAYOUT_VERSION
+                       or self.header["capacity"][0] != capacity):
+            self.header[0] = (MAGIC, LAYOUT_VERSION, capacity, 0, 0, 0, 0.0, 0.0, 0, b"", 0.0)
+        self.capacity = len(self.rows)
+        self._dropped = ()        # writer: symbols left out of the last publish, to log changes once
+
+    @property
+    def generation(self):
+        """Cheap check for readers: has anything been published since?"""
+        return int(self.header["generation"][0])
+
+    @property
+    def dropped(self):
+        """Symbols of the last publish that did not fit in the table"""
+        return int(self.header["dropped"][0])
+
+    @property
+    def served_at(self):
+        """Epoch before which every reader request has been fetched and published"""
+        return float(self.header["served_at"][0])
+
+    # -- writer side -------------------------------------------------------
+
+    def write(self, snapshot):
+        """Publish a QuoteCache snapshot (single writer only)
+
+        Symbols past ``capacity`` or that cannot be stored (non-ASCII, or
+        longer than the symbol field) are skipped and counted in ``dropped``.
+        """
+        staged = np.zeros(min(len(snapshot.data), self.capacity), dtype=ROW_DTYPE)
+        count = 0
+        dropped = []
+        for symbol, quote in snapshot.data.items():
+            try:
+                encoded = symbol.encode("ascii")
+            except UnicodeEncodeError:
+                encoded = None
+            if count == len(staged) or encoded is None or len(encoded) > ROW_DTYPE["symbol"].itemsize:
+                dropped.append(symbol)
+                continue
+            row = staged[count]
+            count += 1
+            row["symbol"] = encoded
+            if quote is None:
+                continue
+            row["has_quote"] = 1
+            row["stale"] = bool(quote.get("stale"))
+            row["market_open"] = quote.get("market_status") == "open"
+            for field in PRICE_FIELDS:
+                row[field] = quote[field]
+            row["volume"] = quote["volume"]
+            row["trade_date"] = (quote.get("trade_date") or "").encode("ascii")
+            row["updated_at"] = datetime.fromisoformat(quote["last_updated"]).timestamp()
+            row["stale_age"] = quote.get("stale_age_seconds", 0.0)
+        staged = staged[:count]
+        if tuple(dropped) != self._dropped:
+            self._dropped = tuple(dropped)
+            if dropped:
+                logger.warning(f"Quote table ({self.capacity} rows) left out {len(dropped)} symbols, "
+                               f"e.g. {', '.join(dropped[:5])}")
+
+        header = self.header
+        header["seq"] += 1  # odd: readers retry
+        self.rows[:len(staged)] = staged
+        header["count"] = len(staged)
+        header["generation"] = snapshot.generation
+        header["last_update"] = snapshot.last_update.timestamp() if snapshot.last_update else 0.0
+        header["published_at"] = snapshot.published_at
+        header["dropped"] = len(dropped)
+        header["seq"] += 1  # even: consistent again
+
+    def served(self, started):
+        """Record that requests read at ``started`` have been published (writer only)"""
+        self.header["served_at"] = started
+
+    # -- reader side -------------------------------------------------------
+
+    def read_rows(self, retries=1000):
+        """Consistent copy of ``(header, rows)`` using the seqlock"""
+        header = self.header
+        for _ in range(retries):
+            seq = int(header["seq"][0])
+            if seq & 1:
+                time.sleep(0)
+                continue
+            head = header.copy()
+            rows = self.rows[:int(head["count"][0])].copy()
+            if int(header["seq"][0]) == seq:
+                return head[0], rows
+        raise TimeoutError("Quote table writer did not settle")
+
+    def read(self):
+        """Decode the table into ``(data, last_update, generation)`` for QuoteCache.replace"""
+        head, rows = self.read_rows()
+        data = {}
+        for row in rows:
+            symbol = row["symbol"].decode("ascii")
+            if not row["has_quote"]:
+                data[symbol] = None
+                continue
+            quote = {
+                "symbol": symbol,
+                "name": symbol.replace(".NS", ""),
+            }
+            for field in PRICE_FIELDS:
+                quote[field] = float(row[field])
+            quote["volume"] = int(row["volume"])
+            quote["trade_date"] = row["trade_date"].decode("ascii") or None
+            quote["currency"] = "INR"
+            quote["last_updated"] = datetime.fromtimestamp(row["updated_at"]).isoformat()
+            quote["market_status"] = "open" if row["market_open"] else "closed"
+            quote["stale"] = bool(row["stale"])
+            if row["stale"]:
+                quote["stale_age_seconds"] = float(row["stale_age"])
+            data[symbol] = quote
+        last_update = datetime.fromtimestamp(head["last_update"]) if head["last_update"] else None
+        return data, last_update, int(head["generation"])
+
+
+class SymbolRequests:
+    """Append-only file of symbols readers want the writer to fetch
+
+    Readers append under an exclusive flock; the writer reads what is new
+    under the same lock and empties the file once it has read past
+    ``max_size``, so no request is lost between the read and the truncate.
+    """
+
+    def __init__(self, path, max_size=1 << 16):
+        self.path = path
+        self.max_size = max_size
+        self._offset = 0          # writer: bytes already read
+
+    def send(self, symbols):
+        """Append ``symbols`` (ASCII); returns the epoch at which they were written"""
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            os.write(fd, "".join(f"{symbol}\n" for symbol in symbols).encode("ascii"))
+            return time.time()
+        finally:
+            os.close(fd)
+
+    def receive(self):
+        """``(started, symbols)`` appended since the last call, or ``(None, [])`` if nothing is new
+
+        Every request written before ``started`` is among ``symbols``.
+        """
+        try:
+            if os.path.getsize(self.path) == self._offset:
+                return None, []
+        except FileNotFoundError:
+            return None, []
+        with open(self.path, "r+b") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            started = time.time()
+            if os.fstat(f.fileno()).st_size < self._offset:
+                self._offset = 0
+            f.seek(self._offset)
+            chunk = f.read()
+            self._offset += len(chunk)
+            if self._offset >= self.max_size:
+                f.truncate(0)
+                self._offset = 0
+        return started, list(dict.fromkeys(chunk.decode("ascii", "replace").split()))
+
+
+class SharedQuoteWorker:
+    """Decides whether this process refreshes (writer) or follows the table (reader)
+
+    The writer is whichever process holds ``<path>.lock``. It runs the
+    refresh scheduler (anything with thread-safe ``start`` and ``trigger``),
+    copies every cache publish into the table and fetches the symbols
+    readers ask for (``on_request``). Readers never contact the
+    upstream or publish on their own: they load the table into their own
+    cache whenever the writer publishes a newer generation, and take over if
+    the writer exits.
+    """
+
+    def __init__(self, path, cache, scheduler, capacity=4096, poll_interval=0.5, on_writer=None,
+                 on_request=None, touch_interval=60.0):
+        self.path = path
+        self.on_writer = on_writer  # called once this process becomes the writer
+        self.on_request = on_request  # writer: on_request(symbols) fetches / keeps hot what readers asked for
+        self.touch_interval = touch_interval  # reader: re-send a cached symbol at most this often
+        self.cache = cache
+        self.scheduler = scheduler
+        self.capacity = capacity
+        self.poll_interval = poll_interval
+        self.lock = LeaderLock(path + ".lock")
+        self.requests = SymbolRequests(path + ".requests")
+        self.table = None
+        self._adopted = 0         # reader: last writer generation loaded into the cache
+        self._sent = {}           # reader: symbol -> monotonic time it was last sent to the writer
+        self._last_attempt = 0.0
+        self._sync_lock = threading.Lock()
+        self._poller = None
+
+    @property
+    def role(self):
+        return "writer" if self.lock.held else "reader"
+
+    def status(self):
+        """Table size and how many symbols of the last publish did not fit (for /api/health)"""
+        table = self.table
+        return {
+            "role": self.role,
+            "capacity": table.capacity if table is not None else self.capacity,
+            "symbols": int(table.header["count"][0]) if table is not None else 0,
+            "dropped": table.dropped if table is not None else 0,
+        }
+
+    def start(self):
+        if self.lock.try_acquire():
+            self._become_writer()
+        else:
+            logger.info(f"Reading quotes from shared table {self.path}")
+            self.sync()
+            self._poller = threading.Thread(target=self._poll, name="quote-table-poll", daemon=True)
+            self._poller.start()
+
+    def sync(self):
+        """Bring the local cache up to the table's generation (readers only; cheap when current)"""
+        if self.lock.held:
+            return
+        with self._sync_lock:
+            now = time.monotonic()
+            if now - self._last_attempt >= 1.0:
+                self._last_attempt = now
+                if self.lock.try_acquire():
+                    logger.info("Quote table writer gone; taking over")
+                    self._become_writer()
+                    return
+            if self.table is None:
+                try:
+                    self.table = QuoteTable(self.path)
+                except FileNotFoundError:
+                    return
+            if self.table.generation > self._adopted:
+                data, last_update, generation = self.table.read()
+                self.cache.replace(data, last_update=last_update, generation=generation)
+                self._adopted = generation
+
+    def request(self, symbols, timeout):
+        """Ask the writer for ``symbols`` (readers only)
+
+        Uncached symbols are sent at once and waited for, up to ``timeout``
+        seconds, until the writer has published its answer. Cached ones are
+        sent at most every ``touch_interval`` so the writer keeps them hot,
+        without waiting.
+        """
+        now = time.monotonic()
+        data = self.cache.snapshot().data
+        missing = [symbol for symbol in symbols if symbol not in data]
+        send = missing + [symbol for symbol in symbols
+                          if symbol in data and now - self._sent.get(symbol, -self.touch_interval) >= self.touch_interval]
+        if not send:
+            return
+        if len(self._sent) > 4096:
+            self._sent = {symbol: at for symbol, at in self._sent.items() if now - at < self.touch_interval}
+        for symbol in send:
+            self._sent[symbol] = now
+        sent_at = self.requests.send(send)
+        deadline = now + timeout
+        while missing and self.table is not None and time.monotonic() < deadline and not self.lock.held:
+            if self.table.served_at >= sent_at:
+                self.sync()
+                return
+            time.sleep(REQUEST_POLL_SECONDS)
+
+    def request_refresh(self):
+        """Ask the writer for a refresh now (readers only; the writer's backoff still applies)"""
+        self.requests.send([REFRESH_REQUEST])
+
+    def release(self):
+        """Give up the writer role (on shutdown) so a reader can take over"""
+        self.lock.release()
+
+    def _become_writer(self):
+        logger.info(f"Refreshing quotes into shared table {self.path}")
+        self.table = QuoteTable(self.path, self.capacity, writer=True)
+        if self.on_writer is not None:
+            self.on_writer()
+        if self.cache.snapshot().generation <= self.table.generation:
+            # Number on from what readers already adopted, or they would ignore us
+            self.cache.publish(generation=self.table.generation + 1)
+        self.table.write(self.cache.snapshot())
+        self.cache.add_listener(self.table.write)
+        self.scheduler.start()
+        threading.Thread(target=self._serve_requests, name="quote-table-requests", daemon=True).start()
+
+    def _serve_requests(self):
+        while True:
+            try:
+                started, symbols = self.requests.receive()
+                if started is not None:
+                    if REFRESH_REQUEST in symbols:
+                        symbols.remove(REFRESH_REQUEST)
+                        self.scheduler.trigger()
+                    if symbols and self.on_request is not None:
+                        self.on_request(symbols)
+                    self.table.served(started)
+            except Exception as e:
+                logger.error(f"Serving quote requests failed: {str(e)}")
+            time.sleep(REQUEST_POLL_SECONDS)
+
+    def _poll(self):
+        while not self.lock.held:
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"Quote table sync failed: {str(e)}")
+            time.sleep(self.poll_interval)
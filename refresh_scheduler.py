@@ -0,0 +1,216 @@
+"""
+Refresh scheduler for the NSE Stock Price API
+One background thread (or asyncio task) owns the refresh loop. Manual
+triggers wake it (or join a refresh that is already running) instead of
+starting new loops, failures back off with jitter (manual triggers wait it
+out too), and the cadence follows NSE market hours.
+"""
+
+from datetime import datetime, time as dtime, timedelta, timezone
+import asyncio
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# NSE trades 09:15-15:30 IST, Monday to Friday (India has no DST)
+IST = timezone(timedelta(hours=5, minutes=30))
+MARKET_OPEN = dtime(9, 15)
+MARKET_CLOSE = dtime(15, 30)
+
+
+def is_market_open(now=None):
+    """True during NSE regular trading hours"""
+    now = (now or datetime.now(IST)).astimezone(IST)
+    return now.weekday() < 5 and MARKET_OPEN <= now.time() <= MARKET_CLOSE
+
+
+class _RefreshPolicy:
+    """Interval, backoff and bookkeeping shared by the thread and asyncio schedulers
+
+    ``refresh_fn`` should raise on failure; the next attempt is then delayed
+    by an exponential, jittered backoff instead of the normal interval.
+    """
+
+    def __init__(self, refresh_fn, open_interval=60, closed_interval=1800,
+                 retry_base=15, retry_max=600, market_open_fn=is_market_open):
+        self.refresh_fn = refresh_fn
+        self.open_interval = open_interval
+        self.closed_interval = closed_interval
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.market_open_fn = market_open_fn
+
+        self._running = False
+        self.consecutive_failures = 0
+        self.last_success = None
+        self.last_error = None
+        self.next_run_at = None
+
+    def next_delay(self):
+        """Seconds until the next scheduled refresh, given the last outcome"""
+        if self.consecutive_failures:
+            backoff = min(self.retry_max, self.retry_base * 2 ** (self.consecutive_failures - 1))
+            return backoff / 2 + random.uniform(0, backoff / 2)
+        return self.open_interval if self.market_open_fn() else self.closed_interval
+
+    def backoff_remaining(self):
+        """Seconds left before the retry after a failed refresh (0 if not backing off)"""
+        if not self.consecutive_failures or self.next_run_at is None:
+            return 0.0
+        return max(0.0, self.next_run_at - time.monotonic())
+
+    def status(self):
+        return {
+            "running": self._running,
+            "market_open": self.market_open_fn(),
+            "consecutive_failures": self.consecutive_failures,
+            "last_success": self.last_success.isoformat() if self.last_success else None,
+            "last_error": self.last_error,
+            "next_refresh_in": round(max(0.0, self.next_run_at - time.monotonic()), 1)
+            if self.next_run_at else None,
+        }
+
+    def _record_success(self):
+        self.consecutive_failures = 0
+        self.last_success = datetime.now()
+        self.last_error = None
+
+    def _record_failure(self, error):
+        self.consecutive_failures += 1
+        self.last_error = str(error)
+        logger.error(f"Refresh failed ({self.consecutive_failures} in a row): {str(error)}")
+
+    def _schedule_next(self):
+        delay = self.next_delay()
+        self.next_run_at = time.monotonic() + delay
+        logger.info(f"Next refresh in {delay:.1f}s")
+        return delay
+
+
+class RefreshScheduler(_RefreshPolicy):
+    """Single background thread running a blocking ``refresh_fn()``"""
+
+    def __init__(self, refresh_fn, **kwargs):
+        super().__init__(refresh_fn, **kwargs)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._current_done = None
+        self._next_done = threading.Event()
+
+    def start(self):
+        """Start the refresh loop; the first refresh runs immediately. Idempotent."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._wake.set()
+            self._thread = threading.Thread(target=self._loop, name="refresh-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def trigger(self):
+        """Request a refresh now
+
+        Returns ``(done_event, joined)``. If a refresh is already running the
+        caller joins it (``joined`` is True) rather than queueing another.
+        During a failure backoff nothing is woken: the event is the scheduled
+        retry's.
+        """
+        with self._lock:
+            if self._running:
+                return self._current_done, True
+            if not self.backoff_remaining():
+                self._wake.set()
+            return self._next_done, False
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            self._wake.wait()
+            if self._stopped.is_set():
+                break
+
+            with self._lock:
+                self._wake.clear()
+                self._running = True
+                self._current_done, self._next_done = self._next_done, threading.Event()
+
+            try:
+                self.refresh_fn()
+                self._record_success()
+            except Exception as e:
+                self._record_failure(e)
+            finally:
+                with self._lock:
+                    self._running = False
+                    self._current_done.set()
+
+            self._wake.wait(self._schedule_next())
+            self._wake.set()
+
+
+class AsyncRefreshScheduler(_RefreshPolicy):
+    """The same refresh loop as an asyncio task; ``refresh_fn`` runs in the default executor"""
+
+    def __init__(self, refresh_fn, **kwargs):
+        super().__init__(refresh_fn, **kwargs)
+        self._task = None
+        self._wake = None
+        self._current_done = None
+        self._next_done = None
+
+    def start(self):
+        """Start the refresh task on the running loop; the first refresh runs immediately"""
+        if self._task is not None and not self._task.done():
+            return
+        self._wake = asyncio.Event()
+        self._wake.set()
+        self._next_done = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._loop(), name="refresh-scheduler")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def trigger(self):
+        """Request a refresh now; returns ``(done_event, joined)`` like RefreshScheduler"""
+        if self._running:
+            return self._current_done, True
+        if not self.backoff_remaining():
+            self._wake.set()
+        return self._next_done, False
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            self._running = True
+            self._current_done, self._next_done = self._next_done, asyncio.Event()
+
+            try:
+                await loop.run_in_executor(None, self.refresh_fn)
+                self._record_success()
+            except Exception as e:
+                self._record_failure(e)
+            finally:
+                self._running = False
+                self._current_done.set()
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), self._schedule_next())
+            except asyncio.TimeoutError:
+                self._wake.set()
@@ -0,0 +1,270 @@
+"""
+Monte Carlo risk engine for Trading Journal Pro
+Replaces the point-metric risk score of updateRiskAnalysis in app.js with
+simulated distributions, per account and for the whole journal:
+
+- the realized trade sequence (closed-trade P&L) is resampled with
+  replacement into many equity paths from the starting capital, giving the
+  P&L VaR / CVaR over the next run of trades, the probability of ruin
+  (equity falling to ``1 - ruin`` of capital at any point) and the max
+  drawdown distribution;
+- open positions are revalued over a horizon of days drawn, whole days at a
+  time, from their symbols' stored daily returns, so correlation between
+  held symbols is kept, giving VaR / CVaR of the open book.
+
+Paths are simulated in batches of a bounded number of cells, so 100k+ paths
+over hundreds of trades stay within a few MB. Results are cached per
+(trade-set version, parameters); a ``seed`` makes a run reproducible.
+"""
+
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+import numpy as np
+
+from history_store import CLOSE, DATE
+from journal_analytics import INITIAL_CAPITAL
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATHS = 100000
+DEFAULT_CONFIDENCE = 95.0
+DEFAULT_HORIZON_DAYS = 1
+DEFAULT_LOOKBACK_DAYS = 250
+DEFAULT_RUIN = 0.5            # fraction of capital lost that counts as ruin
+MAX_PATHS = 1000000
+DEFAULT_TRADE_HORIZON = 500   # future trades per path, unless the account has fewer
+MAX_TRADE_HORIZON = 5000
+BATCH_CELLS = 500000          # simulated values held at once per batch (4 MB)
+DRAWDOWN_PERCENTILES = (50, 75, 90, 95, 99)
+PL_PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+HISTOGRAM_BINS = 20
+TOTAL = "All"
+
+
+def batches(paths, cells_per_path):
+    """Batch sizes covering ``paths`` with at most BATCH_CELLS values per batch"""
+    size = max(1, BATCH_CELLS // max(1, cells_per_path))
+    while paths > 0:
+        yield min(size, paths)
+        paths -= size
+
+
+def tail(pl, confidence):
+    """(VaR, CVaR) of a P&L sample at ``confidence`` percent, as positive losses"""
+    count = max(1, int(len(pl) * (100 - confidence) / 100))
+    worst = np.partition(pl, count - 1)[:count]
+    return float(-worst.max()), float(-worst.mean())
+
+
+def distribution(values, percentiles, bins=None):
+    summary = {
+        "mean": float(values.mean()),
+        "percentiles": {str(p): float(v) for p, v in zip(percentiles, np.percentile(values, percentiles))},
+    }
+    if bins:
+        counts, edges = np.histogram(values, bins=bins)
+        summary["histogram"] = {"edges": edges.round(4).tolist(), "counts": counts.tolist()}
+    return summary
+
+
+def bootstrap_trades(pl, capital, horizon, paths, rng, ruin=DEFAULT_RUIN):
+    """Resample ``horizon`` trades (with replacement) per path
+
+    Returns (final P&L, max drawdown %, ruined) arrays of length ``paths``.
+    Drawdown is measured as calculateMaxDrawdown does, from peaks of an
+    equity curve starting at ``capital``.
+    """
+    final = np.empty(paths)
+    drawdown = np.empty(paths)
+    ruined = np.empty(paths, dtype=bool)
+    floor = capital * (1 - ruin)
+    done = 0
+    for size in batches(paths, horizon):
+        equity = capital + np.cumsum(pl[rng.integers(0, len(pl), (size, horizon))], axis=1)
+        peaks = np.maximum(np.maximum.accumulate(equity, axis=1), capital)
+        part = slice(done, done + size)
+        final[part] = equity[:, -1] - capital
+        drawdown[part] = ((peaks - equity) / peaks).max(axis=1) * 100
+        ruined[part] = equity.min(axis=1) <= floor
+        done += size
+    return final, drawdown, ruined
+
+
+def bootstrap_positions(returns, exposure, horizon, paths, rng):
+    """P&L of the open book over ``horizon`` days, per exposure column
+
+    ``returns`` is (days, symbols) of simple daily returns; whole days are
+    drawn so symbols move together as they did. ``exposure`` is
+    (symbols, books) of signed position value. Returns (paths, books).
+    """
+    log_returns = np.log1p(returns)
+    pl = np.empty((paths, exposure.shape[1]))
+    done = 0
+    for size in batches(paths, horizon * returns.shape[1]):
+        growth = np.expm1(log_returns[rng.integers(0, len(returns), (size, horizon))].sum(axis=1))
+        pl[done:done + size] = growth @ exposure
+        done += size
+    return pl
+
+
+def symbol_returns(store, symbols, lookback=DEFAULT_LOOKBACK_DAYS):
+    """(symbols with history, (days, symbols) daily returns) over the last ``lookback`` shared days
+
+    Symbols are aligned on the union of their dates; a day a symbol did not
+    trade counts as no move.
+    """
+    closes = {}
+    for symbol in symbols:
+        bars = store.load(symbol)
+        if bars is not None and bars.shape[1] > 1:
+            closes[symbol] = bars[[DATE, CLOSE], -(lookback + 1):]
+    if not closes:
+        return [], np.empty((0, 0))
+    dates = np.unique(np.concatenate([bars[0] for bars in closes.values()]))[-(lookback + 1):]
+    matrix = np.full((len(dates), len(closes)), np.nan)
+    for column, bars in enumerate(closes.values()):
+        keep = bars[0] >= dates[0]
+        matrix[np.searchsorted(dates, bars[0][keep]), column] = bars[1][keep]
+    # carry the last close over missing days, so the gap is a zero return
+    filled = np.where(np.isnan(matrix), 0, np.arange(len(dates))[:, None])
+    matrix = matrix[np.maximum.accumulate(filled, axis=0), np.arange(len(closes))]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        returns = matrix[1:] / matrix[:-1] - 1
+    return list(closes), np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+class RiskEngine:
+    """Monte Carlo risk per account, cached per (trade-set version, parameters)
+
+    ``returns_fn(symbols, lookback)`` returns ``(symbols, returns)`` as
+    symbol_returns does; ``price_fn(symbol)`` the price to value an open
+    position at (None falls back to its entry price). ``symbol_key`` maps a
+    journal symbol to the key used by both.
+    """
+
+    def __init__(self, returns_fn, price_fn=None, symbol_key=None, max_results=32):
+        self.returns_fn = returns_fn
+        self.price_fn = price_fn or (lambda symbol: None)
+        self.symbol_key = symbol_key or (lambda symbol: symbol)
+        self.max_results = max_results
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def analyze(self, version, frame_fn, paths=DEFAULT_PATHS, trades=None, horizon=DEFAULT_HORIZON_DAYS,
+                confidence=DEFAULT_CONFIDENCE, ruin=DEFAULT_RUIN, lookback=DEFAULT_LOOKBACK_DAYS,
+                capital=INITIAL_CAPITAL, seed=None):
+        """Risk for every account (and ``"All"``) of the trades in ``frame_fn()``
+
+        ``trades`` is the number of future trades per path (default: as many
+        as each account has closed, up to 500); ``horizon`` the open-position
+        horizon in days. Raises ValueError on out-of-range parameters.
+        """
+        paths, horizon, lookback = int(paths), int(horizon), int(lookback)
+        confidence, ruin, capital = float(confidence), float(ruin), float(capital)
+        trades = int(trades) if trades else None
+        if not 0 < paths <= MAX_PATHS:
+            raise ValueError(f"paths must be between 1 and {MAX_PATHS}")
+        if not 50 <= confidence < 100:
+            raise ValueError("confidence must be a percentage in [50, 100)")
+        if not 0 < ruin <= 1:
+            raise ValueError("ruin must be a fraction of capital in (0, 1]")
+        if horizon < 1 or lookback < 2 or capital <= 0 or (trades is not None and trades < 1):
+            raise ValueError("horizon, trades and capital must be positive and lookback at least 2")
+
+        key = (version, paths, trades, horizon, confidence, ruin, lookback, capital, seed)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+
+        started = time.perf_counter()
+        frame = frame_fn()
+        rng = np.random.default_rng(seed)
+        books = [TOTAL] + [name for name in frame.account_names.tolist()]
+        masks = [np.ones(frame.size, dtype=bool)] + [frame.account == code for code in range(len(books) - 1)]
+
+        accounts = {}
+        for name, mask in zip(books, masks):
+            pl = frame.pl[mask & frame.closed]
+            accounts[name] = {
+                "closedTrades": int(len(pl)),
+                "openPositions": int((mask & ~frame.closed).sum()),
+                "trades": self._trade_risk(pl, trades, paths, confidence, ruin, capital, rng),
+            }
+        positions = self._position_risk(frame, masks, paths, horizon, confidence, lookback, rng)
+        for name, risk in zip(books, positions):
+            accounts[name]["positions"] = risk
+
+        result = {
+            "version": version,
+            "paths": paths,
+            "seed": seed,
+            "confidence": confidence,
+            "capital": capital,
+            "total": accounts.pop(TOTAL),
+            "accounts": accounts,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        logger.info(f"Simulated risk for {len(accounts)} accounts, {paths} paths in {result['seconds']}s")
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        return result
+
+    def _trade_risk(self, pl, trades, paths, confidence, ruin, capital, rng):
+        if not len(pl):
+            return None
+        horizon = min(trades, MAX_TRADE_HORIZON) if trades else min(len(pl), DEFAULT_TRADE_HORIZON)
+        final, drawdown, ruined = bootstrap_trades(pl, capital, horizon, paths, rng, ruin)
+        var, cvar = tail(final, confidence)
+        return {
+            "horizon": horizon,
+            "var": var,
+            "cvar": cvar,
+            "ruinProbability": float(ruined.mean()),
+            "finalPL": distribution(final, PL_PERCENTILES),
+            "maxDrawdown": distribution(drawdown, DRAWDOWN_PERCENTILES, HISTOGRAM_BINS),
+        }
+
+    def _position_risk(self, frame, masks, paths, horizon, confidence, lookback, rng):
+        """Open-book risk per mask (None for a mask with no open positions)"""
+        open_rows = np.flatnonzero(~frame.closed)
+        keys = [self.symbol_key(symbol) for symbol in frame.symbol[open_rows].tolist()]
+        symbols, returns = self.returns_fn(list(dict.fromkeys(keys)), lookback)
+        column = {symbol: i for i, symbol in enumerate(symbols)}
+
+        prices = {key: self.price_fn(key) for key in set(keys)}
+        value = np.array([prices[key] if prices[key] is not None else frame.entry_price[row]
+                          for key, row in zip(keys, open_rows)], dtype=float)
+        value = np.nan_to_num(value * frame.quantity[open_rows] * frame.direction[open_rows])
+        modelled = np.array([key in column for key in keys], dtype=bool)
+        exposure = np.zeros((len(symbols), len(masks)))
+        for book, mask in enumerate(masks):
+            held = mask[open_rows] & modelled
+            np.add.at(exposure[:, book], [column[key] for key, h in zip(keys, held) if h], value[held])
+
+        active = [book for book, mask in enumerate(masks) if mask[open_rows].any()]
+        risks = [None] * len(masks)
+        if not active:
+            return risks
+        pl = bootstrap_positions(returns, exposure[:, active], horizon, paths, rng) if len(symbols) else None
+        for i, book in enumerate(active):
+            held = masks[book][open_rows]
+            risk = {
+                "horizonDays": horizon,
+                "grossExposure": float(np.abs(value[held]).sum()),
+                "netExposure": float(value[held].sum()),
+                "unmodelled": sorted({key for key, h in zip(keys, held & ~modelled) if h}),
+                "var": 0.0,
+                "cvar": 0.0,
+                "pl": None,
+            }
+            if pl is not None and exposure[:, book].any():
+                risk["var"], risk["cvar"] = tail(pl[:, i], confidence)
+                risk["pl"] = distribution(pl[:, i], PL_PERCENTILES)
+            risks[book] = risk
+        return risks
@@ -0,0 +1,84 @@
+"""
+Snapshot files for the NSE Stock Price API
+Cache snapshots are written atomically (temp file + rename) so a reader or
+a restarting server never sees a partial file. Used for warm restarts.
+LeaderLock elects the one worker that refreshes (see quote_table.py).
+"""
+
+from datetime import datetime
+import fcntl
+import gzip
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+def write_snapshot(path, snapshot):
+    """Atomically write a cache snapshot (temp file + rename); gzipped if ``path`` ends in .gz"""
+    payload = {
+        "generation": snapshot.generation,
+        "published_at": snapshot.published_at,
+        "last_update": snapshot.last_update.isoformat() if snapshot.last_update else None,
+        "data": dict(snapshot.data),
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+            f.write(gzip.compress(body, compresslevel=1) if path.endswith(".gz") else body)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_snapshot(path):
+    """Load a snapshot file: ``(data, last_update, generation)`` or None if absent"""
+    try:
+        with open(path, "rb") as f:
+            body = f.read()
+    except FileNotFoundError:
+        return None
+    payload = json.loads(gzip.decompress(body) if path.endswith(".gz") else body)
+    last_update = payload.get("last_update")
+    return (
+        payload["data"],
+        datetime.fromisoformat(last_update) if last_update else None,
+        payload.get("generation"),
+    )
+
+
+class LeaderLock:
+    """Non-blocking exclusive file lock; released automatically if the holder dies"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def try_acquire(self):
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
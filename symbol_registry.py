@@ -0,0 +1,159 @@
+"""
+Symbol registry for the NSE Stock Price API
+Holds the symbols the API knows about (loaded from a file of thousands, or
+just the built-in watch list), deduplicated, and splits them into refresh
+tiers:
+
+- hot: the core watch list, symbols with open positions (pinned) and
+  symbols requested in the last ``hot_ttl`` seconds; the refresh cycle
+  fetches only these;
+- cold: everything else, fetched on demand when first requested (after
+  which it stays hot for ``hot_ttl``).
+
+SingleFlight makes concurrent on-demand requests for one symbol share a
+single upstream fetch.
+"""
+
+from concurrent.futures import Future
+import csv
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper-case NSE / Yahoo style tickers: RELIANCE.NS, M&M.NS, BAJAJ-AUTO.NS, ^NSEI
+SYMBOL_PATTERN = re.compile(r"^[A-Z0-9^][A-Z0-9&^_.\-]{0,31}$")
+SYMBOL_COLUMNS = ("symbol", "SYMBOL", "Symbol", "ticker", "Ticker")
+
+
+def read_symbols(path):
+    """Symbols from a file: one per line ('#' comments), or a CSV with a SYMBOL column (e.g. EQUITY_L.csv)"""
+    with open(path, newline="") as f:
+        first = f.readline()
+        f.seek(0)
+        header = [column.strip() for column in first.split(",")]
+        column = next((c for c in SYMBOL_COLUMNS if c in header), None)
+        if column is not None:
+            return [row[column] for row in csv.DictReader(f, skipinitialspace=True) if row.get(column)]
+        return [line.split("#", 1)[0].split(",", 1)[0].strip() for line in f if line.split("#", 1)[0].strip()]
+
+
+class SymbolRegistry:
+    """Known symbols with hot / cold refresh tiers
+
+    ``symbol_key`` normalizes a symbol as requests do ("reliance" ->
+    "RELIANCE.NS").
+    """
+
+    def __init__(self, core=(), symbol_key=None, hot_ttl=900):
+        self.symbol_key = symbol_key or (lambda symbol: symbol)
+        self.hot_ttl = hot_ttl
+        self._lock = threading.Lock()
+        self._symbols = {}        # insertion-ordered set
+        self.core = tuple(dict.fromkeys(self.symbol_key(s) for s in core))
+        self._pinned = ()
+        self._requested = {}      # symbol -> monotonic time of the last request
+        self.add(self.core)
+
+    def __contains__(self, symbol):
+        return symbol in self._symbols
+
+    def __len__(self):
+        return len(self._symbols)
+
+    def valid(self, symbol):
+        return bool(SYMBOL_PATTERN.match(symbol))
+
+    def add(self, symbols):
+        """Register symbols (normalized, deduplicated); returns how many were new"""
+        added = 0
+        with self._lock:
+            for symbol in symbols:
+                symbol = self.symbol_key(symbol)
+                if symbol not in self._symbols and self.valid(symbol):
+                    self._symbols[symbol] = None
+                    added += 1
+        return added
+
+    def load(self, path):
+        """Register every symbol in a file (see read_symbols); returns how many were new"""
+        symbols = read_symbols(path)
+        added = self.add(symbols)
+        logger.info(f"Loaded {added} new symbols from {path} ({len(symbols)} listed, {len(self)} known)")
+        return added
+
+    def pin(self, symbols):
+        """Keep these symbols hot (e.g. open positions) until the next pin"""
+        symbols = tuple(dict.fromkeys(symbols))
+        self.add(symbols)
+        self._pinned = symbols
+
+    def touch(self, symbol, now=None):
+        """Record a request for a known symbol, keeping it hot for ``hot_ttl``"""
+        with self._lock:
+            self._requested[symbol] = time.monotonic() if now is None else now
+
+    def tier(self, symbol, now=None):
+        """'hot', 'cold' or 'unlisted'"""
+        now = time.monotonic() if now is None else now
+        requested = self._requested.get(symbol)
+        if symbol in self.core or symbol in self._pinned or (requested is not None and now - requested < self.hot_ttl):
+            return "hot"
+        return "cold" if symbol in self._symbols else "unlisted"
+
+    def watched(self, symbol):
+        """True for the core watch list and pinned (open position) symbols"""
+        return symbol in self.core or symbol in self._pinned
+
+    def hot(self, now=None):
+        """Symbols the refresh cycle should fetch, core list first"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for symbol in [s for s, at in self._requested.items() if now - at >= self.hot_ttl]:
+                del self._requested[symbol]
+            recent = list(self._requested)
+        return list(dict.fromkeys(self.core + self._pinned + tuple(recent)))
+
+    def status(self):
+        hot = self.hot()
+        return {
+            "known": len(self),
+            "hot": len(hot),
+            "core": len(self.core),
+            "pinned": len(self._pinned),
+        }
+
+
+class SingleFlight:
+    """Run ``fn`` once per key at a time; concurrent callers for the key get the same result"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0         # calls that ran fn
+        self.coalesced = 0        # calls that waited on another caller's fn
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
@@ -0,0 +1,342 @@
+"""
+Broker CSV import for Trading Journal Pro
+Server-side replacement for the browser importer (parseCSV / parseCSVLine /
+parsePrice / parseDate in script_1.py and app.js). The upload is read as a
+stream in chunks by pandas' C parser; each chunk is cleaned and validated
+with vectorized string operations and committed to the trade store in one
+transaction, inside one bulk load (see TradeStore.bulk_load). Per-row problems are counted per message with a few sample
+row numbers instead of being logged one by one.
+
+pandas drops lines with more fields than the header without saying which
+(and with ``usecols`` may even split them into the wrong columns), so the
+csv module checks each record on its way to the parser and malformed ones
+are reported with the other per-row errors.
+
+Import from the command line:
+    python trade_import.py trades.csv [more.csv ...]
+"""
+
+from collections import OrderedDict, deque
+import csv
+import io
+import itertools
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from trade_store import INSERT_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+CHUNK_ROWS = 50000
+ERROR_SAMPLES = 10
+RECORD_BATCH = 1000           # records checked per refill of the parser's buffer
+
+# Same header aliases as createColumnMapping in app.js (first match wins)
+HEADER_ALIASES = {
+    "symbol": ("symbol", "stock", "scrip", "ticker", "instrument"),
+    "entryDate": ("entry date", "entrydate", "date", "entry_date", "buy date", "purchase date"),
+    "exitDate": ("exit date", "exitdate", "sell date", "exit_date", "close date"),
+    "entryPrice": ("entry price", "entryprice", "buy price", "entry_price", "purchase price", "price"),
+    "exitPrice": ("exit price", "exitprice", "sell price", "exit_price", "close price"),
+    "quantity": ("quantity", "qty", "shares", "units", "volume"),
+    "orderType": ("order type", "ordertype", "type", "order_type", "side", "action"),
+    "strategy": ("strategy", "method", "system", "approach"),
+    "account": ("account", "broker", "exchange", "platform"),
+}
+KNOWN_HEADERS = {alias for aliases in HEADER_ALIASES.values() for alias in aliases}
+
+DEFAULT_ORDER_TYPE = "Buy"
+DEFAULT_STRATEGY = "Imported Strategy"
+DEFAULT_ACCOUNT = "Main Account"
+
+# d/m/y, m/d/y or y-m-d with either separator (used consistently); 2-4 digit years
+DATE_PATTERN = r"^(\d{1,4})([/-])(\d{1,2})\2(\d{2,4})$"
+
+
+def normalize_header(header):
+    return str(header).strip().strip("\"'").replace("&amp;", "&").lower()
+
+
+def column_mapping(headers):
+    """{field: header} using the first header that matches each field's aliases"""
+    normalized = [normalize_header(h) for h in headers]
+    mapping = {}
+    for field, aliases in HEADER_ALIASES.items():
+        for header, name in zip(headers, normalized):
+            if name in aliases:
+                mapping[field] = header
+                break
+    return mapping
+
+
+def per_unique(raw, parse):
+    """Apply a column parser to each distinct value once (dates and names repeat a lot)"""
+    codes, uniques = pd.factorize(raw)
+    parsed = parse(pd.Series(uniques, dtype=object)).to_numpy()
+    return pd.Series(parsed[codes], index=raw.index)
+
+
+def _to_number(raw, junk):
+    """Plain numbers take the fast path; only the rest get ``junk`` stripped first"""
+    values = pd.to_numeric(raw, errors="coerce")
+    retry = values.isna() & (raw != "")
+    if retry.any():
+        values[retry] = pd.to_numeric(raw[retry].str.replace(junk, "", regex=True), errors="coerce")
+    return values
+
+
+def parse_prices(raw):
+    """parsePrice for a whole column: Indian commas, quotes and symbols stripped; NaN if empty"""
+    return _to_number(raw, r"[^\d.\-]")
+
+
+def parse_quantities(raw):
+    """parseQuantity: whole units, 1 when missing or not positive"""
+    quantity = np.floor(_to_number(raw, r"[\s\"',]"))
+    return quantity.where(quantity > 0, 1.0)
+
+
+def parse_dates(raw, dayfirst=False):
+    """parseDate for a whole column -> 'YYYY-MM-DD' strings ('' if unparsable)
+
+    Numeric dates are month-first unless ``dayfirst``; the other order is
+    used when the first part cannot be a month. Three-digit years ("202")
+    are read as 2025 and two-digit years pivot at 50, as in the browser.
+    """
+    raw = raw.str.strip().str.strip("\"'")
+    cleaned = raw.str.replace(r"[\s\"']", "", regex=True)
+    parts = cleaned.str.extract(DATE_PATTERN)
+    first, second, last = (pd.to_numeric(parts[i], errors="coerce") for i in (0, 2, 3))
+    first_len, last_len = parts[0].str.len(), parts[3].str.len()
+
+    year_first = first_len == 4
+    year = last.where(last_len != 3, 2025)
+    year = year.where(last_len != 2, np.where(last >= 50, 1900 + last, 2000 + last))
+    month, day = (second, first) if dayfirst else (first, second)
+    swap = month > 12
+    month, day = month.where(~swap, day), day.where(~swap, month)
+    year = year.where(~year_first, first)
+    month = month.where(~year_first, second)
+    day = day.where(~year_first, last)
+
+    dates = pd.to_datetime(pd.DataFrame({"year": year, "month": month, "day": day}), errors="coerce")
+
+    # Anything else ("18-Jun-2025", "2025/06/18 09:15") goes through the general parser
+    unmatched = parts[0].isna() & (cleaned != "") & (cleaned != "-")
+    if unmatched.any():
+        dates[unmatched] = pd.to_datetime(raw[unmatched], errors="coerce", format="mixed", dayfirst=dayfirst)
+
+    dates = dates.where(dates.dt.year > 1900)
+    return dates.dt.strftime("%Y-%m-%d").fillna("")
+
+
+class CheckedRecords(io.RawIOBase):
+    """UTF-8 stream of a CSV's records for pandas, each checked against the header width
+
+    A record with more fields than the header is passed on as a row of
+    empty fields (so later rows keep their numbers) and queued in ``bad``
+    as (row index, reason) for ``take``.
+    """
+
+    def __init__(self, text):
+        self.bad = deque()
+        self._raw = []
+        self._records = self._check(csv.reader(self._consume(text), skipinitialspace=True))
+        self._pending = bytearray()
+
+    def _consume(self, text):
+        for line in text:
+            self._raw.append(line)
+            yield line
+
+    def _check(self, reader):
+        width = None
+        index = 0
+        for row in reader:
+            # the raw lines the csv module read for this record (several if a quoted field spans lines)
+            record = "".join(self._raw)
+            self._raw.clear()
+            if not row:
+                pass
+            elif width is None:
+                width = len(row)
+            else:
+                if len(row) > width:
+                    self.bad.append((index, f"Row has {len(row)} fields, header has {width}"))
+                    record = "," * (width - 1) + "\n"
+                index += 1
+            yield record
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while len(self._pending) < len(buffer):
+            text = "".join(itertools.islice(self._records, RECORD_BATCH))
+            if not text:
+                break
+            self._pending += text.encode("utf-8")
+        count = min(len(buffer), len(self._pending))
+        buffer[:count] = self._pending[:count]
+        del self._pending[:count]
+        return count
+
+    def take(self, stop):
+        """{reason: row numbers} of the malformed records before row index ``stop``"""
+        taken = OrderedDict()
+        while self.bad and self.bad[0][0] < stop:
+            index, reason = self.bad.popleft()
+            taken.setdefault(reason, []).append(index)
+        return taken
+
+
+def open_text(source):
+    """Text lines of a CSV path or binary file object (BOM dropped, newlines kept for csv)"""
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, encoding="utf-8-sig", newline="")
+    return io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+
+
+class ImportSummary:
+    """Row counts plus per-message error counts with sample row numbers"""
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.errors = OrderedDict()
+        self.started = time.perf_counter()
+
+    def add_errors(self, message, row_numbers):
+        if len(row_numbers) == 0:
+            return
+        entry = self.errors.setdefault(message, {"count": 0, "rows": []})
+        entry["count"] += len(row_numbers)
+        room = ERROR_SAMPLES - len(entry["rows"])
+        if room > 0:
+            entry["rows"].extend(int(r) for r in row_numbers[:room])
+
+    def as_dict(self):
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "rejected": self.rows - self.imported,
+            "errors": self.errors,
+            "seconds": round(time.perf_counter() - self.started, 3),
+        }
+
+
+def clean_chunk(chunk, mapping, dayfirst=False):
+    """Vectorized parse + validate of one chunk: (valid rows as INSERT_COLUMNS tuples, {message: rows})"""
+    empty = pd.Series("", index=chunk.index)
+
+    def column(field):
+        header = mapping.get(field)
+        return chunk[header].fillna("") if header is not None else empty
+
+    def text(field, default=""):
+        return per_unique(column(field), lambda v: v.str.strip().str.strip("\"'").replace("", default))
+
+    symbol = text("symbol")
+    entry_date = per_unique(column("entryDate"), lambda v: parse_dates(v, dayfirst))
+    exit_date = per_unique(column("exitDate"), lambda v: parse_dates(v, dayfirst))
+    entry_price = parse_prices(column("entryPrice"))
+    exit_price = parse_prices(column("exitPrice"))
+    quantity = parse_quantities(column("quantity"))
+    order_type = text("orderType", DEFAULT_ORDER_TYPE)
+    strategy = text("strategy", DEFAULT_STRATEGY)
+    account = text("account", DEFAULT_ACCOUNT)
+
+    # validateTrade
+    checks = OrderedDict([
+        ("Symbol is required", symbol == ""),
+        ("Entry price must be greater than 0", ~(entry_price > 0)),
+        ("Entry date is required", entry_date == ""),
+    ])
+    invalid = np.zeros(len(chunk), dtype=bool)
+    errors = {}
+    for message, failed in checks.items():
+        failed = failed.to_numpy()
+        errors[message] = chunk.index.to_numpy()[failed] + 1
+        invalid |= failed
+
+    keep = ~invalid
+    count = int(keep.sum())
+    exit_date, exit_price = exit_date[keep], exit_price[keep]
+    columns = {
+        "symbol": symbol[keep].tolist(),
+        "order_type": order_type[keep].tolist(),
+        "entry_date": entry_date[keep].tolist(),
+        "entry_price": entry_price[keep].tolist(),
+        "quantity": quantity[keep].tolist(),
+        "stop_loss": [None] * count,
+        "target": [None] * count,
+        "strategy": strategy[keep].tolist(),
+        "account": account[keep].tolist(),
+        "exit_date": exit_date.where(exit_date != "", None).tolist(),
+        "exit_price": exit_price.astype(object).where(exit_price.notna(), None).tolist(),
+        "status": np.where(exit_date != "", "Closed", "Open").tolist(),
+    }
+    rows = list(zip(*(columns[name] for name in INSERT_COLUMNS)))
+    return rows, errors
+
+
+def import_csv(source, store, dayfirst=False, chunk_rows=CHUNK_ROWS):
+    """Stream a CSV (path or binary file object) into ``store``; returns the summary dict
+
+    Raises ValueError if the header has no symbol or entry price column.
+    """
+    summary = ImportSummary()
+    text = open_text(source)
+    records = CheckedRecords(text)
+    reader = pd.read_csv(
+        io.BufferedReader(records, 1 << 20),
+        dtype=str,
+        na_filter=False,
+        chunksize=chunk_rows,
+        encoding="utf-8",
+        skipinitialspace=True,
+        skip_blank_lines=True,
+        usecols=lambda header: normalize_header(header) in KNOWN_HEADERS,
+    )
+    mapping = None
+    try:
+        with reader, store.bulk_load():
+            for chunk in reader:
+                if mapping is None:
+                    mapping = column_mapping(list(chunk.columns))
+                    missing = [f for f in ("symbol", "entryPrice") if f not in mapping]
+                    if missing:
+                        raise ValueError(f"CSV has no column for: {', '.join(missing)}")
+                summary.rows += len(chunk)
+                malformed = records.take(chunk.index[-1] + 1) if len(chunk) else {}
+                for reason, indexes in malformed.items():
+                    summary.add_errors(reason, np.asarray(indexes) + 1)
+                    chunk = chunk.drop(index=indexes)
+                rows, errors = clean_chunk(chunk, mapping, dayfirst)
+                for message, row_numbers in errors.items():
+                    summary.add_errors(message, row_numbers)
+                if rows:
+                    summary.imported += store.insert_many(rows)
+    finally:
+        # close a file opened here; leave the caller's stream open
+        if isinstance(source, (str, os.PathLike)):
+            text.close()
+        else:
+            text.detach()
+    result = summary.as_dict()
+    result["columns"] = mapping or {}
+    logger.info(f"Imported {result['imported']}/{result['rows']} trades in {result['seconds']}s")
+    return result
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    import json
+    import nse_stock_api
+    for path in sys.argv[1:]:
+        print(json.dumps(import_csv(path, nse_stock_api.trade_store), indent=2))
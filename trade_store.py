@@ -0,0 +1,516 @@
+"""
+Trade store for Trading Journal Pro
+Journal trades live in one SQLite table (WAL mode, so readers never block
+the writer), replacing the single localStorage blob app.js rewrites on each
+edit. Field names on the API side are the camelCase ones app.js uses;
+``FIELDS`` maps them to the snake_case columns.
+
+Indexes follow the paths the journal takes: each sort order, symbol
+lookups, the account / strategy filters in entry-date order and open /
+closed. Counts by account, strategy, status and outcome come from a small
+table kept up to date by triggers, so large matches are never counted row
+by row. Bulk imports drop the indexes and rebuild them once at the end.
+
+Every write transaction bumps a trade-set version and records which trades
+it touched, so caches keyed by version (journal analytics, equity curves)
+can tell what changed since the version they hold, across processes.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import logging
+import math
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# app.js trade field -> column
+FIELDS = {
+    "id": "id",
+    "symbol": "symbol",
+    "orderType": "order_type",
+    "entryDate": "entry_date",
+    "entryPrice": "entry_price",
+    "quantity": "quantity",
+    "stopLoss": "stop_loss",
+    "target": "target",
+    "strategy": "strategy",
+    "account": "account",
+    "exitDate": "exit_date",
+    "exitPrice": "exit_price",
+    "status": "status",
+}
+COLUMNS = tuple(FIELDS.values())
+INSERT_COLUMNS = COLUMNS[1:]  # ids are assigned by SQLite
+NUMERIC_FIELDS = ("entryPrice", "exitPrice", "quantity", "stopLoss", "target")
+
+# Query parameters that filter by equality, and the sortable fields (column, index walked in that order)
+FILTER_FIELDS = ("account", "strategy", "symbol", "status")
+SORT_FIELDS = {
+    "entryDate": ("entry_date", "trades_entry_date"),
+    "exitDate": ("exit_date", "trades_exit_date"),
+    "pl": ("pl", "trades_pl"),
+    "id": ("id", None),
+}
+OUTCOMES = ("win", "loss", "breakeven")
+# P&L of the trades an outcome filter keeps (open trades have a P&L of 0)
+OUTCOME_PL = {"win": "pl >= 0", "loss": "pl <= 0", "breakeven": "pl = 0"}
+# Filters the trade_counts table can answer on its own
+COUNTED_FILTERS = ("account", "strategy", "status", "outcome")
+
+# Same rules as calculatePL in app.js
+CLOSED_EXPRESSION = "(exit_date IS NOT NULL AND exit_date != '' AND exit_price IS NOT NULL AND exit_price != 0)"
+PL_EXPRESSION = (
+    f"CASE WHEN {CLOSED_EXPRESSION} "
+    "THEN (exit_price - entry_price) * quantity * (CASE WHEN order_type = 'Buy' THEN 1 ELSE -1 END) "
+    "ELSE 0 END"
+)
+OUTCOME_EXPRESSION = (
+    f"CASE WHEN NOT {CLOSED_EXPRESSION} THEN 'open' "
+    "WHEN pl > 0 THEN 'win' WHEN pl < 0 THEN 'loss' WHEN pl = 0 THEN 'breakeven' ELSE 'unpriced' END"
+)
+
+# Changes older than this many write versions are forgotten (readers rebuild instead)
+CHANGE_LOG_VERSIONS = 10000
+
+# Time a page may spend walking the sort index per matching trade (at least
+# WALK_SECONDS) before it filters first and sorts instead
+WALK_SECONDS = 0.005
+WALK_SECONDS_PER_MATCH = 1e-6
+
+# A bulk load past this many rows (and a quarter of the table) drops the
+# secondary indexes and count triggers, rebuilding them once at the end
+BULK_INDEX_ROWS = 100000
+
+INDEXES = {
+    "trades_entry_date": "entry_date",
+    "trades_exit_date": "exit_date",
+    "trades_pl": "pl",
+    "trades_symbol": "symbol, entry_date",
+    "trades_account": "account, strategy, entry_date",
+    "trades_strategy": "strategy, entry_date",
+    "trades_outcome": "outcome, entry_date",
+}
+# Earlier indexes that the ones above replace (an index whose columns changed is rebuilt)
+RETIRED_INDEXES = ("trades_status", "trades_filters")
+
+# trade_counts keys use '' for NULL (filters never match either)
+COUNT_KEY = "IFNULL({row}.account, ''), IFNULL({row}.strategy, ''), IFNULL({row}.status, ''), {row}.outcome"
+COUNT_MATCH = ("account = IFNULL({row}.account, '') AND strategy = IFNULL({row}.strategy, '') "
+               "AND status = IFNULL({row}.status, '') AND outcome = {row}.outcome")
+COUNT_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS trade_counts_insert AFTER INSERT ON trades BEGIN
+    INSERT INTO trade_counts VALUES ({COUNT_KEY.format(row="NEW")}, 1) ON CONFLICT DO UPDATE SET n = n + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trade_counts_delete AFTER DELETE ON trades BEGIN
+    UPDATE trade_counts SET n = n - 1 WHERE {COUNT_MATCH.format(row="OLD")};
+END;
+CREATE TRIGGER IF NOT EXISTS trade_counts_update AFTER UPDATE ON trades BEGIN
+    UPDATE trade_counts SET n = n - 1 WHERE {COUNT_MATCH.format(row="OLD")};
+    INSERT INTO trade_counts VALUES ({COUNT_KEY.format(row="NEW")}, 1) ON CONFLICT DO UPDATE SET n = n + 1;
+END;
+"""
+COUNT_REBUILD = f"""
+DELETE FROM trade_counts;
+INSERT INTO trade_counts SELECT {COUNT_KEY.format(row="trades")}, COUNT(*) FROM trades GROUP BY 1, 2, 3, 4;
+DELETE FROM trade_meta WHERE key = 'counts_stale';
+"""
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY,
+    symbol TEXT NOT NULL,
+    order_type TEXT NOT NULL DEFAULT 'Buy',
+    entry_date TEXT,
+    entry_price REAL,
+    quantity REAL,
+    stop_loss REAL,
+    target REAL,
+    strategy TEXT,
+    account TEXT,
+    exit_date TEXT,
+    exit_price REAL,
+    status TEXT,
+    pl REAL GENERATED ALWAYS AS ({PL_EXPRESSION}) VIRTUAL,
+    outcome TEXT GENERATED ALWAYS AS ({OUTCOME_EXPRESSION}) VIRTUAL
+);
+
+CREATE TABLE IF NOT EXISTS trade_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO trade_meta (key, value) VALUES ('version', 0);
+
+-- trade_id NULL marks a bulk write: consumers of older versions must rebuild
+CREATE TABLE IF NOT EXISTS trade_changes (
+    version INTEGER NOT NULL,
+    trade_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS trade_changes_version ON trade_changes (version);
+
+-- trades per (account, strategy, status, outcome)
+CREATE TABLE IF NOT EXISTS trade_counts (
+    account TEXT NOT NULL,
+    strategy TEXT NOT NULL,
+    status TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (account, strategy, status, outcome)
+) WITHOUT ROWID;
+"""
+
+
+def index_statements():
+    return "".join(f"CREATE INDEX IF NOT EXISTS {name} ON trades ({columns});\n" for name, columns in INDEXES.items())
+
+
+def coerce_numbers(trade):
+    """Copy of ``trade`` with NUMERIC_FIELDS as floats ('' / None -> None); raises ValueError"""
+    trade = dict(trade)
+    for field in NUMERIC_FIELDS:
+        value = trade.get(field)
+        if field not in trade or value is None or value == "":
+            if field in trade:
+                trade[field] = None
+            continue
+        try:
+            if isinstance(value, bool):
+                raise TypeError
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{field} must be a number, got {value!r}") from None
+        if not math.isfinite(number):
+            raise ValueError(f"{field} must be a finite number, got {value!r}")
+        trade[field] = number
+    return trade
+
+
+def row_to_trade(row):
+    """sqlite3.Row -> app.js-style trade dict"""
+    return {field: row[column] for field, column in FIELDS.items()}
+
+
+class TradeStore:
+    """SQLite-backed journal trades; one connection per thread"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._ready = False  # the database file is created on first use
+        self._counts = OrderedDict()  # (version, where, params) -> row count
+        self._counts_lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            if not self._ready:
+                with self._write_lock:
+                    self._create_schema(conn)
+                    self._ready = True
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _create_schema(conn):
+        """Create the tables, or bring a database from an earlier layout up to date"""
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        columns = {row[1] for row in conn.execute("PRAGMA table_xinfo(trades)")}
+        conn.executescript(SCHEMA)
+        if "trades" in tables and "outcome" not in columns:
+            conn.execute(f"ALTER TABLE trades ADD COLUMN outcome TEXT GENERATED ALWAYS AS ({OUTCOME_EXPRESSION}) VIRTUAL")
+        if "trades" in tables and "trade_counts" not in tables:
+            conn.execute("INSERT OR REPLACE INTO trade_meta (key, value) VALUES ('counts_stale', 1)")
+        for name, sql in conn.execute("SELECT name, sql FROM sqlite_master "
+                                      "WHERE type = 'index' AND tbl_name = 'trades' AND sql IS NOT NULL").fetchall():
+            if name in RETIRED_INDEXES or (name in INDEXES and not sql.endswith(f"({INDEXES[name]})")):
+                conn.execute(f"DROP INDEX {name}")
+        conn.executescript(index_statements() + COUNT_TRIGGERS)
+        if conn.execute("SELECT 1 FROM trade_meta WHERE key = 'counts_stale'").fetchone():
+            # new table, or a bulk load that never finished
+            conn.executescript(f"BEGIN IMMEDIATE; {COUNT_REBUILD} COMMIT;")
+
+    # -- writes ------------------------------------------------------------
+
+    def _write(self, fn, changed_ids):
+        """Run ``fn(conn)`` in one transaction that bumps the version and logs ``changed_ids``
+
+        ``changed_ids`` may be a callable taking fn's result (for ids SQLite
+        assigns); None logs a bulk write.
+        """
+        conn = self._connection()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+                version = conn.execute(
+                    "UPDATE trade_meta SET value = value + 1 WHERE key = 'version' RETURNING value").fetchone()[0]
+                ids = changed_ids(result) if callable(changed_ids) else changed_ids
+                conn.executemany("INSERT INTO trade_changes (version, trade_id) VALUES (?, ?)",
+                                 [(version, trade_id) for trade_id in (ids if ids is not None else [None])])
+                if version % 1000 == 0:
+                    conn.execute("DELETE FROM trade_changes WHERE version <= ?", (version - CHANGE_LOG_VERSIONS,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def insert_many(self, rows):
+        """Insert rows (tuples in ``INSERT_COLUMNS`` order) in one transaction; returns the count"""
+        placeholders = ",".join("?" * len(INSERT_COLUMNS))
+        sql = f"INSERT INTO trades ({','.join(INSERT_COLUMNS)}) VALUES ({placeholders})"
+        count = self._write(lambda conn: conn.executemany(sql, rows).rowcount, None)
+        bulk = getattr(self._local, "bulk", None)
+        if bulk is None:
+            # Fresh statistics keep the planner on the right index as the table grows
+            self._connection().execute("ANALYZE")
+        else:
+            bulk["rows"] += count
+            if not bulk["deferred"] and bulk["rows"] >= max(BULK_INDEX_ROWS, bulk["before"] // 4):
+                self._drop_indexes()
+                bulk["deferred"] = True
+        return count
+
+    @contextmanager
+    def bulk_load(self):
+        """Group the insert_many calls of one import
+
+        Statistics are refreshed once at the end instead of per call. Once
+        the load passes BULK_INDEX_ROWS rows (and a quarter of the rows
+        stored before it) the secondary indexes and count triggers are
+        dropped, and rebuilt with the counts when the load ends: one sorted
+        build is far cheaper than updating every index row by row. Queries
+        from other threads scan the table meanwhile.
+        """
+        self._local.bulk = {"rows": 0, "before": self.count(), "deferred": False}
+        try:
+            yield
+        finally:
+            bulk, self._local.bulk = self._local.bulk, None
+            if bulk["deferred"]:
+                self._build_indexes()
+            if bulk["rows"]:
+                self._connection().execute("ANALYZE")
+
+    def _drop_indexes(self):
+        conn = self._connection()
+        with self._write_lock:
+            conn.executescript(
+                "BEGIN IMMEDIATE;"
+                "INSERT OR REPLACE INTO trade_meta (key, value) VALUES ('counts_stale', 1);"
+                "DROP TRIGGER IF EXISTS trade_counts_insert;"
+                "DROP TRIGGER IF EXISTS trade_counts_delete;"
+                "DROP TRIGGER IF EXISTS trade_counts_update;"
+                + "".join(f"DROP INDEX IF EXISTS {name};" for name in INDEXES) +
+                "COMMIT;")
+        logger.info(f"Bulk load: dropped {len(INDEXES)} trade indexes until it finishes")
+
+    def _build_indexes(self):
+        conn = self._connection()
+        started = time.perf_counter()
+        with self._write_lock:
+            try:
+                conn.executescript(f"BEGIN IMMEDIATE; {index_statements()} {COUNT_TRIGGERS} {COUNT_REBUILD} COMMIT;")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        logger.info(f"Bulk load: rebuilt trade indexes and counts in {time.perf_counter() - started:.1f}s")
+
+    def upsert(self, trade):
+        """Write one trade (app.js fields); returns the stored trade
+
+        With the ``id`` of an existing trade only the given fields change;
+        otherwise a new trade is inserted (under that id, if one is given).
+        Raises ValueError if a price or quantity is not a number.
+        """
+        trade = coerce_numbers(trade)
+        trade_id = trade.get("id")
+        fields = [f for f in FIELDS if f in trade and f != "id"]
+        values = [trade[f] for f in fields]
+
+        def write(conn):
+            row = None
+            if trade_id is not None and fields:
+                assignments = ",".join(f"{FIELDS[f]} = ?" for f in fields)
+                row = conn.execute(f"UPDATE trades SET {assignments} WHERE id = ? RETURNING *",
+                                   values + [trade_id]).fetchone()
+            elif trade_id is not None:
+                row = conn.execute("SELECT * FROM trades WHERE id = ?", (trade_id,)).fetchone()
+            if row is None:
+                columns = [FIELDS[f] for f in fields] + (["id"] if trade_id is not None else [])
+                params = values + ([trade_id] if trade_id is not None else [])
+                row = conn.execute(f"INSERT INTO trades ({','.join(columns)}) "
+                                   f"VALUES ({','.join('?' * len(columns))}) RETURNING *", params).fetchone()
+            return row
+
+        return row_to_trade(self._write(write, lambda row: [row["id"]]))
+
+    def delete(self, trade_id):
+        """Delete one trade; False if it did not exist"""
+        def remove(conn):
+            return conn.execute("DELETE FROM trades WHERE id = ?", (trade_id,)).rowcount
+        return bool(self._write(remove, [trade_id]))
+
+    # -- reads -------------------------------------------------------------
+
+    @property
+    def version(self):
+        """Trade-set version: changes with every committed write, in any process"""
+        return self._connection().execute("SELECT value FROM trade_meta WHERE key = 'version'").fetchone()[0]
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM trades").fetchone()[0]
+
+    def get(self, trade_id):
+        row = self._connection().execute("SELECT * FROM trades WHERE id = ?", (trade_id,)).fetchone()
+        return row_to_trade(row) if row is not None else None
+
+    def changes_since(self, version):
+        """Current state of trades changed after ``version`` (deleted ones as ``{"id", "deleted"}``)
+
+        Returns None when that can't be answered incrementally: a bulk write
+        happened, or the change log no longer reaches back that far.
+        """
+        conn = self._connection()
+        rows = conn.execute("SELECT version, trade_id FROM trade_changes WHERE version > ? ORDER BY version",
+                            (version,)).fetchall()
+        current = self.version
+        if current == version:
+            return []
+        if not rows or rows[0]["version"] != version + 1 or any(r["trade_id"] is None for r in rows):
+            return None
+        ids = list(dict.fromkeys(r["trade_id"] for r in rows))
+        found = {}
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            for row in conn.execute(f"SELECT * FROM trades WHERE id IN ({','.join('?' * len(batch))})", batch):
+                found[row["id"]] = row_to_trade(row)
+        return [found.get(i, {"id": i, "deleted": True}) for i in ids]
+
+    def open_trades(self):
+        """Every trade that calculatePL would treat as open"""
+        rows = self._connection().execute("SELECT * FROM trades WHERE outcome = 'open'").fetchall()
+        return [row_to_trade(row) for row in rows]
+
+    def _where(self, filters):
+        clauses, params = [], []
+        for field in FILTER_FIELDS:
+            if filters.get(field):
+                clauses.append(f"{FIELDS[field]} = ?")
+                params.append(filters[field])
+        if filters.get("outcome") in OUTCOMES:
+            # Like getFilteredTrades: the outcome filter leaves open trades in
+            clauses.append("outcome IN ('open', ?)")
+            params.append(filters["outcome"])
+        for param, column, op in (("from", "entry_date", ">="), ("to", "entry_date", "<="),
+                                  ("exit_from", "exit_date", ">="), ("exit_to", "exit_date", "<=")):
+            if filters.get(param):
+                clauses.append(f"{column} {op} ?")
+                params.append(filters[param])
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, filters=None, sort="entryDate", descending=True, limit=50, offset=0, with_total=True):
+        """One page of trades: ``(trades, total)`` (total is None unless ``with_total``)
+
+        ``filters`` keys: account, strategy, symbol, status (equality),
+        outcome (win/loss/breakeven), from/to (entry date) and
+        exit_from/exit_to (exit date). Raises ValueError for a sort field
+        outside ``SORT_FIELDS``.
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Cannot sort by {sort}; choose from {', '.join(SORT_FIELDS)}")
+        filters = filters or {}
+        where, params = self._where(filters)
+        column, index = SORT_FIELDS[sort]
+        total = self._count(filters, where, params) if with_total else None
+        direction = "DESC" if descending else "ASC"
+        if column == "pl" and filters.get("outcome") in OUTCOMES:
+            # implied by the outcome, and lets the P&L index start where the matches are
+            where += f" AND {OUTCOME_PL[filters['outcome']]}"
+        conn = self._connection()
+        order = column
+        rows = None
+        if where and index and self._counted(filters) and not self._ordered(filters, column) \
+                and self._counts_fresh():
+            # SQLite sorts the whole match of a low-cardinality filter (one of
+            # four accounts, say). Walking the sort index and skipping rows
+            # that do not match finds a large match's page far sooner, unless
+            # the filter lines up with the order (open trades have no exit
+            # date), so the walk gets about as long as sorting the match would
+            # take before the page is filtered first and sorted after all.
+            matches = total if total is not None else self._count(filters, *self._where(filters))
+            if matches * matches >= (offset + limit) * self._count({}, "", []) / 2:
+                rows = self._walk(conn, f"SELECT * FROM trades INDEXED BY {index}{where} "
+                                        f"ORDER BY {column} {direction}, id {direction} LIMIT ? OFFSET ?",
+                                  params + [limit, offset], max(WALK_SECONDS, matches * WALK_SECONDS_PER_MATCH))
+            order = f"+{column}"  # filter first: keeps SQLite off the sort index
+        if rows is None:
+            rows = conn.execute(
+                f"SELECT * FROM trades{where} ORDER BY {order} {direction}, id {direction} LIMIT ? OFFSET ?",
+                params + [limit, offset]).fetchall()
+        return [row_to_trade(row) for row in rows], total
+
+    @staticmethod
+    def _ordered(filters, column):
+        """True if an index holds exactly the rows of ``filters`` in ``column`` order"""
+        equal = {FIELDS[field] for field in FILTER_FIELDS if filters.get(field)}
+        for columns in INDEXES.values():
+            columns = [c.strip() for c in columns.split(",")]
+            if columns[-1] == column and set(columns[:-1]) == equal:
+                return True
+        return False
+
+    @staticmethod
+    def _walk(conn, sql, params, seconds):
+        """Rows of ``sql``, or None if it runs for more than ``seconds``"""
+        deadline = time.perf_counter() + seconds
+        conn.set_progress_handler(lambda: time.perf_counter() > deadline, 1000)
+        try:
+            return conn.execute(sql, params).fetchall()
+        except sqlite3.OperationalError as e:
+            if "interrupted" not in str(e):
+                raise
+            return None
+        finally:
+            conn.set_progress_handler(None, 0)
+
+    @staticmethod
+    def _counted(filters):
+        """True if trade_counts alone can count trades matching ``filters``"""
+        return all(field in COUNTED_FILTERS for field, value in filters.items() if value)
+
+    def _counts_fresh(self):
+        """False while a bulk load has the count triggers (and indexes) dropped"""
+        return self._connection().execute(
+            "SELECT 1 FROM trade_meta WHERE key = 'counts_stale'").fetchone() is None
+
+    def _count(self, filters, where, params):
+        """Filtered row count, cached until the next write"""
+        key = (self.version, where, tuple(params))
+        with self._counts_lock:
+            if key in self._counts:
+                return self._counts[key]
+        if self._counted(filters) and self._counts_fresh():
+            sql = f"SELECT IFNULL(SUM(n), 0) FROM trade_counts{where}"
+        else:
+            sql = f"SELECT COUNT(*) FROM trades{where}"
+        total = self._connection().execute(sql, params).fetchone()[0]
+        with self._counts_lock:
+            self._counts[key] = total
+            while len(self._counts) > 256:
+                self._counts.popitem(last=False)
+        return total
+
+    def columns(self):
+        """Every trade as columnar lists keyed by app.js field (for bulk analytics)"""
+        rows = self._connection().execute(f"SELECT {','.join(COLUMNS)} FROM trades").fetchall()
+        values = list(zip(*rows)) if rows else [()] * len(COLUMNS)
+        return {field: list(column) for field, column in zip(FIELDS, values)}
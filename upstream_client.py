@@ -0,0 +1,264 @@
+"""
+Upstream (Yahoo Finance) client guard for the NSE Stock Price API
+Every upstream call (refresh cycle, on-demand quotes, history backfill)
+goes through one UpstreamClient, which applies, in order:
+
+- a circuit breaker: after ``failure_threshold`` consecutive failures the
+  circuit opens and calls fail fast (callers keep serving cached data);
+  after ``reset_timeout`` one probe call is let through (half-open), and
+  its outcome closes the circuit or reopens it for twice as long;
+- per-symbol exponential backoff: a symbol that failed is not retried
+  until its backoff expires, so one bad or throttled symbol costs nothing;
+- a token-bucket request budget (``rate`` per second, bursts of ``burst``)
+  shared by all callers.
+
+Rejected calls raise an UpstreamRejected subclass without touching the
+network. Only transport, HTTP and rate-limit errors (see is_upstream_error)
+count toward the breaker; an empty result or any other exception is about
+the symbol (unknown, delisted) and only backs that symbol off, so requests
+for bogus symbols cannot open the circuit for everyone. ``on_result(symbol, seconds, outcome)`` ("ok", "empty" or
+"error") is called after every request that was made.
+"""
+
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamRejected(Exception):
+    """A call refused locally, before reaching the upstream"""
+
+
+class CircuitOpenError(UpstreamRejected):
+    pass
+
+
+class SymbolBackoffError(UpstreamRejected):
+    pass
+
+
+class RateLimitedError(UpstreamRejected):
+    pass
+
+
+def is_upstream_error(exc):
+    """True for errors that say the upstream itself is unreachable, failing or throttling us"""
+    if isinstance(exc, (OSError, TimeoutError)):  # includes requests' ConnectionError, Timeout, HTTPError
+        return True
+    return "RateLimit" in type(exc).__name__
+
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``burst``"""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout=None):
+        """Take one token, waiting up to ``timeout`` seconds (None = forever); returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    @property
+    def tokens(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class CircuitBreaker:
+    """closed -> open after ``failure_threshold`` consecutive failures -> half-open probe after a timeout"""
+
+    def __init__(self, failure_threshold=10, reset_timeout=60, max_reset_timeout=600):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._open_for = reset_timeout
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may go ahead (in half-open state, only one probe at a time)"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self._open_for:
+                self.state = "half_open"
+                self._probing = False
+                logger.info("Upstream circuit half-open; probing")
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info("Upstream circuit closed")
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._open_for = self.reset_timeout
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == "half_open":
+                self._open(min(self.max_reset_timeout, self._open_for * 2))
+            elif self.state == "closed" and self.consecutive_failures >= self.failure_threshold:
+                self._open(self.reset_timeout)
+
+    def _open(self, seconds):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._open_for = seconds
+        self._probing = False
+        logger.warning(f"Upstream circuit open for {seconds:.0f}s after "
+                       f"{self.consecutive_failures} consecutive failures")
+
+    def retry_in(self):
+        with self._lock:
+            if self.state != "open":
+                return None
+            return max(0.0, self._open_for - (time.monotonic() - self.opened_at))
+
+
+class SymbolBackoff:
+    """Per-symbol exponential backoff (with jitter) after failures"""
+
+    def __init__(self, base=30, maximum=1800):
+        self.base = base
+        self.maximum = maximum
+        self._failures = {}       # symbol -> (consecutive failures, retry at)
+        self._lock = threading.Lock()
+
+    def blocked(self, symbol, now=None):
+        entry = self._failures.get(symbol)
+        return entry is not None and entry[1] > (time.monotonic() if now is None else now)
+
+    def record_failure(self, symbol):
+        with self._lock:
+            failures = self._failures.get(symbol, (0, 0))[0] + 1
+            delay = min(self.maximum, self.base * 2 ** (failures - 1))
+            self._failures[symbol] = (failures, time.monotonic() + delay / 2 + random.uniform(0, delay / 2))
+
+    def record_success(self, symbol):
+        with self._lock:
+            self._failures.pop(symbol, None)
+
+    def count(self):
+        now = time.monotonic()
+        return sum(1 for _, retry_at in list(self._failures.values()) if retry_at > now)
+
+
+class UpstreamClient:
+    """Circuit breaker, per-symbol backoff and request budget around upstream calls"""
+
+    def __init__(self, rate=20, burst=40, failure_threshold=10, reset_timeout=60,
+                 backoff_base=30, backoff_max=1800, on_result=None):
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.backoff = SymbolBackoff(backoff_base, backoff_max)
+        self.calls = 0
+        self.failures = 0
+        self.rejected = {"circuit_open": 0, "backoff": 0, "rate_limited": 0}
+        self.on_result = on_result
+        self._lock = threading.Lock()
+
+    @property
+    def degraded(self):
+        return self.breaker.state != "closed"
+
+    def backed_off(self, symbol):
+        return self.backoff.blocked(symbol)
+
+    def call(self, symbol, fn, *args, budget_timeout=None, **kwargs):
+        """``fn(*args, **kwargs)`` for ``symbol`` if breaker, backoff and budget allow; raises UpstreamRejected if not"""
+        if self.backoff.blocked(symbol):
+            self._count_rejection("backoff")
+            raise SymbolBackoffError(f"{symbol} is backing off after failures")
+        if not self.breaker.allow():
+            self._count_rejection("circuit_open")
+            raise CircuitOpenError("Upstream circuit is open")
+        if not self.bucket.acquire(budget_timeout):
+            self._count_rejection("rate_limited")
+            # a probe that never ran must not leave the half-open circuit stuck
+            if self.breaker.state == "half_open":
+                self.breaker.record_failure()
+            raise RateLimitedError("Upstream request budget exhausted")
+
+        with self._lock:
+            self.calls += 1
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._record_failure(symbol, upstream=is_upstream_error(e))
+            self._report(symbol, started, "error")
+            raise
+        if result is None or getattr(result, "empty", False):
+            self._record_failure(symbol, upstream=False)
+            self._report(symbol, started, "empty")
+        else:
+            self.backoff.record_success(symbol)
+            self.breaker.record_success()
+            self._report(symbol, started, "ok")
+        return result
+
+    def _report(self, symbol, started, outcome):
+        if self.on_result is not None:
+            self.on_result(symbol, time.perf_counter() - started, outcome)
+
+    def _record_failure(self, symbol, upstream):
+        with self._lock:
+            self.failures += 1
+        self.backoff.record_failure(symbol)
+        if upstream:
+            self.breaker.record_failure()
+        else:
+            # the upstream answered; this only says something about the symbol
+            self.breaker.record_success()
+
+    def _count_rejection(self, reason):
+        with self._lock:
+            self.rejected[reason] += 1
+
+    def status(self):
+        retry_in = self.breaker.retry_in()
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "times_opened": self.breaker.times_opened,
+            "retry_in": round(retry_in, 1) if retry_in is not None else None,
+            "tokens": round(self.bucket.tokens, 1),
+            "backed_off_symbols": self.backoff.count(),
+            "calls": self.calls,
+            "failures": self.failures,
+            "rejected": dict(self.rejected),
+        }